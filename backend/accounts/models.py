@@ -59,7 +59,7 @@ class User(AbstractUser):
         """
         if self.is_admin():
             return True
-        if self.is_officer() and self.office == office:
+        if self.is_officer() and office is not None and self.office_id == office.pk:
             return True
         return False
 
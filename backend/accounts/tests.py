@@ -1,3 +1,69 @@
-from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+from accounts import urls as account_urls
+from accounts.models import User
+from queue_management.models import Office
+from queue_system.testing import QueryBudgetMixin
+
+
+class AccountsQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Upper bounds on queries per authentication endpoint.
+
+    A failure prints the captured SQL; raise a budget only when the new
+    queries are intentional.
+    """
+
+    # Route name -> maximum queries
+    BUDGETS = {
+        'token_obtain_pair': 3,
+        'register': 2,
+        'current_user': 1,
+        'token_refresh': 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.office = Office.objects.create(name='Accounts Office', code='AC', address='Addr')
+        User.objects.bulk_create([
+            User(username=f'citizen_{i}', role='citizen') for i in range(50)
+        ])
+        cls.officer = User.objects.create_user(
+            username='budget_officer', password='password123', role='officer', office=cls.office
+        )
+
+    def assertWithinBudget(self, route, method, data=None):
+        with self.assertMaxQueries(self.BUDGETS[route]):
+            res = getattr(self.client, method)(reverse(route), data, format='json')
+        self.assertLess(res.status_code, 400, res.data)
+        return res
+
+    def test_every_route_has_a_budget(self):
+        names = {pattern.name for pattern in account_urls.urlpatterns}
+        self.assertEqual(names - set(self.BUDGETS), set())
+
+    def test_login(self):
+        res = self.assertWithinBudget('token_obtain_pair', 'post', {
+            'username': 'budget_officer', 'password': 'password123'
+        })
+        self.assertEqual(res.data['user']['role'], 'officer')
+
+    def test_register(self):
+        res = self.assertWithinBudget('register', 'post', {
+            'username': 'new_citizen', 'password': 'a-Strong-passw0rd'
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_current_user(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.officer).access_token}'
+        )
+        self.assertWithinBudget('current_user', 'get')
+
+    def test_token_refresh(self):
+        self.assertWithinBudget('token_refresh', 'post', {
+            'refresh': str(RefreshToken.for_user(self.officer))
+        })
@@ -0,0 +1,23 @@
+"""
+Gunicorn settings for the queue system.
+
+The app is loaded once in the master (preload_app) and warmed up without
+touching the database, so forked workers share the imported modules, URL
+resolver and serializer mappings. Each worker then opens its database
+connections and primes the service catalog before it accepts requests.
+"""
+import os
+
+# Bind address and worker count keep gunicorn's defaults ($PORT, $WEB_CONCURRENCY)
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+
+def when_ready(server):
+    if preload_app:
+        from queue_system.warmup import warm_up
+        server.log.info('Master warm-up: %s', warm_up(database=False))
+
+
+def post_worker_init(worker):
+    from queue_system.warmup import warm_up
+    worker.log.info('Worker %s warm-up: %s', worker.pid, warm_up())
@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class QueueManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'queue_management'
+
+    def ready(self):
+        from queue_system import metrics, profiling, slow_queries
+        from . import sharding
+        from .models import Office, Service
+
+        connection_created.connect(slow_queries.install, dispatch_uid='slow_query_log')
+        connection_created.connect(metrics.install, dispatch_uid='metrics_query_counter')
+        connection_created.connect(profiling.install, dispatch_uid='profiler_query_log')
+
+        for model in (Office, Service):
+            post_save.connect(sharding.replicate_catalog, sender=model)
+            post_delete.connect(sharding.delete_replicated_catalog, sender=model)
+        post_migrate.connect(sharding.reserve_id_ranges, sender=self)
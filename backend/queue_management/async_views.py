@@ -0,0 +1,144 @@
+"""
+Native async versions of the read-heavy endpoints for the ASGI deployment.
+
+Status polls from citizens and display boards are mostly idle time. Under
+uvicorn these views free the event loop while they wait, so one process can
+hold many slow clients instead of tying up a sync worker per request.
+
+They return exactly the same payloads as their counterparts in views.py and
+are routed in place of them when ASYNC_READ_VIEWS is enabled (see urls.py).
+They honour ?fields= but always answer in JSON.
+"""
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions, status
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from queue_system.renderers import parse_fields, sparse_fields
+from queue_system.routers import replica_reads
+
+from .models import Office
+from .services import QueueService
+from .views import (
+    catalog_etag, office_queue_status_data, queue_status_data, service_data, set_catalog_etag
+)
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    # Use DRF's encoder so dates and decimals match the sync views
+    return JsonResponse(data, status=status_code, safe=False, encoder=JSONEncoder)
+
+
+def _ok(request, data):
+    """Successful response, with the ?fields= selection applied like the sync views."""
+    return _json(sparse_fields(data, parse_fields(request.GET.get('fields'))))
+
+
+async def _authenticate(request):
+    """
+    Authenticate the request with the same JWT backend as the DRF views.
+
+    Returns (user, None) on success or (None, error_response).
+    """
+    authenticator = JWTAuthentication()
+    try:
+        result = await sync_to_async(authenticator.authenticate)(request)
+    except exceptions.AuthenticationFailed as e:
+        return None, _json({'detail': str(e.detail)}, status.HTTP_401_UNAUTHORIZED)
+
+    if result is None:
+        return None, _json(
+            {'detail': 'Authentication credentials were not provided.'},
+            status.HTTP_401_UNAUTHORIZED
+        )
+    return result[0], None
+
+
+@require_GET
+async def queue_status(request, queue_id):
+    """
+    Async version of views.queue_status.
+    """
+    user, error = await _authenticate(request)
+    if error:
+        return error
+
+    try:
+        with replica_reads(user):
+            queue = await QueueService.aget_queue_status(queue_id)
+            wait_time = await queue.aestimated_wait_time()
+    except ValidationError:
+        return _json({'error': 'Queue not found'}, status.HTTP_404_NOT_FOUND)
+
+    # Citizens can only view their own queues, officers only those in their office
+    if user.is_citizen() and queue.owner_id != user.pk:
+        return _json(
+            {'error': 'You can only view your own queues'},
+            status.HTTP_403_FORBIDDEN
+        )
+    if user.is_officer() and queue.service.office_id != user.office_id:
+        return _json(
+            {'error': 'You can only view queues in your office'},
+            status.HTTP_403_FORBIDDEN
+        )
+
+    return _ok(request, queue_status_data(queue, wait_time))
+
+
+@require_GET
+async def service_list(request):
+    """
+    Async version of views.service_list.
+    """
+    user, error = await _authenticate(request)
+    if error:
+        return error
+
+    with replica_reads(user):
+        version = await QueueService.aget_catalog_version()
+        etag = catalog_etag(version, 'json', request.GET.get('fields', ''))
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        services = await QueueService.aget_active_services()
+    return set_catalog_etag(_ok(request, [service_data(service) for service in services]), etag)
+
+
+@require_GET
+async def office_queue_status(request, office_id):
+    """
+    Async version of views.office_queue_status.
+    """
+    user, error = await _authenticate(request)
+    if error:
+        return error
+
+    if not (user.is_officer() or user.is_admin()):
+        return _json(
+            {'detail': 'Only officers and administrators can access this resource.'},
+            status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        office = await Office.objects.aget(id=office_id, is_active=True)
+    except Office.DoesNotExist:
+        return _json({'error': 'Office not found'}, status.HTTP_404_NOT_FOUND)
+
+    if not (user.is_admin() or user.office_id == office.id):
+        return _json(
+            {'error': 'You can only view queues for your assigned office'},
+            status.HTTP_403_FORBIDDEN
+        )
+
+    with replica_reads(user):
+        counts = await QueueService.aget_office_queue_status(office)
+        services = [
+            service async for service in office.services.filter(is_active=True)
+        ]
+
+    return _ok(request, office_queue_status_data(office, services, counts))
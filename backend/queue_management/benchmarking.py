@@ -0,0 +1,121 @@
+"""
+Shared helpers for the load generator and benchmark commands.
+"""
+import math
+import os
+import tempfile
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples):
+    """Count, mean and p50/p95/p99 (milliseconds) for a list of seconds."""
+    values = sorted(samples)
+    count = len(values)
+    return {
+        'count': count,
+        'mean_ms': round(sum(values) / count * 1000, 3) if count else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+    }
+
+
+class LatencyRecorder:
+    """
+    Thread-safe collection of latencies, errors and rejections per operation.
+
+    Errors are failures of the system (5xx, database errors); rejections are
+    requests refused by a business rule (4xx, ValidationError), such as a
+    ticket over the per-citizen limit or a call with nobody waiting.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)
+
+    def record(self, operation, seconds, ok=True, rejected=False):
+        with self._lock:
+            self.latencies[operation].append(seconds)
+            if not ok:
+                self.errors[operation] += 1
+            elif rejected:
+                self.rejected[operation] += 1
+
+    def report(self, wall_seconds):
+        """Per-operation summary with throughput over the whole run."""
+        with self._lock:
+            operations = sorted(self.latencies)
+            return {
+                operation: {
+                    **summarize(self.latencies[operation]),
+                    'errors': self.errors[operation],
+                    'rejected': self.rejected[operation],
+                    'throughput_per_s': round(len(self.latencies[operation]) / wall_seconds, 2)
+                    if wall_seconds else 0.0,
+                }
+                for operation in operations
+            }
+
+
+def format_report(report):
+    """Render a report dict as an aligned text table."""
+    header = (
+        f"{'operation':<28}{'count':>8}{'errors':>8}{'rejected':>10}"
+        f"{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    lines = [header, '-' * len(header)]
+    for operation, row in report.items():
+        lines.append(
+            f"{operation:<28}{row['count']:>8}{row['errors']:>8}{row['rejected']:>10}{row['throughput_per_s']:>10}"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+        )
+    return '\n'.join(lines)
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    """
+    Run the block against a throwaway copy of the configured database.
+
+    Uses Django's test database machinery, so PostgreSQL gets a separate
+    test_<name> database on the same server. SQLite gets a temporary file
+    instead of the in-memory default, so worker threads can share it, and
+    opens its transactions in IMMEDIATE mode.
+    """
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    tmp_path = None
+    if connection.vendor == 'sqlite':
+        if not test_settings.get('NAME'):
+            fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3', prefix='queue_bench_')
+            os.close(fd)
+            test_settings['NAME'] = tmp_path
+        # Take the write lock up front and wait for it, instead of failing
+        # with "database is locked" when concurrent transactions upgrade
+        options = connection.settings_dict.setdefault('OPTIONS', {})
+        options.setdefault('transaction_mode', 'IMMEDIATE')
+        options.setdefault('timeout', 30)
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        if tmp_path:
+            test_settings.pop('NAME', None)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,177 @@
+import json
+import platform
+import subprocess
+import time
+from datetime import timedelta
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from queue_management.benchmarking import scratch_database, summarize
+from queue_management.models import Office, Queue, Service
+from queue_management.services import QueueService
+
+OPERATIONS = [
+    'create_queue',
+    'call_next_queue',
+    'start_service',
+    'complete_service',
+    'estimated_wait_time',
+    'get_service_queue_status',
+]
+
+
+class Command(BaseCommand):
+    """
+    Microbenchmark QueueService operations at different Queue table sizes.
+
+    Each size is seeded with mostly historical (closed) tickets spread over
+    the past year plus a fixed set of today's tickets, so growing the table
+    shows which operations scale with total history rather than with the
+    live queue. Results are written as JSON for comparison across commits.
+    """
+    help = "Benchmark QueueService operations with 1k/100k/1M Queue rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,100000,1000000',
+                            help="Comma-separated Queue table sizes to benchmark")
+        parser.add_argument('--services', type=int, default=10, help="Services the rows are spread over")
+        parser.add_argument('--today-per-service', type=int, default=200,
+                            help="Tickets per service created today (the live queue)")
+        parser.add_argument('--repeat', type=int, default=100, help="Measured iterations per operation")
+        parser.add_argument('--output', default='queue_service_benchmark.json', help="JSON results file")
+        parser.add_argument('--compare', help="Previous results file to compare p50 latencies against")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        today_rows = options['services'] * options['today_per_service']
+        if min(sizes) < today_rows:
+            raise CommandError(f"Every size must be at least {today_rows} (services x today-per-service)")
+
+        results = {}
+        with scratch_database():
+            meta = self.metadata(options)
+            for size in sizes:
+                self.stdout.write(f"Seeding {size} Queue rows...")
+                services = self.seed(size, options)
+                results[str(size)] = self.run(services, options['repeat'])
+                self.print_results(size, results[str(size)])
+
+        report = {'meta': meta, 'results': results}
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def metadata(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'services': options['services'],
+            'today_per_service': options['today_per_service'],
+            'repeat': options['repeat'],
+        }
+
+    def seed(self, size, options, batch_size=5000):
+        """Reset the tables and create `size` Queue rows."""
+        Queue.objects.all().delete()
+        Service.objects.all().delete()
+        Office.objects.all().delete()
+
+        office = Office.objects.create(name='Benchmark Office', code='BENCH', address='Benchmark')
+        services = Service.objects.bulk_create([
+            Service(name=f'Benchmark {i}', code=f'BENCH_{i}', service_type='other', office=office)
+            for i in range(options['services'])
+        ])
+
+        # History: closed tickets spread over the past year, one batch per day
+        history = size - len(services) * options['today_per_service']
+        now = timezone.now()
+        days = 365
+        per_day = history // days
+        extra = history % days
+        for day in range(1, days + 1):
+            count = per_day + (1 if day <= extra else 0)
+            for start in range(0, count, batch_size):
+                created = Queue.objects.bulk_create([
+                    Queue(
+                        citizen_name='History', service=services[n % len(services)],
+                        number=n // len(services) + 1, status='completed',
+                        service_day=office.local_date(now - timedelta(days=day))
+                    )
+                    for n in range(start, min(start + batch_size, count))
+                ])
+                # created_at is auto_now_add, so backdate after inserting
+                Queue.objects.filter(pk__in=[q.pk for q in created]).update(
+                    created_at=now - timedelta(days=day)
+                )
+
+        # Today: the live queue, all waiting
+        Queue.objects.bulk_create([
+            Queue(
+                citizen_name='Today', service=service, number=n + 1, status='waiting',
+                service_day=office.local_date(now)
+            )
+            for service in services for n in range(options['today_per_service'])
+        ])
+        return services
+
+    def run(self, services, repeat):
+        timings = {operation: [] for operation in OPERATIONS}
+
+        def timed(operation, func, *args):
+            start = time.perf_counter()
+            result = func(*args)
+            timings[operation].append(time.perf_counter() - start)
+            return result
+
+        for i in range(repeat):
+            service = services[i % len(services)]
+
+            timed('create_queue', QueueService.create_queue, 'Benchmark', service.id)
+            queue = timed('call_next_queue', QueueService.call_next_queue, 'Officer', service.id)
+            timed('start_service', QueueService.start_service, queue.id, 'Officer')
+            timed('complete_service', QueueService.complete_service, queue.id)
+
+            # The last ticket in line has the whole live queue ahead of it
+            last = Queue.objects.filter(service=service, status='waiting').order_by('-created_at').first()
+            timed('estimated_wait_time', lambda: last.estimated_wait_time)
+            timed('get_service_queue_status', lambda: list(QueueService.get_service_queue_status(service.id)))
+
+        return {operation: summarize(samples) for operation, samples in timings.items()}
+
+    def print_results(self, size, results):
+        self.stdout.write(f"\n{size} rows")
+        self.stdout.write(f"{'operation':<28}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for operation, row in results.items():
+            self.stdout.write(
+                f"{operation:<28}{row['mean_ms']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            )
+        self.stdout.write('')
+
+    def compare(self, path, results):
+        """Print p50 ratios against a previous run (>1.0 means slower now)."""
+        with open(path) as f:
+            previous = json.load(f)
+        self.stdout.write(f"Compared with {path} (commit {previous['meta'].get('commit')}):")
+        for size, operations in results.items():
+            before = previous['results'].get(size)
+            if not before:
+                continue
+            for operation, row in operations.items():
+                old = before.get(operation, {}).get('p50_ms')
+                if old:
+                    self.stdout.write(f"  {size:>8} {operation:<28} p50 x{row['p50_ms'] / old:.2f}")
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from queue_management.models import Office
+from queue_management.services import QueueService
+
+
+class Command(BaseCommand):
+    """
+    Close waiting/called tickets left over from previous service days.
+
+    Safe to run at any time and to re-run: each office is closed up to its
+    own local midnight, and already closed tickets are not counted again.
+    """
+    help = "Cancel or expire active tickets from previous days, per office"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--office',
+            action='append',
+            dest='offices',
+            help="Office code to close (repeatable, default: all offices)"
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help="Maximum tickets updated per batch (default: DAY_CLOSE_BATCH_SIZE)"
+        )
+
+    def handle(self, *args, **options):
+        offices = Office.objects.all()
+        if options['offices']:
+            codes = [code.upper() for code in options['offices']]
+            offices = offices.filter(code__in=codes)
+            missing = set(codes) - set(offices.values_list('code', flat=True))
+            if missing:
+                raise CommandError(f"Unknown office code(s): {', '.join(sorted(missing))}")
+
+        for office in offices:
+            totals = QueueService.close_service_day(office, batch_size=options['batch_size'])
+            self.stdout.write(
+                f"{office.code}: cancelled {totals['cancelled']}, no-show {totals['no_show']}"
+            )
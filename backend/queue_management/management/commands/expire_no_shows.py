@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from queue_management.services import QueueService
+
+
+class Command(BaseCommand):
+    """
+    Mark called citizens who missed their response window as no-show.
+
+    Run once from cron, or keep it running as a worker process with --interval.
+    """
+    help = "Expire called queues whose response window has passed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help="Maximum tickets updated per batch (default: NO_SHOW_SWEEP_BATCH_SIZE)"
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help="Seconds between sweeps; 0 runs a single sweep and exits"
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+
+        while True:
+            expired = QueueService.expire_overdue_calls(batch_size=options['batch_size'])
+            self.stdout.write(f"Marked {expired} queue(s) as no-show")
+
+            if not interval:
+                break
+            time.sleep(interval)
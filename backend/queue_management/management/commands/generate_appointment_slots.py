@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from queue_management.models import Office
+from queue_management.services import QueueService
+
+
+class Command(BaseCommand):
+    """
+    Create bookable appointment slots from the offices' slot templates.
+
+    Run daily (e.g. from cron after close_service_day) so slots always reach
+    APPOINTMENT_BOOKING_DAYS ahead. Safe to re-run: existing slots and their
+    bookings are kept.
+    """
+    help = "Generate appointment slots from slot templates, per office"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--office',
+            action='append',
+            dest='offices',
+            help="Office code to generate slots for (repeatable, default: all active offices)"
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help="Days ahead, including today (default: APPOINTMENT_BOOKING_DAYS)"
+        )
+
+    def handle(self, *args, **options):
+        offices = Office.objects.filter(is_active=True)
+        if options['offices']:
+            codes = [code.upper() for code in options['offices']]
+            offices = offices.filter(code__in=codes)
+            missing = set(codes) - set(offices.values_list('code', flat=True))
+            if missing:
+                raise CommandError(f"Unknown office code(s): {', '.join(sorted(missing))}")
+
+        for office in offices:
+            slots = QueueService.generate_appointment_slots(office, days=options['days'])
+            self.stdout.write(f"{office.code}: {slots} slots")
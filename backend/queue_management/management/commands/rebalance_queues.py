@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from queue_management.models import Office
+from queue_management.services import QueueService
+
+
+class Command(BaseCommand):
+    """
+    Even out waits between services of the same type at each office.
+
+    Prints the suggested transfers; with --apply it also makes them. Run
+    once, or keep it running with --interval during opening hours.
+    """
+    help = "Suggest or apply ticket transfers between overloaded and idle services"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--office',
+            action='append',
+            dest='offices',
+            help="Office code to rebalance (repeatable, default: all active offices)"
+        )
+        parser.add_argument('--apply', action='store_true', help="Move the tickets instead of only suggesting")
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help="Seconds between rounds; 0 runs once and exits"
+        )
+
+    def handle(self, *args, **options):
+        offices = Office.objects.filter(is_active=True)
+        if options['offices']:
+            codes = [code.upper() for code in options['offices']]
+            offices = offices.filter(code__in=codes)
+            missing = set(codes) - set(offices.values_list('code', flat=True))
+            if missing:
+                raise CommandError(f"Unknown office code(s): {', '.join(sorted(missing))}")
+
+        while True:
+            for office in offices:
+                for move in QueueService.rebalance_office(office, apply=options['apply']):
+                    self.stdout.write(
+                        f"{office.code}: {move['from_service']} ({move['from_wait_minutes']} min) -> "
+                        f"{move['to_service']} ({move['to_wait_minutes']} min): "
+                        f"{move.get('moved', move['count'])} tickets"
+                        + ("" if options['apply'] else " (suggested)")
+                    )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
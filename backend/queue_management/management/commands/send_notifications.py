@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from queue_management.notifications import dispatch_batch, get_gateway
+from queue_management.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    """
+    Send queued SMS notifications.
+
+    Worker threads claim and send batches until the outbox is drained. Run
+    once from cron, or keep it running as a worker process with --interval.
+    Several processes can run side by side; they never claim the same
+    message.
+    """
+    help = "Send pending SMS notifications from the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Sending threads")
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help="Messages per gateway call (default: SMS_BATCH_SIZE)"
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help="Seconds between rounds; 0 drains the outbox once and exits"
+        )
+
+    def handle(self, *args, **options):
+        gateway = get_gateway()
+
+        def drain(shard):
+            sent = 0
+            try:
+                while True:
+                    claimed = dispatch_batch(shard, options['batch_size'], gateway)
+                    if not claimed:
+                        return sent
+                    sent += claimed
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                # Every worker drains a shard; shards are shared round-robin
+                shards = shard_aliases()
+                jobs = [shards[i % len(shards)] for i in range(max(options['workers'], len(shards)))]
+                processed = sum(pool.map(drain, jobs))
+                if processed:
+                    self.stdout.write(f"Processed {processed} notifications")
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
@@ -0,0 +1,302 @@
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from queue_management.benchmarking import LatencyRecorder, format_report, scratch_database
+from queue_management.models import Office, Queue, Service
+from queue_management.services import QueueService
+
+
+class ServiceLayerDriver:
+    """Runs each operation directly through QueueService."""
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def _timed(self, operation, func, *args, **kwargs):
+        # Business rule rejections (e.g. nobody waiting) are reported apart
+        # from database failures, which count as errors
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except ValidationError:
+            self.recorder.record(operation, time.perf_counter() - start, rejected=True)
+            return None
+        except DatabaseError:
+            self.recorder.record(operation, time.perf_counter() - start, ok=False)
+            return None
+        self.recorder.record(operation, time.perf_counter() - start)
+        return result
+
+    def create_queue(self, citizen, name, service):
+        queue = self._timed('create_queue', QueueService.create_queue, name, service.id, owner=citizen)
+        return queue.id if queue else None
+
+    def queue_status(self, citizen, queue_id):
+        def status(queue_id):
+            queue = QueueService.get_queue_status(queue_id)
+            return queue.estimated_wait_time
+        self._timed('queue_status', status, queue_id)
+
+    def call_next(self, officer, service):
+        queue = self._timed('call_next_queue', QueueService.call_next_queue, officer.username, service.id)
+        return queue.id if queue else None
+
+    def start(self, officer, queue_id):
+        self._timed('start_service', QueueService.start_service, queue_id, officer.username)
+
+    def complete(self, officer, queue_id):
+        self._timed('complete_service', QueueService.complete_service, queue_id)
+
+    def no_show(self, officer, queue_id):
+        self._timed('mark_no_show', QueueService.mark_no_show, queue_id)
+
+
+class ApiDriver:
+    """
+    Runs each operation as an HTTP request through the full Django stack
+    (middleware, URL routing, JWT authentication, DRF views) in-process.
+    """
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self._local = threading.local()
+
+    def _client(self, user):
+        clients = getattr(self._local, 'clients', None)
+        if clients is None:
+            clients = self._local.clients = {}
+        if user.pk not in clients:
+            # Server errors are counted in the report instead of aborting the run
+            clients[user.pk] = Client(
+                raise_request_exception=False,
+                HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}'
+            )
+        return clients[user.pk]
+
+    def _request(self, operation, user, method, url, data=None):
+        start = time.perf_counter()
+        response = getattr(self._client(user), method)(url, data, content_type='application/json')
+        # 4xx responses (e.g. nobody waiting) are reported as rejections;
+        # only server errors count as errors
+        self.recorder.record(
+            operation, time.perf_counter() - start,
+            ok=response.status_code < 500, rejected=400 <= response.status_code < 500
+        )
+        return response.json() if response.status_code < 400 else None
+
+    def create_queue(self, citizen, name, service):
+        data = self._request('create-queue', citizen, 'post', reverse('create-queue'), {
+            'citizen_name': name, 'service_id': service.id
+        })
+        return data['queue_id'] if data else None
+
+    def queue_status(self, citizen, queue_id):
+        self._request('queue-status', citizen, 'get', reverse('queue-status', args=[queue_id]))
+
+    def call_next(self, officer, service):
+        data = self._request('call-next-queue', officer, 'post', reverse('call-next-queue'), {
+            'service_id': service.id
+        })
+        return data['queue_id'] if data else None
+
+    def start(self, officer, queue_id):
+        self._request('start-service', officer, 'post', reverse('start-service', args=[queue_id]))
+
+    def complete(self, officer, queue_id):
+        self._request('complete-service', officer, 'post', reverse('complete-service', args=[queue_id]))
+
+    def no_show(self, officer, queue_id):
+        self._request('mark-no-show', officer, 'post', reverse('mark-no-show', args=[queue_id]))
+
+
+class Command(BaseCommand):
+    """
+    Simulate a full office day to measure how much load one deployment takes.
+
+    Citizens arrive per service, take a ticket and poll its status; officer
+    desks call, serve and complete citizens (or mark a share of them as
+    no-show) until every arrival has been handled. The report shows
+    throughput and p50/p95/p99 latency per operation.
+
+    By default the simulation runs in a throwaway copy of the configured
+    database (SQLite or PostgreSQL); --in-place uses the real one.
+    """
+    help = "Simulate an office day against the API or QueueService and report latencies"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['api', 'service'], default='api',
+                            help="Drive the HTTP API in-process or call QueueService directly")
+        parser.add_argument('--services', type=int, default=4, help="Services in the simulated office")
+        parser.add_argument('--arrivals-per-service', type=int, default=200, help="Citizens per service")
+        parser.add_argument('--officers-per-service', type=int, default=2, help="Officer desks per service")
+        parser.add_argument('--polls-per-citizen', type=int, default=3,
+                            help="Status polls each citizen makes after taking a ticket")
+        parser.add_argument('--no-show-rate', type=float, default=0.1,
+                            help="Share of called citizens who never show up (0-1)")
+        parser.add_argument('--service-ms', type=int, default=0,
+                            help="Simulated time an officer spends serving a citizen")
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help="Worker threads for citizen traffic (officer desks get their own)")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for reproducible runs")
+        parser.add_argument('--in-place', action='store_true',
+                            help="Use the configured database instead of a scratch copy")
+        parser.add_argument('--json', dest='json_path', help="Also write the report to this JSON file")
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'api':
+            # The in-process client talks to the 'testserver' host
+            setup_test_environment()
+        # Expected 4xx responses would otherwise flood the console
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        if options['in_place']:
+            report = self.simulate(options)
+        else:
+            with scratch_database():
+                report = self.simulate(options)
+
+        self.stdout.write(format_report(report['operations']))
+        self.stdout.write('')
+        for key, value in report['summary'].items():
+            self.stdout.write(f'{key}: {value}')
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['json_path']}")
+
+    def simulate(self, options):
+        rng = random.Random(options['seed'])
+        recorder = LatencyRecorder()
+        driver = ApiDriver(recorder) if options['mode'] == 'api' else ServiceLayerDriver(recorder)
+
+        office, services, citizens, desks = self.seed(options)
+        arrivals_done = threading.Event()
+        no_show_rate = options['no_show_rate']
+        service_seconds = options['service_ms'] / 1000
+
+        # Arrivals alternate between services, as walk-ins would; each is a
+        # different citizen, so the per-citizen ticket limit never applies
+        arrivals = []
+        for n in range(options['arrivals_per_service']):
+            for service in services:
+                arrivals.append((citizens[len(arrivals)], service, f'Citizen {service.code}-{n}'))
+        no_shows = {n for n in range(len(arrivals)) if rng.random() < no_show_rate}
+        call_counter = iter(range(10 ** 9))
+        counter_lock = threading.Lock()
+
+        def citizen_visit(citizen, service, name):
+            try:
+                queue_id = driver.create_queue(citizen, name, service)
+                if queue_id:
+                    for _ in range(options['polls_per_citizen']):
+                        driver.queue_status(citizen, queue_id)
+            finally:
+                close_old_connections()
+
+        def officer_desk(officer, service):
+            try:
+                while True:
+                    queue_id = driver.call_next(officer, service)
+                    if queue_id is None:
+                        if arrivals_done.is_set() and not Queue.objects.filter(
+                            service=service, status='waiting'
+                        ).exists():
+                            return
+                        time.sleep(0.005)
+                        continue
+
+                    with counter_lock:
+                        call_number = next(call_counter)
+                    if call_number in no_shows:
+                        driver.no_show(officer, queue_id)
+                        continue
+
+                    driver.start(officer, queue_id)
+                    if service_seconds:
+                        time.sleep(service_seconds)
+                    driver.complete(officer, queue_id)
+            finally:
+                close_old_connections()
+
+        started = time.perf_counter()
+        desk_threads = [
+            threading.Thread(target=officer_desk, args=(officer, service), daemon=True)
+            for officer, service in desks
+        ]
+        for thread in desk_threads:
+            thread.start()
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for future in [pool.submit(citizen_visit, *arrival) for arrival in arrivals]:
+                future.result()
+        arrivals_done.set()
+
+        for thread in desk_threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        outcome = dict(
+            Queue.objects.filter(service__office=office).values_list('status').annotate(
+                count=Count('id')
+            ).order_by()
+        )
+        created = sum(outcome.values())
+        return {
+            'operations': recorder.report(wall),
+            'summary': {
+                'mode': options['mode'],
+                'wall_seconds': round(wall, 3),
+                'arrivals': len(arrivals),
+                'tickets_created': created,
+                'creates_rejected': len(arrivals) - created,
+                'officer_desks': len(desks),
+                'concurrency': options['concurrency'],
+                'tickets_by_status': outcome,
+                'tickets_per_second': round(created / wall, 2) if wall else 0.0,
+            },
+        }
+
+    def seed(self, options):
+        """Create the simulated office, its services, citizens and officers."""
+        office, _ = Office.objects.get_or_create(
+            code='SIM', defaults={'name': 'Simulation Office', 'address': 'Simulated'}
+        )
+        services = [
+            Service.objects.get_or_create(
+                code=f'SIM_{i}',
+                defaults={'name': f'Simulated Service {i}', 'service_type': 'other', 'office': office}
+            )[0]
+            for i in range(options['services'])
+        ]
+        # One citizen per arrival
+        usernames = [f'sim_citizen_{i}' for i in range(options['services'] * options['arrivals_per_service'])]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=username, role='citizen') for username in usernames if username not in existing
+        ])
+        by_name = User.objects.in_bulk(usernames, field_name='username')
+        citizens = [by_name[username] for username in usernames]
+        desks = []
+        for service in services:
+            for j in range(options['officers_per_service']):
+                officer, _ = User.objects.get_or_create(
+                    username=f'sim_officer_{service.code}_{j}',
+                    defaults={'role': 'officer', 'office': office}
+                )
+                desks.append((officer, service))
+        return office, services, citizens, desks
@@ -0,0 +1,64 @@
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+CHILD = 'from queue_system.warmup import measure_startup; measure_startup({warm}, {path!r})'
+
+
+class Command(BaseCommand):
+    """
+    Measure worker cold-start cost with and without warm-up.
+
+    Each run starts a fresh interpreter that imports the project, optionally
+    runs queue_system.warmup.warm_up(), then sends the same authenticated GET
+    twice. The gap between the first and second request is the lazy
+    initialization a new worker pays; with warm-up it should mostly move
+    into the warm-up step, before the worker accepts traffic.
+    """
+    help = "Measure import time and first vs. second request latency, cold and warmed up"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per mode")
+        parser.add_argument('--path', default='/api/services/', help="Endpoint to request")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        results = {}
+        for mode, warm in (('cold', False), ('warm', True)):
+            runs = [self.run_child(warm, options['path']) for _ in range(options['runs'])]
+            results[mode] = {
+                'import_ms': statistics.median(run['import_ms'] for run in runs),
+                'warm_up_ms': statistics.median(
+                    sum(run.get('warm_up_ms', {}).values()) for run in runs
+                ),
+                'first_request_ms': statistics.median(run['first_request_ms'] for run in runs),
+                'second_request_ms': statistics.median(run['second_request_ms'] for run in runs),
+                'statuses': sorted({run['first_status'] for run in runs}),
+            }
+
+        self.stdout.write(f"Medians over {options['runs']} runs of GET {options['path']}")
+        self.stdout.write(f"{'mode':<8}{'import ms':>12}{'warm-up ms':>12}{'1st req ms':>12}{'2nd req ms':>12}")
+        for mode, row in results.items():
+            self.stdout.write(
+                f"{mode:<8}{row['import_ms']:>12.1f}{row['warm_up_ms']:>12.1f}"
+                f"{row['first_request_ms']:>12.1f}{row['second_request_ms']:>12.1f}"
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['json_path']}")
+
+    def run_child(self, warm, path):
+        proc = subprocess.run(
+            [sys.executable, '-c', CHILD.format(warm=warm, path=path)],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise CommandError(f"Startup run failed:\n{proc.stderr}")
+        # Settings or logging may print first; the result is the last line
+        return json.loads(proc.stdout.strip().splitlines()[-1])
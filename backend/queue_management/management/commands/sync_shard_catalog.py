@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from queue_management.sharding import is_sharded, sync_catalog
+
+
+class Command(BaseCommand):
+    """
+    Copy all offices and services from the default database to every shard.
+
+    Saving an office or service replicates it automatically; run this after
+    adding a shard or after bulk imports that skip model signals.
+    """
+    help = "Copy the office/service catalog to every queue shard"
+
+    def handle(self, *args, **options):
+        if not is_sharded():
+            raise CommandError("QUEUE_SHARDS is not configured")
+        sync_catalog()
+        self.stdout.write(self.style.SUCCESS("Catalog copied to all shards"))
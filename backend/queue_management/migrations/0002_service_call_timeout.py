@@ -0,0 +1,22 @@
+# Generated by Django 5.2.10 on 2026-10-19 14:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='call_timeout',
+            field=models.PositiveIntegerField(default=5, help_text='Minutes a called citizen has to respond before being marked as no-show'),
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(fields=['status', 'called_at'], name='queue_manag_status_9676dc_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.10 on 2026-10-19 14:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_management', '0002_service_call_timeout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='office',
+            name='timezone',
+            field=models.CharField(default='Africa/Addis_Ababa', help_text="IANA timezone the office operates in (e.g., 'Africa/Addis_Ababa')", max_length=64),
+        ),
+        migrations.CreateModel(
+            name='ServiceDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text="Service day in the office's local time")),
+                ('cancelled_at_close', models.PositiveIntegerField(default=0, help_text='Waiting tickets cancelled by the end-of-day rollover')),
+                ('no_show_at_close', models.PositiveIntegerField(default=0, help_text='Called tickets marked as no-show by the end-of-day rollover')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='queue_management.service')),
+            ],
+            options={
+                'verbose_name': 'Service Daily Stats',
+                'verbose_name_plural': 'Service Daily Stats',
+                'ordering': ['-day'],
+                'unique_together': {('service', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.10 on 2026-10-19 14:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_management', '0003_office_timezone_service_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueEventSequence',
+            fields=[
+                ('office', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='event_sequence', serialize=False, to='queue_management.office')),
+                ('last_sequence', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QueueEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveBigIntegerField(help_text="Position in the office's event stream")),
+                ('previous_status', models.CharField(blank=True, help_text='Status before the change (empty when the ticket was created)', max_length=20)),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('called', 'Called'), ('serving', 'Serving'), ('completed', 'Completed'), ('no_show', 'No Show'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('office', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queue_events', to='queue_management.office')),
+                ('queue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='queue_management.queue')),
+            ],
+            options={
+                'ordering': ['office', 'sequence'],
+                'constraints': [models.UniqueConstraint(fields=('office', 'sequence'), name='unique_office_event_sequence')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.10 on 2026-10-19 14:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_management', '0005_notifications'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queue',
+            name='owner',
+            field=models.ForeignKey(blank=True, db_constraint=False, help_text='Citizen account that took the ticket', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='queues', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(condition=models.Q(('status__in', ['waiting', 'called', 'serving'])), fields=['owner', 'status'], name='queue_owner_active_idx'),
+        ),
+    ]
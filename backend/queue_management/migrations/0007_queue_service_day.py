@@ -0,0 +1,53 @@
+from datetime import timezone
+
+from django.db import migrations, models, transaction
+from django.db.models.functions import TruncDate
+
+# Rows updated per transaction; small enough not to hold locks for long
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_service_day(apps, schema_editor):
+    """
+    Fill service_day from created_at for existing tickets.
+
+    Until now tickets were numbered per UTC date (created_at__date with
+    TIME_ZONE = 'UTC'), so existing rows get their UTC date: that is the day
+    their number is unique in. Using the office-local date would merge
+    tickets from both sides of local midnight into one day with repeated
+    numbers. New tickets get the office-local day from QueueService.
+
+    Runs in batches of BACKFILL_BATCH_SIZE, each in its own transaction, so
+    large tables are not locked for the whole backfill and an interrupted
+    run can simply be restarted.
+    """
+    Queue = apps.get_model('queue_management', 'Queue')
+    db_alias = schema_editor.connection.alias
+
+    pending = Queue.objects.using(db_alias).filter(service_day__isnull=True)
+    while True:
+        with transaction.atomic(using=db_alias):
+            batch = list(pending.order_by('id').values_list('id', flat=True)[:BACKFILL_BATCH_SIZE])
+            Queue.objects.using(db_alias).filter(id__in=batch).update(
+                service_day=TruncDate('created_at', tzinfo=timezone.utc)
+            )
+        if len(batch) < BACKFILL_BATCH_SIZE:
+            break
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('queue_management', '0006_queue_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queue',
+            name='service_day',
+            field=models.DateField(null=True, help_text="Day the ticket was issued, in the office's local time"),
+        ),
+        migrations.RunPython(backfill_service_day, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.10 on 2026-10-19 14:55
+
+from django.db import migrations, models
+
+
+def renumber_duplicate_day_numbers(apps, schema_editor):
+    """
+    Give tickets that share a number on the same service day a new number.
+
+    Legacy numbering was not enforced by the database, so concurrent issues
+    could repeat a number. The oldest ticket keeps it; the others get the
+    next free numbers of their day, so the unique constraint can be added.
+    """
+    Queue = apps.get_model('queue_management', 'Queue')
+    tickets = Queue.objects.using(schema_editor.connection.alias)
+
+    duplicates = tickets.values('service_id', 'service_day', 'number').annotate(
+        copies=models.Count('id')
+    ).filter(copies__gt=1).order_by()
+    for group in duplicates:
+        day = tickets.filter(service_id=group['service_id'], service_day=group['service_day'])
+        last_number = day.aggregate(models.Max('number'))['number__max']
+        extra = day.filter(number=group['number']).order_by('created_at', 'id').values_list('id', flat=True)[1:]
+        for offset, queue_id in enumerate(list(extra), start=1):
+            tickets.filter(id=queue_id).update(number=last_number + offset)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_management', '0007_queue_service_day'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='queue',
+            name='service_day',
+            field=models.DateField(help_text="Day the ticket was issued, in the office's local time"),
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(condition=models.Q(('status', 'waiting')), fields=['service', 'created_at'], name='queue_waiting_line_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(condition=models.Q(('status', 'called')), fields=['service', 'created_at'], name='queue_called_line_idx'),
+        ),
+        migrations.RunPython(renumber_duplicate_day_numbers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='queue',
+            constraint=models.UniqueConstraint(fields=('service', 'service_day', 'number'), name='unique_service_day_number'),
+        ),
+        # Replaced by the partial indexes and the unique constraint above
+        migrations.RemoveIndex(
+            model_name='queue',
+            name='queue_manag_service_c3b57b_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='queue',
+            name='queue_manag_service_e78f88_idx',
+        ),
+    ]
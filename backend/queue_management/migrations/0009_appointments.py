@@ -0,0 +1,90 @@
+# Generated by Django 5.2.10 on 2026-10-19 14:58
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+# Rows updated per transaction; small enough not to hold locks for long
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_queued_at(apps, schema_editor):
+    """Existing tickets joined the line when they were issued."""
+    Queue = apps.get_model('queue_management', 'Queue')
+    db_alias = schema_editor.connection.alias
+
+    pending = Queue.objects.using(db_alias).filter(queued_at__isnull=True)
+    while True:
+        with transaction.atomic(using=db_alias):
+            batch = list(pending.order_by('id').values_list('id', flat=True)[:BACKFILL_BATCH_SIZE])
+            Queue.objects.using(db_alias).filter(id__in=batch).update(queued_at=models.F('created_at'))
+        if len(batch) < BACKFILL_BATCH_SIZE:
+            break
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('queue_management', '0008_service_day_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('capacity', models.PositiveIntegerField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['service', 'start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SlotTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField(help_text='First slot starts at this local time')),
+                ('end_time', models.TimeField(help_text='Last slot ends at or before this local time')),
+                ('slot_minutes', models.PositiveIntegerField(default=30, help_text='Length of each slot in minutes')),
+                ('counters', models.PositiveIntegerField(default=1, help_text='Counters serving appointments for this service during these hours')),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['service', 'weekday', 'start_time'],
+            },
+        ),
+        migrations.AddField(
+            model_name='queue',
+            name='queued_at',
+            field=models.DateTimeField(null=True, help_text='When the ticket joins the line: issue time for walk-ins, slot start for appointments'),
+        ),
+        migrations.AddField(
+            model_name='appointmentslot',
+            name='service',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_slots', to='queue_management.service'),
+        ),
+        migrations.AddField(
+            model_name='queue',
+            name='appointment_slot',
+            field=models.ForeignKey(blank=True, help_text='Slot this ticket was booked for (empty for walk-ins)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='queues', to='queue_management.appointmentslot'),
+        ),
+        migrations.AddField(
+            model_name='slottemplate',
+            name='service',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_templates', to='queue_management.service'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentslot',
+            constraint=models.UniqueConstraint(fields=('service', 'start'), name='unique_service_slot_start'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentslot',
+            constraint=models.CheckConstraint(condition=models.Q(('booked__lte', models.F('capacity'))), name='slot_not_overbooked'),
+        ),
+        migrations.RunPython(backfill_queued_at, migrations.RunPython.noop),
+    ]
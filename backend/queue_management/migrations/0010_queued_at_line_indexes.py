@@ -0,0 +1,38 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_management', '0009_appointments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='queue',
+            name='queued_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the ticket joins the line: issue time for walk-ins, slot start for appointments'),
+        ),
+        migrations.AlterModelOptions(
+            name='queue',
+            options={'ordering': ['queued_at']},
+        ),
+        # The line is now ordered by queued_at instead of created_at
+        migrations.RemoveIndex(
+            model_name='queue',
+            name='queue_waiting_line_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='queue',
+            name='queue_called_line_idx',
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(condition=models.Q(('status', 'waiting')), fields=['service', 'queued_at'], name='queue_waiting_line_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(condition=models.Q(('status', 'called')), fields=['service', 'queued_at'], name='queue_called_line_idx'),
+        ),
+    ]
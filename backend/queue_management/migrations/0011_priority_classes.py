@@ -0,0 +1,43 @@
+# Generated by Django 5.2.10 on 2026-10-19 15:02
+
+from django.db import migrations, models, transaction
+
+# Rows updated per transaction; small enough not to hold locks for long
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_call_order(apps, schema_editor):
+    """Existing tickets are all standard, so they keep their queued_at order."""
+    Queue = apps.get_model('queue_management', 'Queue')
+    db_alias = schema_editor.connection.alias
+
+    pending = Queue.objects.using(db_alias).filter(call_order__isnull=True)
+    while True:
+        with transaction.atomic(using=db_alias):
+            batch = list(pending.order_by('id').values_list('id', flat=True)[:BACKFILL_BATCH_SIZE])
+            Queue.objects.using(db_alias).filter(id__in=batch).update(call_order=models.F('queued_at'))
+        if len(batch) < BACKFILL_BATCH_SIZE:
+            break
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('queue_management', '0010_queued_at_line_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queue',
+            name='priority_class',
+            field=models.CharField(choices=[('standard', 'Standard'), ('elderly', 'Elderly'), ('disability', 'Disability'), ('pregnancy', 'Pregnancy')], default='standard', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='queue',
+            name='call_order',
+            field=models.DateTimeField(null=True, help_text='Position in the line: queued_at moved earlier by the priority class boost'),
+        ),
+        migrations.RunPython(backfill_call_order, migrations.RunPython.noop),
+    ]
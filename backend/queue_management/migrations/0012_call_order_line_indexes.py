@@ -0,0 +1,38 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_management', '0011_priority_classes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='queue',
+            name='call_order',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Position in the line: queued_at moved earlier by the priority class boost'),
+        ),
+        migrations.AlterModelOptions(
+            name='queue',
+            options={'ordering': ['call_order']},
+        ),
+        # The line is now ordered by call_order instead of queued_at
+        migrations.RemoveIndex(
+            model_name='queue',
+            name='queue_waiting_line_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='queue',
+            name='queue_called_line_idx',
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(condition=models.Q(('status', 'waiting')), fields=['service', 'call_order'], name='queue_waiting_line_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(condition=models.Q(('status', 'called')), fields=['service', 'call_order'], name='queue_called_line_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queue_management', '0012_call_order_line_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='kind',
+            field=models.CharField(help_text="'called', 'ahead_<n>' for 'you are n away', or 'transfer_<service>_<number>'", max_length=40),
+        ),
+    ]
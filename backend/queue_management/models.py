@@ -1,4 +1,10 @@
+import calendar
+from datetime import datetime, time
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 class Office(models.Model):
@@ -28,6 +34,11 @@ class Office(models.Model):
         default=True,
         help_text="Whether this office is currently operational"
     )
+    timezone = models.CharField(
+        max_length=64,
+        default='Africa/Addis_Ababa',
+        help_text="IANA timezone the office operates in (e.g., 'Africa/Addis_Ababa')"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -39,6 +50,19 @@ class Office(models.Model):
     def __str__(self):
         return f"{self.name} ({self.code})"
 
+    @property
+    def tzinfo(self):
+        """Timezone object for the office's local time"""
+        return ZoneInfo(self.timezone)
+
+    def local_date(self, when=None):
+        """Calendar date in the office's timezone (today by default)"""
+        return timezone.localtime(when or timezone.now(), self.tzinfo).date()
+
+    def day_start(self, day):
+        """Aware datetime for local midnight at the start of the given day"""
+        return datetime.combine(day, time.min, tzinfo=self.tzinfo)
+
 
 class Service(models.Model):
     """
@@ -90,6 +114,10 @@ class Service(models.Model):
         default=1,
         help_text="Priority level (lower numbers = higher priority)"
     )
+    call_timeout = models.PositiveIntegerField(
+        default=5,
+        help_text="Minutes a called citizen has to respond before being marked as no-show"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -103,6 +131,14 @@ class Service(models.Model):
         return f"{self.name} - {self.office.name}"
 
 
+# Statuses of a ticket that is still in line or at the counter
+ACTIVE_STATUSES = ['waiting', 'called', 'serving']
+
+# Tickets still in line. Written as an OR rather than status IN (...) so that
+# each branch can use its partial index (queue_waiting_line_idx, queue_called_line_idx)
+LINE_STATUS_Q = models.Q(status='waiting') | models.Q(status='called')
+
+
 class Queue(models.Model):
     """
     Represents a citizen's position in a queue for a government service.
@@ -116,6 +152,13 @@ class Queue(models.Model):
     - cancelled: Queue entry was cancelled
     """
 
+    PRIORITY_CLASS_CHOICES = [
+        ('standard', 'Standard'),
+        ('elderly', 'Elderly'),
+        ('disability', 'Disability'),
+        ('pregnancy', 'Pregnancy'),
+    ]
+
     QUEUE_STATUS_CHOICES = [
         ('waiting', 'Waiting'),
         ('called', 'Called'),
@@ -128,10 +171,42 @@ class Queue(models.Model):
     # Citizen information
     citizen_name = models.CharField(max_length=200)
     citizen_phone = models.CharField(max_length=20, blank=True)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='queues',
+        # Users stay on the default database while tickets may live on a shard
+        db_constraint=False,
+        help_text="Citizen account that took the ticket"
+    )
 
     # Queue details
     service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='queues')
     number = models.PositiveIntegerField()  # Sequential number for the day
+    service_day = models.DateField(help_text="Day the ticket was issued, in the office's local time")
+    queued_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="When the ticket joins the line: issue time for walk-ins, slot start for appointments"
+    )
+    priority_class = models.CharField(
+        max_length=20,
+        choices=PRIORITY_CLASS_CHOICES,
+        default='standard'
+    )
+    call_order = models.DateTimeField(
+        default=timezone.now,
+        help_text="Position in the line: queued_at moved earlier by the priority class boost"
+    )
+    appointment_slot = models.ForeignKey(
+        'AppointmentSlot',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='queues',
+        help_text="Slot this ticket was booked for (empty for walk-ins)"
+    )
     status = models.CharField(
         max_length=20,
         choices=QUEUE_STATUS_CHOICES,
@@ -149,22 +224,49 @@ class Queue(models.Model):
     served_by = models.CharField(max_length=100, blank=True)  # Officer name
 
     class Meta:
-        ordering = ['created_at']
-        # Note: We enforce unique numbers per service per day in the service layer
-        # Django doesn't support date lookups in unique_together
+        ordering = ['call_order']
+        constraints = [
+            # Numbers restart every service day; also the index for numbering
+            # and for per-day counts by service
+            models.UniqueConstraint(
+                fields=['service', 'service_day', 'number'], name='unique_service_day_number'
+            ),
+        ]
+        # The line itself (waiting and called tickets) is a small part of the
+        # table, so it is indexed on its own instead of by (service, status)
         indexes = [
-            models.Index(fields=['service', 'status']),
             models.Index(fields=['created_at']),
-            models.Index(fields=['service', 'number']),  # For performance
+            models.Index(fields=['status', 'called_at']),  # For the no-show sweeper
+            models.Index(
+                fields=['service', 'call_order'],
+                condition=models.Q(status='waiting'),
+                name='queue_waiting_line_idx'
+            ),
+            models.Index(
+                fields=['service', 'call_order'],
+                condition=models.Q(status='called'),
+                name='queue_called_line_idx'
+            ),
+            # A citizen's active tickets ("my tickets", per-citizen limit)
+            models.Index(
+                fields=['owner', 'status'],
+                condition=models.Q(status__in=ACTIVE_STATUSES),
+                name='queue_owner_active_idx'
+            ),
         ]
 
     def __str__(self):
         return f"Queue {self.number} - {self.citizen_name} ({self.service.name})"
 
+    def save(self, *args, **kwargs):
+        if self.service_day is None:
+            self.service_day = self.service.office.local_date(self.created_at)
+        super().save(*args, **kwargs)
+
     @property
     def is_active(self):
         """Check if queue is still active (not completed, cancelled, or no-show)"""
-        return self.status in ['waiting', 'called', 'serving']
+        return self.status in ACTIVE_STATUSES
 
     @property
     def office(self):
@@ -177,12 +279,202 @@ class Queue(models.Model):
         if not self.is_active:
             return 0
 
-        # Count people ahead in queue
-        ahead_count = Queue.objects.filter(
-            service=self.service,
-            status__in=['waiting', 'called'],
-            created_at__lt=self.created_at
-        ).count()
+        # Assume 15 minutes per person; listings may annotate ahead_count
+        ahead = getattr(self, 'ahead_count', None)
+        if ahead is None:
+            ahead = self._ahead_in_queue().count()
+        return ahead * 15
+
+    async def aestimated_wait_time(self):
+        """Async version of estimated_wait_time for the ASGI views"""
+        if not self.is_active:
+            return 0
+
+        return await self._ahead_in_queue().acount() * 15
+
+    def _ahead_in_queue(self):
+        """Queues for the same service that are ahead of this one"""
+        # Same database (office shard or replica) this ticket was read from
+        return Queue.objects.using(self._state.db).filter(
+            LINE_STATUS_Q,
+            service_id=self.service_id,
+            call_order__lt=self.call_order
+        )
+
+
+class SlotTemplate(models.Model):
+    """
+    Weekly opening hours of a service for appointments.
+
+    Example: Monday 08:30-12:00, 30-minute slots, 2 counters. Slot rows are
+    generated from templates ahead of time (generate_appointment_slots).
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='slot_templates')
+    weekday = models.PositiveSmallIntegerField(choices=list(enumerate(calendar.day_name)))
+    start_time = models.TimeField(help_text="First slot starts at this local time")
+    end_time = models.TimeField(help_text="Last slot ends at or before this local time")
+    slot_minutes = models.PositiveIntegerField(default=30, help_text="Length of each slot in minutes")
+    counters = models.PositiveIntegerField(
+        default=1,
+        help_text="Counters serving appointments for this service during these hours"
+    )
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['service', 'weekday', 'start_time']
+
+    def __str__(self):
+        return f"{self.service.name} {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+    @property
+    def capacity(self):
+        """Citizens one slot can take: counters x how many services fit in a slot"""
+        return self.counters * max(1, self.slot_minutes // self.service.estimated_duration)
+
+
+class AppointmentSlot(models.Model):
+    """
+    One bookable time slot of a service, with its booking counter.
+
+    Booking increments `booked` with a conditional UPDATE (booked < capacity),
+    so concurrent requests can never oversell a slot.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='appointment_slots')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    capacity = models.PositiveIntegerField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['service', 'start']
+        constraints = [
+            # Also the index availability lookups range-scan: service = ? AND start >= ?
+            models.UniqueConstraint(fields=['service', 'start'], name='unique_service_slot_start'),
+            models.CheckConstraint(condition=models.Q(booked__lte=models.F('capacity')), name='slot_not_overbooked'),
+        ]
+
+    def __str__(self):
+        return f"{self.service.name} {self.start:%Y-%m-%d %H:%M} ({self.booked}/{self.capacity})"
+
+    @property
+    def available(self):
+        return self.capacity - self.booked
+
+
+class ServiceDailyStats(models.Model):
+    """
+    Per-service daily counters recorded by background jobs.
+
+    The end-of-day rollover adds the tickets it had to close here, so
+    leftover queues stay visible in reports after they are cleaned up.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField(help_text="Service day in the office's local time")
+    cancelled_at_close = models.PositiveIntegerField(
+        default=0,
+        help_text="Waiting tickets cancelled by the end-of-day rollover"
+    )
+    no_show_at_close = models.PositiveIntegerField(
+        default=0,
+        help_text="Called tickets marked as no-show by the end-of-day rollover"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = ['service', 'day']
+        verbose_name = "Service Daily Stats"
+        verbose_name_plural = "Service Daily Stats"
+
+    def __str__(self):
+        return f"{self.service.name} - {self.day}"
+
+
+class QueueEvent(models.Model):
+    """
+    Append-only log of queue state changes (transactional outbox).
+
+    QueueService writes one event per transition in the same transaction
+    as the change itself. Events are numbered per office by QueueEventSequence,
+    whose row is locked while the transaction runs, so sequences commit in
+    order: a consumer that has read up to sequence N never misses a later
+    commit with a lower number. Consumers tail events after their last
+    sequence with QueueService.read_events().
+    """
+    office = models.ForeignKey(Office, on_delete=models.CASCADE, related_name='queue_events')
+    sequence = models.PositiveBigIntegerField(help_text="Position in the office's event stream")
+    queue = models.ForeignKey(Queue, on_delete=models.CASCADE, related_name='events')
+    previous_status = models.CharField(
+        max_length=20,
+        blank=True,
+        help_text="Status before the change (empty when the ticket was created)"
+    )
+    status = models.CharField(max_length=20, choices=Queue.QUEUE_STATUS_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['office', 'sequence']
+        constraints = [
+            # Also the index consumers read through: office = ? AND sequence > ?
+            models.UniqueConstraint(fields=['office', 'sequence'], name='unique_office_event_sequence'),
+        ]
 
-        # Assume 15 minutes per person
-        return ahead_count * 15
+    def __str__(self):
+        return f"{self.office_id}#{self.sequence}: queue {self.queue_id} {self.previous_status} -> {self.status}"
+
+
+class QueueEventSequence(models.Model):
+    """Last event sequence handed out per office (see QueueEvent)."""
+    office = models.OneToOneField(
+        Office, on_delete=models.CASCADE, primary_key=True, related_name='event_sequence'
+    )
+    last_sequence = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.office_id}: {self.last_sequence}"
+
+
+class Notification(models.Model):
+    """
+    SMS outbox.
+
+    Rows are written by QueueService in the same transaction as the queue
+    change they announce, so request threads never talk to the SMS gateway.
+    The send_notifications worker claims due rows in batches, sends them
+    and retries failures with exponential backoff (see notifications.py).
+    """
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    queue = models.ForeignKey(Queue, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(
+        max_length=40, help_text="'called', 'ahead_<n>' for 'you are n away', or 'transfer_<service>_<number>'"
+    )
+    phone = models.CharField(max_length=20)
+    message = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.UUIDField(
+        null=True, blank=True, db_index=True, help_text="Worker batch currently sending this"
+    )
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),  # Due messages for the worker
+        ]
+        constraints = [
+            # Each ticket gets each kind of message at most once
+            models.UniqueConstraint(fields=['queue', 'kind'], name='unique_queue_notification_kind'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.phone} ({self.status})"
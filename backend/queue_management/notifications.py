@@ -0,0 +1,192 @@
+"""
+SMS notifications through a database outbox.
+
+QueueService calls enqueue_call_notifications() inside the call_next_queue
+transaction. It queues an SMS for the citizen being called and a "you are
+N away" SMS for waiting citizens who just reached one of the
+SMS_AHEAD_THRESHOLDS positions. transfer_queues() likewise calls
+enqueue_transfer_notifications() to tell citizens their new service and
+number. Nothing is sent from the request thread.
+
+The send_notifications worker runs dispatch_batch() from a thread pool:
+- claim up to a batch of due messages (a short transaction; other workers
+  skip the locked rows and the claim expires after SMS_CLAIM_SECONDS if the
+  worker dies),
+- hand the batch to the gateway in one call, outside any transaction,
+- mark successes sent and reschedule failures with exponential backoff,
+  giving up after SMS_MAX_ATTEMPTS.
+
+The gateway is chosen by SMS_BACKEND, like Django's EMAIL_BACKEND.
+ConsoleGateway and FileGateway are local stand-ins for a real provider.
+"""
+import json
+import logging
+import random
+import sys
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notification, Queue
+
+logger = logging.getLogger(__name__)
+
+
+class BaseGateway:
+    """Send SMS messages. Subclasses implement send_batch()."""
+
+    def send_batch(self, notifications):
+        """
+        Send a batch of Notification rows.
+
+        Returns {notification_id: error message} for the ones that failed;
+        raising an exception fails the whole batch.
+        """
+        raise NotImplementedError
+
+
+class ConsoleGateway(BaseGateway):
+    """Write messages to stdout instead of sending them."""
+
+    def send_batch(self, notifications):
+        for notification in notifications:
+            sys.stdout.write(f"SMS to {notification.phone}: {notification.message}\n")
+        sys.stdout.flush()
+        return {}
+
+
+class FileGateway(BaseGateway):
+    """Append messages as JSON lines to SMS_FILE_PATH."""
+
+    _lock = threading.Lock()
+
+    def send_batch(self, notifications):
+        lines = [
+            json.dumps({'id': n.id, 'phone': n.phone, 'kind': n.kind, 'message': n.message}) + '\n'
+            for n in notifications
+        ]
+        with self._lock, open(settings.SMS_FILE_PATH, 'a') as f:
+            f.writelines(lines)
+        return {}
+
+
+def get_gateway():
+    return import_string(settings.SMS_BACKEND)()
+
+
+def enqueue_call_notifications(shard, service, called):
+    """
+    Queue SMS messages for a call_next_queue transition.
+
+    Must run inside the transaction that called the ticket. Citizens
+    without a phone number are skipped.
+    """
+    notifications = []
+    if called.citizen_phone:
+        notifications.append(Notification(
+            queue=called, kind='called', phone=called.citizen_phone,
+            message=f"Number {called.number} for {service.name}: please come to the counter now."
+        ))
+
+    thresholds = settings.SMS_AHEAD_THRESHOLDS
+    if thresholds:
+        # One query for the front of the line; position n has n citizens ahead
+        front = list(
+            Queue.objects.using(shard).filter(
+                service=service, status='waiting', queued_at__lte=timezone.now()
+            ).order_by('call_order').values_list('id', 'number', 'citizen_phone')[:max(thresholds) + 1]
+        )
+        for ahead in thresholds:
+            if ahead < len(front) and front[ahead][2]:
+                queue_id, number, phone = front[ahead]
+                notifications.append(Notification(
+                    queue_id=queue_id, kind=f'ahead_{ahead}', phone=phone,
+                    message=f"Number {number} for {service.name}: {ahead} "
+                            f"{'citizen is' if ahead == 1 else 'citizens are'} ahead of you."
+                ))
+
+    if notifications:
+        # A ticket that skipped back to an earlier position is not told twice
+        Notification.objects.using(shard).bulk_create(notifications, ignore_conflicts=True)
+
+
+def enqueue_transfer_notifications(shard, source, target, moved):
+    """
+    Queue an SMS for each ticket moved by a transfer_queues batch.
+
+    `moved` holds (queue_id, new number, phone) tuples. Must run inside the
+    transaction that moved the tickets. Citizens without a phone number are
+    skipped.
+    """
+    notifications = [
+        Notification(
+            # The target and number are part of the kind, so a ticket that
+            # is moved again gets told again
+            queue_id=queue_id, kind=f'transfer_{target.id}_{number}', phone=phone,
+            message=f"Number {number} for {target.name}: your ticket was moved here "
+                    f"from {source.name} and keeps its place in line."
+        )
+        for queue_id, number, phone in moved if phone
+    ]
+    if notifications:
+        Notification.objects.using(shard).bulk_create(notifications, ignore_conflicts=True)
+
+
+def _retry_delay(attempts):
+    base = settings.SMS_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=base * random.uniform(1, 1.2))
+
+
+def dispatch_batch(shard=None, batch_size=None, gateway=None, now=None):
+    """
+    Claim, send and record one batch of due messages on a shard.
+
+    Returns the number of messages claimed (0 when nothing is due).
+    """
+    batch_size = batch_size or settings.SMS_BATCH_SIZE
+    gateway = gateway or get_gateway()
+    now = now or timezone.now()
+    token = uuid.uuid4()
+    outbox = Notification.objects.using(shard)
+
+    with transaction.atomic(using=shard):
+        # One statement claims the batch: other workers skip its locked rows
+        # (PostgreSQL) or wait for it and then no longer match (SQLite)
+        due = outbox.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at')
+        claimed = outbox.filter(
+            id__in=due.select_for_update(skip_locked=True).values('id')[:batch_size],
+            status='pending',
+            next_attempt_at__lte=now
+        ).update(claim_token=token, next_attempt_at=now + timedelta(seconds=settings.SMS_CLAIM_SECONDS))
+    if not claimed:
+        return 0
+
+    batch = list(outbox.filter(claim_token=token))
+    try:
+        errors = gateway.send_batch(batch)
+    except Exception as e:
+        logger.exception("SMS gateway failed a batch of %s", len(batch))
+        errors = {notification.id: str(e) for notification in batch}
+
+    sent = [notification.id for notification in batch if notification.id not in errors]
+    outbox.filter(id__in=sent).update(status='sent', sent_at=timezone.now(), claim_token=None, last_error='')
+
+    for notification in batch:
+        if notification.id not in errors:
+            continue
+        notification.attempts += 1
+        notification.last_error = str(errors[notification.id])[:1000]
+        notification.claim_token = None
+        if notification.attempts >= settings.SMS_MAX_ATTEMPTS:
+            notification.status = 'failed'
+            logger.warning("Giving up on SMS %s after %s attempts", notification.id, notification.attempts)
+        else:
+            notification.next_attempt_at = timezone.now() + _retry_delay(notification.attempts)
+        notification.save(update_fields=['attempts', 'last_error', 'claim_token', 'status', 'next_attempt_at'])
+
+    return claimed
@@ -0,0 +1,120 @@
+"""
+Service catalog search.
+
+search_services() answers free-text queries such as "passport ren" over the
+service name, description and type and the office name. Every query word
+matches as a prefix, and a service must match all of them.
+
+The catalog is small and changes rarely, so each process keeps an inverted
+index of it in memory: token -> {service_id: weight}, plus the sorted token
+list, where a prefix lookup is a binary search. The index is rebuilt from
+one query whenever the catalog version (QueueService.get_catalog_version)
+changes. A search then costs that version query and a few dictionary
+lookups, on any database backend.
+
+Ranking: a word found in the name scores more than one in the type, the
+office name or the description, and a whole-word match more than a prefix.
+Ties go to the service priority, then the office and service names.
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left
+
+from .models import Service
+from .services import QueueService
+
+# Score of a match in each field; the best field counts for each query word
+FIELD_WEIGHTS = {'name': 4.0, 'service_type': 2.0, 'office': 2.0, 'description': 1.0}
+
+# A prefix match counts this share of a whole-word match
+PREFIX_FACTOR = 0.6
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercase words of a text (any script, so Amharic names work too)."""
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+class CatalogIndex:
+    """Inverted index over the active services of active offices."""
+
+    def __init__(self, services):
+        self.services = {service.id: service for service in services}
+        self.postings = {}
+        for service in services:
+            fields = {
+                'name': service.name,
+                'service_type': f'{service.service_type} {service.get_service_type_display()}',
+                'office': service.office.name,
+                'description': service.description,
+            }
+            for field, text in fields.items():
+                for token in tokenize(text):
+                    weights = self.postings.setdefault(token, {})
+                    weights[service.id] = max(weights.get(service.id, 0), FIELD_WEIGHTS[field])
+        self.tokens = sorted(self.postings)
+
+    def _word_scores(self, word):
+        """Best score per service for one query word, as a prefix."""
+        scores = {}
+        for position in range(bisect_left(self.tokens, word), len(self.tokens)):
+            token = self.tokens[position]
+            if not token.startswith(word):
+                break
+            factor = 1.0 if token == word else PREFIX_FACTOR
+            for service_id, weight in self.postings[token].items():
+                scores[service_id] = max(scores.get(service_id, 0), weight * factor)
+        return scores
+
+    def search(self, query, limit):
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return []
+
+        totals = None
+        for word in words:
+            scores = self._word_scores(word)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {service_id: totals[service_id] + score
+                          for service_id, score in scores.items() if service_id in totals}
+            if not totals:
+                return []
+
+        best = heapq.nsmallest(
+            limit, (self.services[service_id] for service_id in totals),
+            key=lambda s: (-totals[s.id], s.priority, s.office.name, s.name)
+        )
+        return [(service, round(totals[service.id], 2)) for service in best]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The catalog index of the current catalog version, rebuilt when it changed."""
+    global _index
+    version = QueueService.get_catalog_version()
+    current = _index
+    if current is not None and current[0] == version:
+        return current[1]
+
+    with _index_lock:
+        if _index is None or _index[0] != version:
+            services = Service.objects.filter(is_active=True, office__is_active=True).select_related('office')
+            _index = (version, CatalogIndex(list(services)))
+        return _index[1]
+
+
+def search_services(query, limit=20):
+    """
+    Search the active catalog.
+
+    Returns up to `limit` (service, score) pairs, best match first.
+    """
+    return get_index().search(query, limit)
@@ -1,3 +1,5 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
 from rest_framework import serializers
 from .models import Office
 
@@ -10,7 +12,7 @@ class OfficeSerializer(serializers.ModelSerializer):
         model = Office
         fields = [
             'id', 'name', 'code', 'address', 'phone',
-            'is_active', 'service_count', 'created_at'
+            'is_active', 'timezone', 'service_count', 'created_at'
         ]
         read_only_fields = ['id', 'created_at', 'service_count']
 
@@ -19,13 +21,25 @@ class OfficeSerializer(serializers.ModelSerializer):
         Return the number of active services for this office.
 
         This is a computed field - it's not stored in the database
-        but calculated when the serializer runs.
+        but calculated when the serializer runs. List views annotate it
+        as active_service_count to avoid one COUNT query per office.
         """
+        if hasattr(obj, 'active_service_count'):
+            return obj.active_service_count
         return obj.services.filter(is_active=True).count()
 
     def validate_code(self, value):
         return value.upper()
 
+    def validate_timezone(self, value):
+        # ZoneInfo caches the zones it has loaded, unlike available_timezones()
+        # which walks the whole tzdata tree
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError("Unknown timezone")
+        return value
+
     def validate(self, data):
         if data.get('name') == data.get('code'):
             raise serializers.ValidationError(
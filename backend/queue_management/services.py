@@ -1,19 +1,37 @@
-from django.db import models, transaction
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce, RowNumber
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from .models import Queue, Service
+from .models import (
+    ACTIVE_STATUSES, LINE_STATUS_Q, AppointmentSlot, Office, Queue, QueueEvent, QueueEventSequence,
+    Service, ServiceDailyStats, SlotTemplate
+)
+from .notifications import enqueue_call_notifications, enqueue_transfer_notifications
+from .sharding import shard_aliases, shard_for_office, shard_for_queue
 
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Tries at numbering a new ticket when concurrent requests collide
+CREATE_QUEUE_ATTEMPTS = 3
+
 
 class QueueService:
-    """Service layer for queue management business logic.Handles all queue operations and enforces business rules."""
+    """
+    Service layer for queue management business logic.Handles all queue operations and enforces business rules.
+
+    Queue data is read and written on the office's shard (see sharding.py);
+    every transaction below runs on that shard's connection. Every status
+    change also appends a QueueEvent in the same transaction.
+    """
     @staticmethod
-    @transaction.atomic
-    def create_queue(citizen_name, service_id, citizen_phone=''):
+    def create_queue(citizen_name, service_id, citizen_phone='', owner=None, priority_class='standard'):
         """
         Create a new queue ticket for a citizen.
 
@@ -21,8 +39,13 @@ class QueueService:
         1. Service must exist and be active
         2. Office must be active
         3. Generate sequential queue number for the day
-        4. Queue numbers reset daily per service
+        4. Queue numbers reset daily per service (office local day); the
+           unique constraint on (service, service_day, number) settles races
         5. Maximum 999 tickets per service per day
+        6. A citizen account (owner) holds at most MAX_ACTIVE_TICKETS_PER_CITIZEN
+           active tickets
+        7. Priority classes (elderly, disability, pregnancy) are called as if
+           they had arrived QUEUE_PRIORITY_BOOSTS minutes earlier
         """
         try:
             service = Service.objects.get(id=service_id, is_active=True)
@@ -32,69 +55,155 @@ class QueueService:
         if not service.office.is_active:
             raise ValidationError("Office is currently closed")
 
-        # Calculate next queue number for this service today
-        today = timezone.now().date()
-        last_queue = Queue.objects.filter(
-            service=service,
-            created_at__date=today
-        ).aggregate(models.Max('number'))['number__max'] or 0
+        return QueueService._issue_ticket(service, citizen_name, citizen_phone, owner, priority_class)
 
-        next_number = last_queue + 1
+    @staticmethod
+    def book_appointment(citizen_name, service_id, slot_id, citizen_phone='', owner=None,
+                         priority_class='standard'):
+        """
+        Book a citizen into an appointment slot.
 
-        if next_number > 999:
-            raise ValidationError("Maximum queue capacity reached for today")
+        Business Rules:
+        1. Service must exist and be active, office must be active
+        2. The slot must belong to the service, start in the future and have room
+        3. The slot's booked counter is raised by a conditional UPDATE
+           (booked < capacity), so concurrent bookings never oversell it
+        4. The ticket is numbered for the slot's service day and joins the
+           line at the slot start (queued_at), ahead of later walk-ins
+        5. The per-citizen active ticket limit and priority classes apply as
+           for walk-ins
+        """
+        try:
+            service = Service.objects.select_related('office').get(id=service_id, is_active=True)
+        except Service.DoesNotExist:
+            raise ValidationError("Service not found or not available")
 
-        # Create the queue entry
-        queue = Queue.objects.create(
-            citizen_name=citizen_name,
-            citizen_phone=citizen_phone,
-            service=service,
-            number=next_number,
-            status='waiting'
+        if not service.office.is_active:
+            raise ValidationError("Office is currently closed")
+
+        return QueueService._issue_ticket(
+            service, citizen_name, citizen_phone, owner, priority_class, slot_id=slot_id
         )
 
+    @staticmethod
+    def _issue_ticket(service, citizen_name, citizen_phone, owner, priority_class, slot_id=None):
+        """Number and save a waiting ticket: a walk-in, or a booking of slot_id."""
+        if priority_class not in dict(Queue.PRIORITY_CLASS_CHOICES):
+            raise ValidationError(f"Unknown priority class: {priority_class}")
+        boost = timedelta(minutes=settings.QUEUE_PRIORITY_BOOSTS.get(priority_class, 0))
+
+        shard = shard_for_office(service.office_id)
+        now = timezone.now()
+        for attempt in range(CREATE_QUEUE_ATTEMPTS):
+            try:
+                with transaction.atomic(using=shard):
+                    limit = settings.MAX_ACTIVE_TICKETS_PER_CITIZEN
+                    if owner is not None and limit:
+                        # Tickets of other offices may be on other shards; concurrent
+                        # requests from one account can still slip past the limit there
+                        active = sum(
+                            QueueService._citizen_queues(alias, owner.pk).count() for alias in shard_aliases()
+                        )
+                        if active >= limit:
+                            raise ValidationError(f"You already have {active} active tickets")
 
-        return queue
+                    slot = None
+                    queued_at = now
+                    if slot_id is not None:
+                        # Take a place; only one of several concurrent bookings
+                        # can take the last one
+                        taken = AppointmentSlot.objects.using(shard).filter(
+                            id=slot_id,
+                            service=service,
+                            start__gt=now,
+                            booked__lt=models.F('capacity')
+                        ).update(booked=models.F('booked') + 1)
+                        if not taken:
+                            raise ValidationError("Appointment slot not found or fully booked")
+                        slot = AppointmentSlot.objects.using(shard).get(id=slot_id)
+                        queued_at = slot.start
+                    day = service.office.local_date(queued_at)
+
+                    # Calculate next queue number for this service on that day
+                    last_queue = Queue.objects.using(shard).filter(
+                        service=service,
+                        service_day=day
+                    ).aggregate(models.Max('number'))['number__max'] or 0
+
+                    next_number = last_queue + 1
+
+                    if next_number > 999:
+                        raise ValidationError("Maximum queue capacity reached for today")
+
+                    # Create the queue entry
+                    queue = Queue.objects.using(shard).create(
+                        citizen_name=citizen_name,
+                        citizen_phone=citizen_phone,
+                        owner_id=owner.pk if owner is not None else None,
+                        service=service,
+                        service_day=day,
+                        queued_at=queued_at,
+                        priority_class=priority_class,
+                        call_order=queued_at - boost,
+                        appointment_slot=slot,
+                        number=next_number,
+                        status='waiting'
+                    )
+                    QueueService._record_events(shard, [(service.office_id, queue.id, '', 'waiting')])
+                return queue
+            except IntegrityError:
+                # A concurrent request took the same number; count again
+                logger.info("Queue number for %s was taken, retrying", service.code)
+
+        raise ValidationError("The queue is busy, please try again")
 
     @staticmethod
-    @transaction.atomic
     def call_next_queue(officer_name, service_id):
         """
         Call the next citizen in queue for a specific service.
 
         Business Rules:
         1. Service must exist and be active
-        2. Find the next waiting citizen (oldest first)
+        2. Find the next waiting citizen by call order: arrival (or slot
+           start) moved earlier by the ticket's priority class boost. Every
+           ticket ages at the same rate, so priority tickets never hold a
+           standard ticket back by more than the boost. Booked citizens only
+           join the line when their slot starts
         3. Change status to 'called'
         4. Set called_at timestamp
         5. Record which officer called them
         6. Citizen has 5 minutes to respond or status becomes 'no_show'
+        7. Queue SMS messages for the called citizen and for citizens now
+           SMS_AHEAD_THRESHOLDS places from the front (sent by a worker)
         """
         try:
             service = Service.objects.get(id=service_id, is_active=True)
         except Service.DoesNotExist:
             raise ValidationError("Service not found or not available")
 
-        # Find next waiting queue (oldest first)
-        next_queue = Queue.objects.select_for_update().filter(
-            service=service,
-            status='waiting'
-        ).order_by('created_at').first()
-
-        if not next_queue:
-            raise ValidationError("No citizens waiting in queue")
+        shard = shard_for_office(service.office_id)
+        with transaction.atomic(using=shard):
+            # Find next waiting queue (oldest first)
+            next_queue = Queue.objects.using(shard).select_for_update().filter(
+                service=service,
+                status='waiting',
+                queued_at__lte=timezone.now()
+            ).order_by('call_order').first()
 
-        # Update queue status
-        next_queue.status = 'called'
-        next_queue.called_at = timezone.now()
-        next_queue.called_by = officer_name
-        next_queue.save()
+            if not next_queue:
+                raise ValidationError("No citizens waiting in queue")
 
+            # Update queue status
+            next_queue.status = 'called'
+            next_queue.called_at = timezone.now()
+            next_queue.called_by = officer_name
+            next_queue.save()
+            QueueService._record_events(shard, [(service.office_id, next_queue.id, 'waiting', 'called')])
+            enqueue_call_notifications(shard, service, next_queue)
 
         return next_queue
 
     @staticmethod
-    @transaction.atomic
     def start_service(queue_id, officer_name):
         """
         Mark a queue as being served.
@@ -105,23 +214,27 @@ class QueueService:
         3. Set started_at timestamp
         4. Record serving officer
         """
-        try:
-            queue = Queue.objects.select_for_update().get(
-                id=queue_id,
-                status='called'
-            )
-        except Queue.DoesNotExist:
-            raise ValidationError("Queue not found or not in called status")
+        shard = shard_for_queue(queue_id)
+        with transaction.atomic(using=shard):
+            try:
+                queue = Queue.objects.using(shard).select_for_update(of=('self',)).select_related(
+                    'service'
+                ).get(
+                    id=queue_id,
+                    status='called'
+                )
+            except Queue.DoesNotExist:
+                raise ValidationError("Queue not found or not in called status")
 
-        queue.status = 'serving'
-        queue.started_at = timezone.now()
-        queue.served_by = officer_name
-        queue.save()
+            queue.status = 'serving'
+            queue.started_at = timezone.now()
+            queue.served_by = officer_name
+            queue.save()
+            QueueService._record_events(shard, [(queue.service.office_id, queue.id, 'called', 'serving')])
 
         return queue
 
     @staticmethod
-    @transaction.atomic
     def complete_service(queue_id):
         """
         Mark a queue service as completed.
@@ -131,22 +244,26 @@ class QueueService:
         2. Change status to 'completed'
         3. Set completed_at timestamp
         """
-        try:
-            queue = Queue.objects.select_for_update().get(
-                id=queue_id,
-                status='serving'
-            )
-        except Queue.DoesNotExist:
-            raise ValidationError("Queue not found or not in serving status")
+        shard = shard_for_queue(queue_id)
+        with transaction.atomic(using=shard):
+            try:
+                queue = Queue.objects.using(shard).select_for_update(of=('self',)).select_related(
+                    'service'
+                ).get(
+                    id=queue_id,
+                    status='serving'
+                )
+            except Queue.DoesNotExist:
+                raise ValidationError("Queue not found or not in serving status")
 
-        queue.status = 'completed'
-        queue.completed_at = timezone.now()
-        queue.save()
+            queue.status = 'completed'
+            queue.completed_at = timezone.now()
+            queue.save()
+            QueueService._record_events(shard, [(queue.service.office_id, queue.id, 'serving', 'completed')])
 
         return queue
 
     @staticmethod
-    @transaction.atomic
     def mark_no_show(queue_id):
         """
         Mark a called queue as no-show.
@@ -155,21 +272,25 @@ class QueueService:
         1. Queue must exist and be in 'called' status
         2. Change status to 'no_show'
         """
-        try:
-            queue = Queue.objects.select_for_update().get(
-                id=queue_id,
-                status='called'
-            )
-        except Queue.DoesNotExist:
-            raise ValidationError("Queue not found or not in called status")
+        shard = shard_for_queue(queue_id)
+        with transaction.atomic(using=shard):
+            try:
+                queue = Queue.objects.using(shard).select_for_update(of=('self',)).select_related(
+                    'service'
+                ).get(
+                    id=queue_id,
+                    status='called'
+                )
+            except Queue.DoesNotExist:
+                raise ValidationError("Queue not found or not in called status")
 
-        queue.status = 'no_show'
-        queue.save()
+            queue.status = 'no_show'
+            queue.save()
+            QueueService._record_events(shard, [(queue.service.office_id, queue.id, 'called', 'no_show')])
 
         return queue
 
     @staticmethod
-    @transaction.atomic
     def cancel_queue(queue_id, reason=''):
         """
         Cancel a queue entry.
@@ -177,30 +298,670 @@ class QueueService:
         Business Rules:
         1. Queue must exist and be active (waiting/called/serving)
         2. Change status to 'cancelled'
+        3. Cancelling a booking before its slot starts frees its place in the slot
         """
-        try:
-            queue = Queue.objects.select_for_update().get(
-                id=queue_id,
-                status__in=['waiting', 'called', 'serving']
+        shard = shard_for_queue(queue_id)
+        with transaction.atomic(using=shard):
+            try:
+                queue = Queue.objects.using(shard).select_for_update(of=('self',)).select_related(
+                    'service'
+                ).get(
+                    id=queue_id,
+                    status__in=['waiting', 'called', 'serving']
+                )
+            except Queue.DoesNotExist:
+                raise ValidationError("Queue not found or cannot be cancelled")
+
+            previous_status = queue.status
+            queue.status = 'cancelled'
+            queue.save()
+            if queue.appointment_slot_id and queue.queued_at > timezone.now():
+                AppointmentSlot.objects.using(shard).filter(id=queue.appointment_slot_id).update(
+                    booked=models.F('booked') - 1
+                )
+            QueueService._record_events(
+                shard, [(queue.service.office_id, queue.id, previous_status, 'cancelled')]
             )
-        except Queue.DoesNotExist:
-            raise ValidationError("Queue not found or cannot be cancelled")
 
-        queue.status = 'cancelled'
-        queue.save()
+        return queue
+
+    @staticmethod
+    def set_priority_class(queue_id, priority_class):
+        """
+        Set the priority class of a waiting ticket after an officer checked it.
+
+        Business Rules:
+        1. Queue must exist and be waiting
+        2. call_order is recomputed from queued_at and the class's boost, so
+           the ticket moves to its new place in line (or back to its arrival
+           place when set to standard)
+        3. Records a waiting -> waiting event so synced dashboards pick up
+           the new order
+        """
+        if priority_class not in dict(Queue.PRIORITY_CLASS_CHOICES):
+            raise ValidationError(f"Unknown priority class: {priority_class}")
+        boost = timedelta(minutes=settings.QUEUE_PRIORITY_BOOSTS.get(priority_class, 0))
+
+        shard = shard_for_queue(queue_id)
+        with transaction.atomic(using=shard):
+            try:
+                queue = Queue.objects.using(shard).select_for_update(of=('self',)).select_related(
+                    'service'
+                ).get(id=queue_id, status='waiting')
+            except Queue.DoesNotExist:
+                raise ValidationError("Queue not found or no longer waiting")
+
+            queue.priority_class = priority_class
+            queue.call_order = queue.queued_at - boost
+            queue.save()
+            QueueService._record_events(
+                shard, [(queue.service.office_id, queue.id, 'waiting', 'waiting')]
+            )
 
         return queue
 
+    @staticmethod
+    def expire_overdue_calls(batch_size=None, now=None):
+        """
+        Mark called citizens who did not respond in time as no-show.
+
+        Business Rules:
+        1. Only queues in 'called' status are expired
+        2. Each service has its own response window (call_timeout minutes)
+        3. Work is done in bounded batches, one UPDATE (plus its events) per
+           batch, each in its own short transaction so a sweep never holds
+           locks for long
+        4. Every shard is swept in turn
+
+        Returns the number of queues marked as no-show.
+        """
+        batch_size = batch_size or settings.NO_SHOW_SWEEP_BATCH_SIZE
+        now = now or timezone.now()
+        expired = 0
+
+        # Services share a handful of timeout values, so one pass per value
+        # keeps the deadline a plain column comparison on (status, called_at)
+        timeouts = Service.objects.order_by().values_list('call_timeout', flat=True).distinct()
+
+        for shard in shard_aliases():
+            for timeout in timeouts:
+                overdue = Queue.objects.using(shard).filter(
+                    status='called',
+                    called_at__lt=now - timedelta(minutes=timeout),
+                    service__call_timeout=timeout
+                ).order_by('called_at').values_list('id', 'service__office_id')
+
+                while True:
+                    with transaction.atomic(using=shard):
+                        # Lock the batch so a ticket an officer starts serving
+                        # meanwhile is either in it or left alone
+                        batch = list(overdue.select_for_update(of=('self',))[:batch_size])
+                        updated = Queue.objects.using(shard).filter(
+                            status='called',
+                            id__in=[queue_id for queue_id, _ in batch]
+                        ).update(status='no_show')
+                        QueueService._record_events(shard, [
+                            (office_id, queue_id, 'called', 'no_show') for queue_id, office_id in batch
+                        ])
+                    expired += updated
+                    if updated < batch_size:
+                        break
+
+        if expired:
+            logger.info("Marked %s overdue called queues as no-show", expired)
+
+        return expired
+
+    @staticmethod
+    def close_service_day(office, batch_size=None, now=None):
+        """
+        Close tickets left over from previous service days at an office.
+
+        Business Rules:
+        1. Only tickets from earlier service days (office timezone) are touched
+        2. Waiting tickets become 'cancelled', called tickets become 'no_show'
+        3. Tickets are closed in bounded batches, one UPDATE (plus its events) per batch
+        4. Closed counts are added to ServiceDailyStats for the ticket's day
+           in the same transaction, so re-running only records new work
+
+        Returns a dict with the number of tickets cancelled and marked no-show.
+        """
+        batch_size = batch_size or settings.DAY_CLOSE_BATCH_SIZE
+        closing = {
+            'waiting': ('cancelled', 'cancelled_at_close'),
+            'called': ('no_show', 'no_show_at_close'),
+        }
+        totals = {'cancelled': 0, 'no_show': 0}
+
+        today = office.local_date(now)
+        shard = shard_for_office(office.id)
+        leftovers = Queue.objects.using(shard).filter(
+            service__office=office,
+            status__in=closing.keys(),
+            service_day__lt=today
+        )
+
+        # One small aggregate to find which (service, day, status) groups need closing
+        groups = leftovers.values('service_id', 'service_day', 'status').annotate(
+            count=models.Count('id')
+        ).order_by()
+
+        for group in groups:
+            new_status, counter = closing[group['status']]
+            day = group['service_day']
+            batch_ids = Queue.objects.using(shard).filter(
+                service_id=group['service_id'],
+                status=group['status'],
+                service_day=day
+            ).order_by('id').values_list('id', flat=True)
+
+            while True:
+                with transaction.atomic(using=shard):
+                    batch = list(batch_ids.select_for_update()[:batch_size])
+                    updated = Queue.objects.using(shard).filter(
+                        status=group['status'],
+                        id__in=batch
+                    ).update(status=new_status)
+                    QueueService._record_events(shard, [
+                        (office.id, queue_id, group['status'], new_status) for queue_id in batch
+                    ])
+
+                    if updated:
+                        stats, _ = ServiceDailyStats.objects.using(shard).get_or_create(
+                            service_id=group['service_id'], day=day
+                        )
+                        ServiceDailyStats.objects.using(shard).filter(pk=stats.pk).update(
+                            **{counter: models.F(counter) + updated}
+                        )
+                totals[new_status] += updated
+                if updated < batch_size:
+                    break
+
+        if any(totals.values()):
+            logger.info("Closed leftover queues for %s: %s", office.code, totals)
+
+        return totals
+
+    @staticmethod
+    def transfer_queues(from_service_id, to_service_id, count=None, queue_ids=None, batch_size=None):
+        """
+        Move waiting tickets from one service to another at the same office.
+
+        Business Rules:
+        1. Both services must exist, be active and belong to the same office
+        2. Only today's waiting walk-in tickets move (front of the line first,
+           or just queue_ids when given); called, serving and booked tickets stay
+        3. Moved tickets keep their call_order, so they join the target line
+           at their original arrival position
+        4. They are renumbered after the target's last number for the day, in
+           line order, with one UPDATE per batch
+        5. Every moved ticket gets a QueueEvent (waiting -> waiting) so
+           synced dashboards pick up the new service and number
+        6. Citizens with a phone number get an SMS with their new service and
+           number through the notification outbox
+
+        Returns the number of tickets moved.
+        """
+        services = Service.objects.select_related('office').filter(
+            id__in=[from_service_id, to_service_id], is_active=True
+        ).in_bulk()
+        if from_service_id == to_service_id or len(services) != 2:
+            raise ValidationError("Both services must exist, be active and be different")
+        source, target = services[from_service_id], services[to_service_id]
+        if source.office_id != target.office_id:
+            raise ValidationError("Tickets can only move between services of the same office")
+
+        office = source.office
+        shard = shard_for_office(office.id)
+        today = office.local_date()
+        batch_size = batch_size or settings.TRANSFER_BATCH_SIZE
+        movable = Queue.objects.using(shard).filter(
+            service=source,
+            status='waiting',
+            service_day=today,
+            queued_at__lte=timezone.now(),
+            appointment_slot__isnull=True
+        )
+        if queue_ids is not None:
+            movable = movable.filter(id__in=queue_ids)
+
+        moved = 0
+        while count is None or moved < count:
+            size = batch_size if count is None else min(batch_size, count - moved)
+            try:
+                with transaction.atomic(using=shard):
+                    rows = list(
+                        movable.select_for_update().order_by('call_order').values_list('id', 'citizen_phone')[:size]
+                    )
+                    batch = [queue_id for queue_id, _ in rows]
+                    last_number = Queue.objects.using(shard).filter(
+                        service=target,
+                        service_day=today
+                    ).aggregate(models.Max('number'))['number__max'] or 0
+                    if last_number + len(batch) > 999:
+                        raise ValidationError("Maximum queue capacity reached for today")
+
+                    if batch:
+                        Queue.objects.using(shard).filter(id__in=batch).update(
+                            service=target,
+                            number=models.Case(*[
+                                models.When(id=queue_id, then=models.Value(last_number + position))
+                                for position, queue_id in enumerate(batch, start=1)
+                            ])
+                        )
+                        QueueService._record_events(shard, [
+                            (office.id, queue_id, 'waiting', 'waiting') for queue_id in batch
+                        ])
+                        enqueue_transfer_notifications(shard, source, target, [
+                            (queue_id, last_number + position, phone)
+                            for position, (queue_id, phone) in enumerate(rows, start=1)
+                        ])
+            except IntegrityError:
+                # A ticket was issued for the target service at the same time
+                raise ValidationError("The target queue is busy, please try again")
+
+            moved += len(batch)
+            if len(batch) < size:
+                break
+
+        if moved:
+            logger.info("Moved %s tickets from %s to %s", moved, source.code, target.code)
+
+        return moved
+
+    @staticmethod
+    def rebalance_office(office, apply=False, now=None):
+        """
+        Suggest (or apply) ticket transfers that even out waits at an office.
+
+        Business Rules:
+        1. Only active services of the same service_type exchange tickets
+        2. A service's rate is its completions over the last
+           REBALANCE_WINDOW_MINUTES; a service with none yet counts as one
+           counter working at its estimated_duration
+        3. Waiting tickets are shared in proportion to the rates, so that
+           every service expects about the same wait
+        4. A transfer is only suggested when it moves at least
+           REBALANCE_MIN_TICKETS tickets
+        5. With apply=True the transfers are made with transfer_queues()
+
+        Returns a list of {'from_service', 'to_service', 'count',
+        'from_wait_minutes', 'to_wait_minutes'} with each side's expected
+        wait before the move (and 'moved' when applied).
+        """
+        now = now or timezone.now()
+        window = settings.REBALANCE_WINDOW_MINUTES
+        services = {service.id: service for service in Service.objects.filter(office=office, is_active=True)}
+
+        # One grouped query for line lengths and recent completions
+        rows = Queue.objects.using(shard_for_office(office.id)).filter(
+            service_id__in=services,
+            service_day=office.local_date(now)
+        ).values('service_id').annotate(
+            waiting=models.Count('id', filter=models.Q(status='waiting', queued_at__lte=now)),
+            completed=models.Count(
+                'id', filter=models.Q(status='completed', completed_at__gte=now - timedelta(minutes=window))
+            )
+        ).order_by()
+        stats = {row['service_id']: row for row in rows}
+
+        groups = {}
+        for service in services.values():
+            row = stats.get(service.id, {'waiting': 0, 'completed': 0})
+            # Citizens served per minute
+            rate = row['completed'] / window or 1 / max(service.estimated_duration, 1)
+            groups.setdefault(service.service_type, []).append((service, row['waiting'], rate))
+
+        moves = []
+        for members in groups.values():
+            total_waiting = sum(waiting for _, waiting, _ in members)
+            total_rate = sum(rate for _, _, rate in members)
+            # Positive: more tickets than its share; negative: room for more
+            balance = {
+                service.id: waiting - total_waiting * rate / total_rate for service, waiting, rate in members
+            }
+            waits = {service.id: waiting / rate for service, waiting, rate in members}
+
+            sources = sorted((s for s in balance if balance[s] > 0), key=balance.get, reverse=True)
+            targets = sorted((s for s in balance if balance[s] < 0), key=balance.get)
+            for source_id in sources:
+                for target_id in targets:
+                    count = int(min(balance[source_id], -balance[target_id]))
+                    if count < settings.REBALANCE_MIN_TICKETS:
+                        continue
+                    balance[source_id] -= count
+                    balance[target_id] += count
+                    moves.append({
+                        'from_service': services[source_id].code,
+                        'to_service': services[target_id].code,
+                        'count': count,
+                        'from_wait_minutes': round(waits[source_id]),
+                        'to_wait_minutes': round(waits[target_id]),
+                    })
+                    if apply:
+                        moves[-1]['moved'] = QueueService.transfer_queues(source_id, target_id, count=count)
+
+        return moves
+
+    @staticmethod
+    def generate_appointment_slots(office, days=None, today=None):
+        """
+        Create an office's appointment slots from its slot templates.
+
+        Business Rules:
+        1. Slots cover today and the following days, APPOINTMENT_BOOKING_DAYS
+           in total, in the office's local time
+        2. Each template's hours are cut into slots of slot_minutes; a slot
+           takes counters x (slot_minutes // estimated_duration) citizens
+        3. Existing slots are kept as they are (with their bookings), so
+           re-running only adds the missing ones
+
+        Returns the number of slots in the period.
+        """
+        days = days or settings.APPOINTMENT_BOOKING_DAYS
+        today = today or office.local_date()
+        templates = SlotTemplate.objects.filter(
+            service__office=office,
+            service__is_active=True,
+            is_active=True
+        ).select_related('service')
+
+        slots = []
+        for offset in range(days):
+            day = today + timedelta(days=offset)
+            for template in templates:
+                if template.weekday != day.weekday():
+                    continue
+                step = timedelta(minutes=template.slot_minutes)
+                start = datetime.combine(day, template.start_time, tzinfo=office.tzinfo)
+                closing = datetime.combine(day, template.end_time, tzinfo=office.tzinfo)
+                while start + step <= closing:
+                    slots.append(AppointmentSlot(
+                        service_id=template.service_id, start=start, end=start + step,
+                        capacity=template.capacity
+                    ))
+                    start += step
+
+        AppointmentSlot.objects.using(shard_for_office(office.id)).bulk_create(
+            slots, batch_size=500, ignore_conflicts=True
+        )
+        return len(slots)
+
+    @staticmethod
+    def get_available_slots(service, day=None):
+        """
+        Get a service's slots with free places on a day, earliest first.
+
+        A range scan of the (service, start) index; free places come from
+        each slot's booked counter, so no tickets are counted.
+        """
+        office = service.office
+        day = day or office.local_date()
+        return AppointmentSlot.objects.using(shard_for_office(office.id)).filter(
+            service=service,
+            start__gte=max(office.day_start(day), timezone.now()),
+            start__lt=office.day_start(day + timedelta(days=1)),
+            booked__lt=models.F('capacity')
+        ).order_by('start')
+
+    @staticmethod
+    def read_events(office_id, after=0, limit=None):
+        """
+        Read an office's queue events after a cursor, oldest first.
+
+        Consumers keep the sequence of the last event they processed and
+        pass it back as `after`; an empty result means they are caught up.
+        At most QUEUE_EVENT_BATCH_SIZE events are returned per call.
+        """
+        limit = min(limit or settings.QUEUE_EVENT_BATCH_SIZE, settings.QUEUE_EVENT_BATCH_SIZE)
+        return list(
+            QueueEvent.objects.using(shard_for_office(office_id)).filter(
+                office_id=office_id,
+                sequence__gt=after
+            ).order_by('sequence')[:limit]
+        )
+
+    @staticmethod
+    def get_office_changes(office, since=0, limit=None):
+        """
+        Get the tickets of an office whose state changed after a cursor.
+
+        Reads one batch of events after `since` and returns the current
+        state of each ticket they touch (once, however often it changed),
+        so the payload grows with the number of changes, not the queue.
+
+        Returns (tickets, cursor, has_more): cursor is the sequence to pass
+        as `since` next time; has_more means another batch is waiting.
+        """
+        limit = min(limit or settings.QUEUE_EVENT_BATCH_SIZE, settings.QUEUE_EVENT_BATCH_SIZE)
+        events = QueueService.read_events(office.id, after=since, limit=limit)
+        if not events:
+            return [], since, False
+
+        queue_ids = list(dict.fromkeys(event.queue_id for event in events))
+        tickets = Queue.objects.using(shard_for_office(office.id)).filter(id__in=queue_ids).order_by('id')
+        return list(tickets), events[-1].sequence, len(events) == limit
+
+    @staticmethod
+    def _record_events(shard, changes):
+        """
+        Append events for (office_id, queue_id, previous_status, status) changes.
+
+        Must run inside the transaction making the changes.
+        """
+        by_office = {}
+        for office_id, queue_id, previous_status, new_status in changes:
+            by_office.setdefault(office_id, []).append((queue_id, previous_status, new_status))
+
+        events = []
+        for office_id, office_changes in by_office.items():
+            last = QueueService._reserve_sequences(shard, office_id, len(office_changes))
+            first = last - len(office_changes) + 1
+            events += [
+                QueueEvent(
+                    office_id=office_id, sequence=first + i, queue_id=queue_id,
+                    previous_status=previous_status, status=new_status
+                )
+                for i, (queue_id, previous_status, new_status) in enumerate(office_changes)
+            ]
+        if events:
+            QueueEvent.objects.using(shard).bulk_create(events)
+
+    @staticmethod
+    def _reserve_sequences(shard, office_id, count):
+        """
+        Take `count` sequence numbers for an office and return the last one.
+
+        The counter row stays locked until the caller's transaction ends, so
+        an office's events commit in sequence order.
+        """
+        counter = QueueEventSequence.objects.using(shard).filter(office_id=office_id)
+        connection = transaction.get_connection(shard)
+        if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+            # Increment and read back in one statement
+            table = connection.ops.quote_name(QueueEventSequence._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {table} SET last_sequence = last_sequence + %s '
+                    f'WHERE office_id = %s RETURNING last_sequence',
+                    [count, office_id]
+                )
+                row = cursor.fetchone()
+            if row:
+                return row[0]
+        elif counter.update(last_sequence=models.F('last_sequence') + count):
+            return counter.values_list('last_sequence', flat=True).get()
+
+        # First event of this office
+        QueueEventSequence.objects.using(shard).get_or_create(office_id=office_id)
+        return QueueService._reserve_sequences(shard, office_id, count)
+
+    @staticmethod
+    def get_citizen_queues(owner):
+        """
+        Get a citizen's active tickets in line order (call_order).
+
+        One lookup on the (owner, status) index per shard. Each ticket is
+        annotated with ahead_count, so estimated_wait_time needs no
+        further queries.
+        """
+        ahead = Queue.objects.filter(
+            LINE_STATUS_Q,
+            service_id=models.OuterRef('service_id'),
+            call_order__lt=models.OuterRef('call_order')
+        ).order_by().values('service_id').annotate(count=models.Count('id')).values('count')
+
+        queues = []
+        for alias in shard_aliases():
+            queues.extend(
+                QueueService._citizen_queues(alias, owner.pk).select_related('service__office').annotate(
+                    ahead_count=Coalesce(models.Subquery(ahead), 0)
+                )
+            )
+        return sorted(queues, key=lambda queue: queue.call_order)
+
+    @staticmethod
+    def _citizen_queues(shard, owner_id):
+        return Queue.objects.using(shard).filter(owner_id=owner_id, status__in=ACTIVE_STATUSES)
+
     @staticmethod
     def get_queue_status(queue_id):
         """
         Get current status of a queue entry.
         """
         try:
-            return Queue.objects.get(id=queue_id)
+            return Queue.objects.using(shard_for_queue(queue_id)).get(id=queue_id)
         except Queue.DoesNotExist:
             raise ValidationError("Queue not found")
 
+    @staticmethod
+    def get_office_queue_status(office):
+        """
+        Get today's counts by status for every active service of an office.
+
+        Returns {service_id: [{'status': ..., 'count': ...}]} from a single
+        grouped query, so office views make no per-service queries.
+        """
+        stats = {}
+        for row in QueueService._office_queue_counts(office):
+            stats.setdefault(row['service_id'], []).append(
+                {'status': row['status'], 'count': row['count']}
+            )
+        return stats
+
+    @staticmethod
+    def _office_queue_counts(office):
+        return Queue.objects.using(shard_for_office(office.id)).filter(
+            service__office=office,
+            service__is_active=True,
+            service_day=office.local_date()
+        ).values('service_id', 'status').annotate(
+            count=models.Count('status')
+        ).order_by('service_id', 'status')
+
+    @staticmethod
+    def get_office_dashboard(office, next_count=None):
+        """
+        Get everything the officer dashboard shows for an office.
+
+        Business Rules:
+        1. Lists every active service with today's counts by status, its
+           called and serving tickets and the next `next_count` waiting
+           (DASHBOARD_NEXT_WAITING by default), in call order
+        2. Takes a fixed number of queries however many services and
+           tickets there are: the tickets come from one query that numbers
+           each service's line with a window function
+        3. The result is cached per office event sequence (the office
+           version), so it is rebuilt only after a ticket changes; entries
+           expire after DASHBOARD_CACHE_SECONDS to pick up booked tickets
+           joining the line and catalog edits
+        """
+        next_count = next_count or settings.DASHBOARD_NEXT_WAITING
+        shard = shard_for_office(office.id)
+        version = QueueEventSequence.objects.using(shard).filter(
+            office_id=office.id
+        ).values_list('last_sequence', flat=True).first() or 0
+        today = office.local_date()
+        cache_key = f'office-dashboard:{office.id}:{today}:{version}:{next_count}'
+        dashboard = cache.get(cache_key)
+        if dashboard is not None:
+            return dashboard
+
+        services = list(Service.objects.filter(office=office, is_active=True))
+        counts = QueueService.get_office_queue_status(office)
+        tickets = Queue.objects.using(shard).filter(
+            models.Q(status__in=['called', 'serving'])
+            | models.Q(status='waiting', queued_at__lte=timezone.now()),
+            service__in=services,
+            service_day=today
+        ).annotate(
+            position=models.Window(
+                RowNumber(),
+                partition_by=[models.F('service_id'), models.F('status')],
+                order_by=models.F('call_order').asc()
+            )
+        ).filter(
+            ~models.Q(status='waiting') | models.Q(position__lte=next_count)
+        ).order_by('service_id', 'call_order').values(
+            'id', 'number', 'citizen_name', 'service_id', 'status', 'priority_class',
+            'called_at', 'started_at', 'called_by', 'served_by'
+        )
+
+        by_service = {service.id: {'active': [], 'next_waiting': []} for service in services}
+        for ticket in tickets:
+            line = 'next_waiting' if ticket['status'] == 'waiting' else 'active'
+            by_service[ticket.pop('service_id')][line].append(ticket)
+
+        dashboard = {
+            'office': {'id': office.id, 'name': office.name, 'code': office.code},
+            'version': version,
+            'services': [
+                {
+                    'service_id': service.id,
+                    'service_name': service.name,
+                    'service_code': service.code,
+                    'queue_stats': counts.get(service.id, []),
+                    **by_service[service.id],
+                }
+                for service in services
+            ],
+        }
+        cache.set(cache_key, dashboard, settings.DASHBOARD_CACHE_SECONDS)
+        return dashboard
+
+    @staticmethod
+    def get_catalog_version():
+        """
+        Get the version of the office and service catalog.
+
+        Reads the row count and latest updated_at of both tables in one
+        query, so any edit, addition or deletion changes the version.
+        """
+        return QueueService._catalog_version(list(QueueService._catalog_stats()))
+
+    @staticmethod
+    def _catalog_stats():
+        def table_stats(model):
+            return model.objects.order_by().annotate(
+                table=models.Value(model._meta.db_table)
+            ).values('table').annotate(rows=models.Count('id'), changed=models.Max('updated_at'))
+
+        return table_stats(Office).union(table_stats(Service), all=True)
+
+    @staticmethod
+    def _catalog_version(rows):
+        rows = sorted(rows, key=lambda row: row['table'])
+        return '.'.join(
+            f"{row['rows']}-{row['changed'].timestamp() if row['changed'] else 0}" for row in rows
+        )
+
+    @staticmethod
+    def get_active_services():
+        """
+        Get all active services with their office preloaded.
+        """
+        return Service.objects.filter(is_active=True).select_related('office')
+
     @staticmethod
     def get_service_queue_status(service_id):
         """
@@ -208,9 +969,66 @@ class QueueService:
 
         Returns counts by status for monitoring.
         """
-        return Queue.objects.filter(
-            service_id=service_id,
-            created_at__date=timezone.now().date()
+        service = Service.objects.select_related('office').filter(id=service_id).first()
+        return QueueService._service_queue_counts(service)
+
+    @staticmethod
+    def _service_queue_counts(service):
+        if service is None:
+            return Queue.objects.none().values('status')
+        # "Today" is the office's local service day
+        return Queue.objects.using(shard_for_office(service.office_id)).filter(
+            service=service,
+            service_day=service.office.local_date()
         ).values('status').annotate(
             count=models.Count('status')
-        )
\ No newline at end of file
+        )
+
+    # Async counterparts used by the ASGI views. They share the querysets
+    # above and run them through Django's async ORM interface.
+
+    @staticmethod
+    async def aget_queue_status(queue_id):
+        """
+        Async version of get_queue_status, with service and office preloaded.
+        """
+        try:
+            return await Queue.objects.using(shard_for_queue(queue_id)).select_related(
+                'service__office'
+            ).aget(id=queue_id)
+        except Queue.DoesNotExist:
+            raise ValidationError("Queue not found")
+
+    @staticmethod
+    async def aget_catalog_version():
+        """
+        Async version of get_catalog_version.
+        """
+        return QueueService._catalog_version([row async for row in QueueService._catalog_stats()])
+
+    @staticmethod
+    async def aget_active_services():
+        """
+        Async version of get_active_services, evaluated to a list.
+        """
+        return [service async for service in QueueService.get_active_services()]
+
+    @staticmethod
+    async def aget_service_queue_status(service_id):
+        """
+        Async version of get_service_queue_status, evaluated to a list.
+        """
+        service = await Service.objects.select_related('office').filter(id=service_id).afirst()
+        return [row async for row in QueueService._service_queue_counts(service)]
+
+    @staticmethod
+    async def aget_office_queue_status(office):
+        """
+        Async version of get_office_queue_status.
+        """
+        stats = {}
+        async for row in QueueService._office_queue_counts(office):
+            stats.setdefault(row['service_id'], []).append(
+                {'status': row['status'], 'count': row['count']}
+            )
+        return stats
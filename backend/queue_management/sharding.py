@@ -0,0 +1,170 @@
+"""
+Office-based sharding of queue data.
+
+When QUEUE_SHARDS is configured, each office's tickets (Queue), daily
+counters (ServiceDailyStats), event log (QueueEvent), SMS outbox
+(Notification) and appointment slots (AppointmentSlot) live on one shard
+database, so a busy office only loads its own shard. The catalog (Office,
+Service) stays on the default database and is copied to every shard when
+saved, so queue rows keep real foreign keys and can join their service and
+office locally. Users, slot templates and everything else stay on the
+default database.
+
+Placement:
+- An office goes to the shard named for it in QUEUE_SHARD_MAP, otherwise
+  to QUEUE_SHARD_ALIASES[office_id % number of shards].
+- Queue ids are allocated in one range per shard (shard i hands out ids
+  i * SHARD_ID_SPAN + 1 onwards), so the shard of any ticket follows from
+  its id and URLs keep using plain queue ids.
+
+Without QUEUE_SHARDS every lookup returns None, which means "let the
+routers decide" (the default database, or the read replica inside
+replica_reads blocks), so single-database deployments are unchanged.
+
+Moving an office between shards, or a service between offices on
+different shards, does not move existing tickets.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Ids per shard; far above any realistic number of tickets per shard
+SHARD_ID_SPAN = 10 ** 12
+
+SHARDED_MODELS = {
+    'queue', 'servicedailystats', 'queueevent', 'queueeventsequence', 'notification', 'appointmentslot'
+}
+CATALOG_MODELS = {'office', 'service'}
+
+
+def shard_aliases():
+    """Database aliases of all shards, or [None] without sharding."""
+    return settings.QUEUE_SHARD_ALIASES or [None]
+
+
+def is_sharded():
+    return bool(settings.QUEUE_SHARD_ALIASES)
+
+
+def shard_for_office(office_id):
+    """Database alias holding an office's queue data."""
+    if not is_sharded():
+        return None
+    aliases = settings.QUEUE_SHARD_ALIASES
+    return settings.QUEUE_SHARD_MAP.get(office_id) or aliases[office_id % len(aliases)]
+
+
+def shard_for_queue(queue_id):
+    """Database alias holding a ticket, derived from its id range."""
+    if not is_sharded():
+        return None
+    aliases = settings.QUEUE_SHARD_ALIASES
+    index = (int(queue_id) - 1) // SHARD_ID_SPAN
+    return aliases[min(max(index, 0), len(aliases) - 1)]
+
+
+class ShardRouter:
+    """
+    Route queue data reached through model instances to its office's shard.
+
+    QueueService passes the shard explicitly with .using(); this router
+    covers the rest: related managers (service.queues), saving loaded
+    instances, and relations between shard rows and catalog rows.
+    """
+
+    def _shard_for_hint(self, model, instance):
+        if not is_sharded() or model._meta.model_name not in SHARDED_MODELS or instance is None:
+            return None
+        name = instance._meta.model_name
+        if name == 'office':
+            return shard_for_office(instance.pk)
+        if name == 'service':
+            return shard_for_office(instance.office_id)
+        if name in SHARDED_MODELS:
+            return instance._state.db
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard_for_hint(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._shard_for_hint(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The catalog is copied to every shard, so shard rows may point at it
+        names = {obj1._meta.model_name, obj2._meta.model_name}
+        if is_sharded() and names & CATALOG_MODELS and names <= CATALOG_MODELS | SHARDED_MODELS:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Every shard gets the full schema
+        return None
+
+
+def replicate_catalog(sender, instance, using, raw=False, **kwargs):
+    """post_save receiver copying an Office or Service to every shard."""
+    if raw or not is_sharded() or using != 'default':
+        return
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in sender._meta.concrete_fields if not field.primary_key
+    }
+    for alias in settings.QUEUE_SHARD_ALIASES:
+        if alias != 'default':
+            sender.objects.using(alias).update_or_create(pk=instance.pk, defaults=values)
+
+
+def delete_replicated_catalog(sender, instance, using, **kwargs):
+    """post_delete receiver removing an Office or Service from every shard."""
+    if not is_sharded() or using != 'default':
+        return
+    for alias in settings.QUEUE_SHARD_ALIASES:
+        if alias != 'default':
+            sender.objects.using(alias).filter(pk=instance.pk).delete()
+
+
+def sync_catalog():
+    """Copy every Office and Service to every shard (e.g. after adding a shard)."""
+    from .models import Office, Service
+
+    for model in (Office, Service):
+        for instance in model.objects.using('default').all():
+            replicate_catalog(model, instance, using='default')
+
+
+def reserve_id_range(alias):
+    """Start the shard's Queue id sequence at the beginning of its range."""
+    from .models import Queue
+
+    start = settings.QUEUE_SHARD_ALIASES.index(alias) * SHARD_ID_SPAN
+    if start == 0:
+        return
+    connection = connections[alias]
+    table = Queue._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # Django creates SQLite primary keys with AUTOINCREMENT
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+            elif row[0] < start:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [start, table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                [table, start]
+            )
+        else:
+            logger.warning("Cannot reserve a Queue id range on %s (%s)", alias, connection.vendor)
+
+
+def reserve_id_ranges(sender, using, **kwargs):
+    """post_migrate receiver reserving id ranges on shard databases."""
+    if sender.name == 'queue_management' and using in settings.QUEUE_SHARD_ALIASES:
+        reserve_id_range(using)
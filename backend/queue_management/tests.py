@@ -1,11 +1,42 @@
+import gzip
+import json
+import logging
+import tempfile
+import unittest
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.handlers.asgi import ASGIHandler
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
+from django.utils.http import http_date
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import AccessToken
 
 from accounts.models import User
-from queue_management.models import Office, Service, Queue
+from queue_management.models import (
+    AppointmentSlot, Notification, Office, Service, SlotTemplate, Queue, QueueEvent, QueueEventSequence,
+    ServiceDailyStats
+)
+from queue_management import async_views, notifications, sharding
+from queue_management.benchmarking import LatencyRecorder, percentile
+from queue_management.services import QueueService
+from queue_management import urls as queue_urls
+from queue_system import metrics, slow_queries
+from queue_system.slow_queries import slow_query_wrapper
+from queue_system.log import JsonFormatter, QueuedHandler, RequestIdFilter, SamplingFilter
+from queue_system.routers import ReplicaRouter, ReplicaStickinessMiddleware, is_pinned_to_primary, replica_reads
+from queue_system.testing import QueryBudgetMixin
+from queue_system.warmup import warm_up
 
 
 class QueueManagementAPITests(APITestCase):
@@ -83,6 +114,19 @@ class QueueManagementAPITests(APITestCase):
         })
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
 
+    def test_create_office_rejects_unknown_timezone(self):
+        self.auth('admin')
+        for value in ('Mars/Olympus', '../etc/passwd'):
+            res = self.client.post(reverse('office-list'), {
+                'name': 'New Office', 'code': 'NO', 'address': 'Addr', 'timezone': value
+            })
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST, value)
+
+        res = self.client.post(reverse('office-list'), {
+            'name': 'New Office', 'code': 'NO', 'address': 'Addr', 'timezone': 'Africa/Addis_Ababa'
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
     # ---------- QUEUE CREATION ----------
     def test_citizen_create_queue(self):
         self.auth('citizen')
@@ -92,7 +136,7 @@ class QueueManagementAPITests(APITestCase):
 
     def test_queue_capacity_limit(self):
         self.auth('citizen')
-        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        today = self.office.local_date()
 
         Queue.objects.bulk_create([
             Queue(
@@ -100,13 +144,22 @@ class QueueManagementAPITests(APITestCase):
                 service=self.service,
                 number=i + 1,
                 status='waiting',
-                created_at=today
+                service_day=today
             ) for i in range(999)
         ])
 
         res = self.create_queue('Overflow')
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_numbers_restart_each_service_day(self):
+        # Ticket 1 from yesterday (office local time) is still open
+        yesterday = QueueService.create_queue('Yesterday', self.service.id)
+        Queue.objects.filter(pk=yesterday.pk).update(service_day=yesterday.service_day - timedelta(days=1))
+
+        res = self.create_queue('Today')
+        self.assertEqual(res.data['queue_number'], 1)
+        self.assertEqual(Queue.objects.get(id=res.data['queue_id']).service_day, self.office.local_date())
+
     def test_officer_cannot_create_queue(self):
         self.auth('officer')
         res = self.create_queue()
@@ -148,3 +201,1434 @@ class QueueManagementAPITests(APITestCase):
         q = self.create_queue('Cancel').data['queue_id']
         res = self.client.post(reverse('cancel-queue', args=[q]))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    # ---------- OWNERSHIP ----------
+    def test_citizen_lists_own_active_queues(self):
+        mine = self.create_queue('Mine').data['queue_id']
+        QueueService.create_queue('Walk-in', self.service.id)
+        cancelled = self.create_queue('Cancelled').data['queue_id']
+        self.client.post(reverse('cancel-queue', args=[cancelled]))
+
+        res = self.client.get(reverse('my-queues'))
+        self.assertEqual([q['queue_id'] for q in res.data], [mine])
+        self.assertEqual(res.data[0]['estimated_wait_time'], 0)
+
+    def test_citizen_cannot_touch_other_citizens_queue(self):
+        other = QueueService.create_queue('Other', self.service.id).id
+        res = self.client.get(reverse('queue-status', args=[other]))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        res = self.client.post(reverse('cancel-queue', args=[other]))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Queue.objects.get(id=other).status, 'waiting')
+
+    @override_settings(MAX_ACTIVE_TICKETS_PER_CITIZEN=2)
+    def test_active_ticket_limit_per_citizen(self):
+        first = self.create_queue('One').data['queue_id']
+        self.create_queue('Two')
+        self.assertEqual(self.create_queue('Three').status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Finished tickets no longer count
+        self.client.post(reverse('cancel-queue', args=[first]))
+        self.assertEqual(self.create_queue('Three').status_code, status.HTTP_201_CREATED)
+
+
+class NoShowSweepTests(TestCase):
+
+    def setUp(self):
+        self.office = Office.objects.create(name='Sweep Office', code='SO', address='Addr')
+        self.fast = Service.objects.create(
+            name='Fast', code='FAST', service_type='other', office=self.office, call_timeout=2
+        )
+        self.slow = Service.objects.create(
+            name='Slow', code='SLOW', service_type='other', office=self.office, call_timeout=10
+        )
+
+    def called(self, service, minutes_ago, number):
+        return Queue.objects.create(
+            citizen_name=f'C{number}', service=service, number=number, status='called',
+            called_at=timezone.now() - timedelta(minutes=minutes_ago)
+        )
+
+    def test_expires_only_overdue_calls_per_service_timeout(self):
+        overdue_fast = self.called(self.fast, 5, 1)
+        recent_fast = self.called(self.fast, 1, 2)
+        within_slow = self.called(self.slow, 5, 1)
+
+        self.assertEqual(QueueService.expire_overdue_calls(), 1)
+
+        overdue_fast.refresh_from_db()
+        recent_fast.refresh_from_db()
+        within_slow.refresh_from_db()
+        self.assertEqual(overdue_fast.status, 'no_show')
+        self.assertEqual(recent_fast.status, 'called')
+        self.assertEqual(within_slow.status, 'called')
+
+    def test_sweeps_in_bounded_batches(self):
+        for number in range(1, 8):
+            self.called(self.fast, 30, number)
+
+        self.assertEqual(QueueService.expire_overdue_calls(batch_size=3), 7)
+        self.assertFalse(Queue.objects.filter(status='called').exists())
+
+
+class DayCloseTests(TestCase):
+
+    def setUp(self):
+        self.office = Office.objects.create(
+            name='Close Office', code='CO', address='Addr', timezone='Africa/Addis_Ababa'
+        )
+        self.service = Service.objects.create(
+            name='Close Service', code='CLOSE', service_type='other', office=self.office
+        )
+
+    def ticket(self, status, days_ago, number):
+        created_at = timezone.now() - timedelta(days=days_ago)
+        queue = Queue.objects.create(
+            citizen_name=f'C{number}', service=self.service, number=number, status=status,
+            service_day=self.office.local_date(created_at)
+        )
+        Queue.objects.filter(pk=queue.pk).update(created_at=created_at)
+        return queue
+
+    def test_closes_previous_days_and_records_stats(self):
+        self.ticket('waiting', 1, 1)
+        self.ticket('waiting', 1, 2)
+        self.ticket('called', 1, 3)
+        today = self.ticket('waiting', 0, 1)
+
+        totals = QueueService.close_service_day(self.office, batch_size=1)
+
+        self.assertEqual(totals, {'cancelled': 2, 'no_show': 1})
+        self.assertEqual(Queue.objects.get(pk=today.pk).status, 'waiting')
+        stats = ServiceDailyStats.objects.get(service=self.service)
+        self.assertEqual(stats.day, self.office.local_date() - timedelta(days=1))
+        self.assertEqual(stats.cancelled_at_close, 2)
+        self.assertEqual(stats.no_show_at_close, 1)
+
+    def test_rerun_is_a_no_op(self):
+        self.ticket('waiting', 2, 1)
+        QueueService.close_service_day(self.office)
+
+        self.assertEqual(
+            QueueService.close_service_day(self.office),
+            {'cancelled': 0, 'no_show': 0}
+        )
+        self.assertEqual(ServiceDailyStats.objects.get().cancelled_at_close, 1)
+
+
+class ServiceDayMigrationTests(TransactionTestCase):
+    """Backfilling service_day must not break the per-day unique ticket numbers."""
+
+    before = [('queue_management', '0006_queue_owner')]
+    after = [('queue_management', '0008_service_day_indexes')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        self.addCleanup(self.migrate_to_latest)
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_legacy_numbers_survive_backfill(self):
+        apps = self.executor.loader.project_state(self.before).apps
+        Office, Service, Queue = (
+            apps.get_model('queue_management', name) for name in ('Office', 'Service', 'Queue')
+        )
+        office = Office.objects.create(name='Legacy', code='LEG', address='Addr', timezone='Africa/Addis_Ababa')
+        service = Service.objects.create(name='Legacy', code='LEGS', service_type='other', office=office)
+        utc = dt_timezone.utc
+        legacy = [
+            # Number 1 on two UTC dates that are the same local (UTC+3) date
+            (1, datetime(2026, 1, 1, 22, 30, tzinfo=utc)),
+            (1, datetime(2026, 1, 2, 5, 0, tzinfo=utc)),
+            # A number repeated by a race in the old, unconstrained numbering
+            (2, datetime(2026, 1, 2, 6, 0, tzinfo=utc)),
+            (2, datetime(2026, 1, 2, 6, 1, tzinfo=utc)),
+        ]
+        ids = []
+        for number, created_at in legacy:
+            queue = Queue.objects.create(citizen_name='Legacy', service=service, number=number)
+            Queue.objects.filter(pk=queue.pk).update(created_at=created_at)
+            ids.append(queue.pk)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        Queue = executor.loader.project_state(self.after).apps.get_model('queue_management', 'Queue')
+
+        rows = Queue.objects.filter(id__in=ids).order_by('id').values_list('service_day', 'number')
+        self.assertEqual(list(rows), [
+            (date(2026, 1, 1), 1), (date(2026, 1, 2), 1), (date(2026, 1, 2), 2), (date(2026, 1, 2), 3),
+        ])
+
+
+class AsyncReadViewTests(TestCase):
+    # Reads may go to the replica alias when one is configured
+    databases = '__all__'
+
+    def setUp(self):
+        self.office = Office.objects.create(name='Async Office', code='AO', address='Addr')
+        self.other_office = Office.objects.create(name='Other Office', code='OO', address='Addr')
+        self.service = Service.objects.create(
+            name='Async Service', code='ASYNC', service_type='other', office=self.office
+        )
+        self.citizen = User.objects.create_user(username='async_citizen', password='pw', role='citizen')
+        self.officer = User.objects.create_user(
+            username='async_officer', password='pw', role='officer', office=self.other_office
+        )
+        self.queue = QueueService.create_queue('Async Citizen', self.service.id, owner=self.citizen)
+        QueueService.create_queue('Second Citizen', self.service.id)
+        self.factory = AsyncRequestFactory()
+
+    def get(self, path, user=None):
+        headers = {}
+        if user:
+            headers['Authorization'] = f'Bearer {AccessToken.for_user(user)}'
+        return self.factory.get(path, headers=headers)
+
+    async def test_queue_status_matches_sync_payload(self):
+        queue_id = self.queue.id
+        response = await async_views.queue_status(self.get('/', self.citizen), queue_id=queue_id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        self.assertEqual(data['queue_id'], queue_id)
+        self.assertEqual(data['service'], 'Async Service')
+        self.assertEqual(data['estimated_wait_time'], 0)
+
+    async def test_requires_authentication(self):
+        response = await async_views.service_list(self.get('/'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_officer_limited_to_own_office(self):
+        response = await async_views.office_queue_status(
+            self.get('/', self.officer), office_id=self.office.id
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_office_queue_status_groups_counts(self):
+        admin = await User.objects.acreate(username='async_admin', role='admin')
+        response = await async_views.office_queue_status(self.get('/', admin), office_id=self.office.id)
+        data = json.loads(response.content)
+        self.assertEqual(data['services'][0]['queue_stats'], [{'status': 'waiting', 'count': 2}])
+
+    async def test_service_list_conditional_get(self):
+        first = await async_views.service_list(self.get('/', self.citizen))
+        request = self.get('/', self.citizen)
+        request.META['HTTP_IF_NONE_MATCH'] = first['ETag']
+        response = await async_views.service_list(request)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_sparse_fieldset(self):
+        response = await async_views.service_list(self.get('/?fields=code,office.code', self.citizen))
+        self.assertEqual(json.loads(response.content), [{'code': 'ASYNC', 'office': {'code': 'AO'}}])
+
+
+class AsyncMiddlewareTests(TestCase):
+    """The middleware stack under ASGI, as settings.py builds it with ASYNC_READ_VIEWS."""
+
+    STACK = [path for path in settings.MIDDLEWARE if path != 'whitenoise.middleware.WhiteNoiseMiddleware']
+
+    def setUp(self):
+        metrics.reset()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        stack_settings = override_settings(
+            MIDDLEWARE=self.STACK, PROFILER_ENABLED=True, PROFILER_DIR=directory.name
+        )
+        stack_settings.enable()
+        self.addCleanup(stack_settings.disable)
+        self.admin = User.objects.create_user(username='async_stack_admin', password='pw', role='admin')
+
+    def test_stack_needs_no_thread_adaptation(self):
+        # Django logs every sync middleware it has to wrap for an async handler
+        with self.settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler().load_middleware(is_async=True)
+
+    async def test_request_through_async_stack(self):
+        handler = ASGIHandler()
+        handler.load_middleware(is_async=True)
+        request = AsyncRequestFactory().get(reverse('service-list'), headers={
+            'Authorization': f'Bearer {AccessToken.for_user(self.admin)}', 'X-Profile': '1'
+        })
+        response = await handler.get_response_async(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Request-ID'], request.request_id)
+        with open(f"{settings.PROFILER_DIR}/{response['X-Profile-Id']}.json") as f:
+            capture = json.load(f)
+        self.assertTrue(any('queue_management_service' in q['sql'] for q in capture['queries']))
+        lines = metrics._request_metric_lines()
+        self.assertIn('http_requests_total{route="api/services/",method="GET",status="200"} 1.0', lines)
+        # Queries of the sync view's thread are counted too (plus the
+        # profiler's own admin lookup, made before its capture starts)
+        counted = next(line for line in lines if line.startswith('db_queries_per_request_sum{route="api/services/"}'))
+        self.assertGreaterEqual(int(counted.split()[-1]), capture['query_count'])
+        self.assertGreater(capture['query_count'], 0)
+
+# Stickiness pins need a cache every worker process can see
+@override_settings(
+    REPLICA_DATABASE_ALIAS='replica', REPLICA_STICKY_SECONDS=60,
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': f'{tempfile.gettempdir()}/queue-replica-test-cache',
+    }}
+)
+class ReplicaRoutingTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.office = Office.objects.create(name='Replica Office', code='RO', address='Addr')
+        self.service = Service.objects.create(
+            name='Replica Service', code='REP', service_type='other', office=self.office
+        )
+        self.citizen = User.objects.create_user(username='replica_citizen', password='pw', role='citizen')
+
+    def test_reads_use_replica_only_inside_block(self):
+        self.assertIsNone(self.router.db_for_read(Queue))
+        with replica_reads(self.citizen):
+            self.assertEqual(self.router.db_for_read(Queue), 'replica')
+            self.assertIsNone(self.router.db_for_write(Queue))
+        self.assertIsNone(self.router.db_for_read(Queue))
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'queue_management'))
+        self.assertIsNone(self.router.allow_migrate('default', 'queue_management'))
+
+    def test_write_pins_user_to_primary(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.citizen)}')
+        res = self.client.post(
+            reverse('create-queue'),
+            {'citizen_name': 'Replica', 'service_id': self.service.id},
+            format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(is_pinned_to_primary(self.citizen))
+
+        with replica_reads(self.citizen):
+            self.assertIsNone(self.router.db_for_read(Queue))
+
+    def test_process_local_cache_is_rejected(self):
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            with self.assertRaises(ImproperlyConfigured):
+                ReplicaStickinessMiddleware(lambda request: HttpResponse())
+            with self.settings(DEBUG=True):
+                ReplicaStickinessMiddleware(lambda request: HttpResponse())
+
+
+class LoggingPipelineTests(APITestCase):
+
+    def record(self, level=logging.INFO, **extra):
+        record = logging.makeLogRecord({
+            'name': 'queue_management', 'levelno': level,
+            'levelname': logging.getLevelName(level), 'msg': 'Called %s', 'args': (7,),
+        })
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter_includes_request_id_and_extras(self):
+        record = self.record(service_id=3)
+        RequestIdFilter().filter(record)
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data['message'], 'Called 7')
+        self.assertEqual(data['request_id'], '-')
+        self.assertEqual(data['service_id'], 3)
+
+    def test_sampling_never_drops_warnings(self):
+        sampler = SamplingFilter(rate=0.0, level='INFO')
+        self.assertFalse(sampler.filter(self.record(logging.DEBUG)))
+        self.assertFalse(sampler.filter(self.record(logging.INFO)))
+        self.assertTrue(sampler.filter(self.record(logging.WARNING)))
+        self.assertTrue(sampler.filter(self.record(logging.INFO, sample_rate=1.0)))
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = QueuedHandler('logging.NullHandler', queue_size=1)
+        handler._stop_listener()
+        handler.handle(self.record())
+        handler.handle(self.record())
+        self.assertEqual(handler.dropped, 1)
+        handler.target.close()
+
+    def test_response_carries_request_id(self):
+        res = self.client.get('/', HTTP_X_REQUEST_ID='kiosk-42')
+        self.assertEqual(res['X-Request-ID'], 'kiosk-42')
+        res = self.client.get('/', HTTP_X_REQUEST_ID='bad id\n')
+        self.assertEqual(len(res['X-Request-ID']), 32)
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsEndpointTests(APITestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.office = Office.objects.create(name='Metrics Office', code='MO', address='Addr')
+        self.service = Service.objects.create(
+            name='Metrics Service', code='TS', service_type='other', office=self.office
+        )
+        self.citizen = User.objects.create_user(username='metrics_citizen', password='pw', role='citizen')
+
+    def scrape(self):
+        return self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret').content.decode()
+
+    def test_records_route_latency_and_queries(self):
+        self.client.force_authenticate(self.citizen)
+        self.client.post(
+            reverse('create-queue'),
+            {'citizen_name': 'Metric', 'service_id': self.service.id},
+            format='json'
+        )
+        body = self.scrape()
+
+        route = 'api/queues/create/'
+        self.assertIn(f'http_requests_total{{route="{route}",method="POST",status="201"}} 1', body)
+        self.assertIn(f'http_request_duration_seconds_count{{route="{route}",method="POST"}} 1', body)
+        self.assertIn(f'db_queries_per_request_bucket{{route="{route}",le="+Inf"}} 1', body)
+        self.assertIn('queue_waiting_tickets{service="TS"} 1', body)
+
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        res = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(res.status_code, 401)
+        res = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_not_served_without_token_unless_debug(self):
+        res = self.client.get(reverse('metrics'))
+        self.assertEqual(res.status_code, 403)
+        self.assertNotIn('queue_waiting_tickets', res.content.decode())
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_no_show_ratio(self):
+        Queue.objects.create(citizen_name='A', service=self.service, number=1, status='no_show')
+        Queue.objects.create(citizen_name='B', service=self.service, number=2, status='completed')
+        body = self.scrape()
+        self.assertIn('queue_no_show_ratio{service="TS"} 0.5', body)
+
+
+class ProfilerTests(APITestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profiler_settings = override_settings(
+            PROFILER_ENABLED=True, PROFILER_DIR=directory.name, PROFILER_MAX_CAPTURES=2
+        )
+        profiler_settings.enable()
+        self.addCleanup(profiler_settings.disable)
+        # Middleware is built on the first request, after the override
+        self.client = self.client_class()
+
+        self.admin = User.objects.create_user(username='profile_admin', password='pw', role='admin')
+        self.citizen = User.objects.create_user(username='profile_citizen', password='pw', role='citizen')
+
+    def get_services(self, user):
+        return self.client.get(
+            reverse('service-list'), HTTP_X_PROFILE='1',
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}'
+        )
+
+    def test_admin_header_captures_profile_and_sql(self):
+        capture_id = self.get_services(self.admin)['X-Profile-Id']
+
+        self.client.force_authenticate(self.admin)
+        detail = self.client.get(reverse('profile-detail', args=[capture_id])).data
+        self.assertEqual(detail['path'], reverse('service-list'))
+        self.assertEqual(detail['trigger'], 'header')
+        self.assertTrue(any('queue_management_service' in q['sql'] for q in detail['queries']))
+
+        res = self.client.get(reverse('profile-detail', args=[capture_id]), {'download': '1'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Disposition'].endswith(f'{capture_id}.prof"'))
+
+    def test_header_ignored_for_non_admins(self):
+        res = self.get_services(self.citizen)
+        self.assertNotIn('X-Profile-Id', res)
+
+        self.client.force_authenticate(self.citizen)
+        self.assertEqual(self.client.get(reverse('profile-list')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_ring_buffer_keeps_newest_captures(self):
+        ids = [self.get_services(self.admin)['X-Profile-Id'] for _ in range(3)]
+
+        self.client.force_authenticate(self.admin)
+        listed = [capture['id'] for capture in self.client.get(reverse('profile-list')).data]
+        self.assertEqual(sorted(listed), sorted(ids[1:]))
+
+
+class SlowQueryLogTests(APITestCase):
+
+    def setUp(self):
+        slow_queries.reset()
+        office = Office.objects.create(name='Slow Office', code='SO', address='Addr')
+        self.service = Service.objects.create(
+            name='Slow Service', code='SS', service_type='other', office=office
+        )
+
+    def test_fingerprint_ignores_literals_and_in_list_length(self):
+        a, key_a = slow_queries.fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND name = 'x' LIMIT 21")
+        b, key_b = slow_queries.fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'y' LIMIT 5")
+        self.assertEqual(a, 'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?')
+        self.assertEqual(key_a, key_b)
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_records_call_site_and_flags_scan_without_index(self):
+        with self.assertLogs('queue_system.slow_queries', 'WARNING'):
+            for _ in range(2):
+                list(Queue.objects.filter(service=self.service, created_at__date=timezone.localdate()))
+            list(Queue.objects.filter(citizen_name='Nobody'))
+
+        entries = {entry['sql']: entry for entry in slow_queries.report()}
+        by_name = next(entry for sql, entry in entries.items() if '"citizen_name" = ?' in sql)
+        self.assertTrue(by_name['full_scan'])
+        self.assertIn('SCAN', by_name['plan'])
+
+        by_date = next(entry for sql, entry in entries.items() if 'django_datetime_cast_date' in sql)
+        self.assertEqual(by_date['count'], 2)
+        [site] = by_date['call_sites']
+        self.assertTrue(site.startswith('queue_management.tests:test_records_call_site'))
+
+    def test_connection_opened_inside_execute_wrapper_block_keeps_wrapper_stack(self):
+        connection = connections['default']
+        if slow_query_wrapper in connection.execute_wrappers:
+            connection.execute_wrappers.remove(slow_query_wrapper)
+        original = list(connection.execute_wrappers)
+
+        for _ in range(3):
+            with connection.execute_wrapper(lambda execute, *args: execute(*args)):
+                # What Django does when the block's first query opens the connection
+                connection_created.send(sender=connection.__class__, connection=connection)
+
+        self.assertEqual(connection.execute_wrappers, [slow_query_wrapper] + original)
+
+
+class WarmUpTests(TestCase):
+
+    def test_runs_every_step(self):
+        self.assertEqual(
+            set(warm_up()), {'urls', 'api_settings', 'serializers', 'database', 'catalog'}
+        )
+
+    def test_skips_database_before_fork(self):
+        with self.assertNumQueries(0):
+            self.assertNotIn('database', warm_up(database=False))
+
+
+class QueueEventTests(TestCase):
+
+    def setUp(self):
+        self.office = Office.objects.create(name='Event Office', code='EO', address='Addr')
+        self.service = Service.objects.create(
+            name='Event Service', code='ES', service_type='other', office=self.office
+        )
+
+    def test_transitions_append_ordered_events(self):
+        queue = QueueService.create_queue('Eve', self.service.id)
+        QueueService.call_next_queue('Officer', self.service.id)
+        QueueService.start_service(queue.id, 'Officer')
+        QueueService.complete_service(queue.id)
+
+        events = QueueService.read_events(self.office.id)
+        self.assertEqual([event.sequence for event in events], [1, 2, 3, 4])
+        self.assertEqual(
+            [(event.previous_status, event.status) for event in events],
+            [('', 'waiting'), ('waiting', 'called'), ('called', 'serving'), ('serving', 'completed')]
+        )
+
+    def test_read_events_after_cursor_in_batches(self):
+        for i in range(5):
+            QueueService.create_queue(f'Citizen {i}', self.service.id)
+
+        first = QueueService.read_events(self.office.id, limit=3)
+        rest = QueueService.read_events(self.office.id, after=first[-1].sequence, limit=3)
+        self.assertEqual([event.sequence for event in first + rest], [1, 2, 3, 4, 5])
+        self.assertEqual(QueueService.read_events(self.office.id, after=5), [])
+
+    def test_batch_jobs_record_events(self):
+        queue = QueueService.create_queue('Late', self.service.id)
+        Queue.objects.filter(pk=queue.pk).update(
+            status='called', called_at=timezone.now() - timedelta(hours=1)
+        )
+        QueueService.expire_overdue_calls()
+
+        last = QueueEvent.objects.filter(office=self.office).last()
+        self.assertEqual((last.queue_id, last.previous_status, last.status), (queue.id, 'called', 'no_show'))
+
+
+class OfficeChangesTests(APITestCase):
+
+    def setUp(self):
+        self.office = Office.objects.create(name='Sync Office', code='SYO', address='Addr')
+        self.service = Service.objects.create(
+            name='Sync Service', code='SYS', service_type='other', office=self.office
+        )
+        self.officer = User.objects.create_user(
+            username='sync_officer', password='pw', role='officer', office=self.office
+        )
+        self.client.force_authenticate(self.officer)
+        self.url = reverse('office-changes', args=[self.office.id])
+
+    def test_returns_only_tickets_changed_after_cursor(self):
+        first = QueueService.create_queue('First', self.service.id)
+        second = QueueService.create_queue('Second', self.service.id)
+        res = self.client.get(self.url)
+        self.assertEqual([t['queue_id'] for t in res.data['changes']], [first.id, second.id])
+
+        cursor = res.data['cursor']
+        QueueService.call_next_queue('Officer', self.service.id)
+        QueueService.start_service(first.id, 'Officer')
+        res = self.client.get(self.url, {'since': cursor})
+        # Called and then started: one entry with the current state
+        self.assertEqual(
+            [(t['queue_id'], t['status']) for t in res.data['changes']], [(first.id, 'serving')]
+        )
+        self.assertEqual(res.data['cursor'], cursor + 2)
+
+        res = self.client.get(self.url, {'since': res.data['cursor']})
+        self.assertEqual((res.data['changes'], res.data['has_more']), ([], False))
+
+    def test_priority_change_carries_the_new_call_order(self):
+        first = QueueService.create_queue('First', self.service.id)
+        second = QueueService.create_queue('Second', self.service.id)
+        cursor = self.client.get(self.url).data['cursor']
+
+        self.client.post(reverse('set-priority', args=[second.id]), {'priority_class': 'elderly'}, format='json')
+        res = self.client.get(self.url, {'since': cursor})
+
+        [change] = res.data['changes']
+        self.assertEqual((change['queue_id'], change['priority_class']), (second.id, 'elderly'))
+        self.assertLess(change['call_order'], Queue.objects.get(pk=first.pk).call_order)
+
+    def test_pages_with_has_more(self):
+        for i in range(3):
+            QueueService.create_queue(f'Citizen {i}', self.service.id)
+        res = self.client.get(self.url, {'limit': 2})
+        self.assertTrue(res.data['has_more'])
+        res = self.client.get(self.url, {'since': res.data['cursor'], 'limit': 2})
+        self.assertEqual(len(res.data['changes']), 1)
+
+    def test_rejects_invalid_limit(self):
+        for limit in ('-1', '0', 'ten', '1.5'):
+            res = self.client.get(self.url, {'limit': limit})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST, limit)
+
+    @override_settings(QUEUE_EVENT_BATCH_SIZE=2)
+    def test_limit_is_capped_at_batch_size(self):
+        for i in range(3):
+            QueueService.create_queue(f'Citizen {i}', self.service.id)
+        res = self.client.get(self.url, {'limit': 1000})
+        self.assertEqual((len(res.data['changes']), res.data['has_more']), (2, True))
+
+    def test_officer_limited_to_own_office(self):
+        other = Office.objects.create(name='Other Sync Office', code='SYX', address='Addr')
+        res = self.client.get(reverse('office-changes', args=[other.id]))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AppointmentTests(APITestCase):
+
+    def setUp(self):
+        self.office = Office.objects.create(name='Booking Office', code='BO', address='Addr')
+        self.service = Service.objects.create(
+            name='Booking Service', code='BOOK', service_type='other', office=self.office,
+            estimated_duration=15
+        )
+        self.tomorrow = self.office.local_date() + timedelta(days=1)
+        # Two 30-minute slots tomorrow, each taking 2 citizens at one counter
+        SlotTemplate.objects.create(
+            service=self.service, weekday=self.tomorrow.weekday(),
+            start_time=time(9, 0), end_time=time(10, 0), slot_minutes=30, counters=1
+        )
+        QueueService.generate_appointment_slots(self.office, days=2)
+        self.slot = AppointmentSlot.objects.order_by('start').first()
+
+        self.citizen = User.objects.create_user(username='booking_citizen', password='pw', role='citizen')
+        self.client.force_authenticate(self.citizen)
+
+    def book(self, name='Booked'):
+        return self.client.post(reverse('book-appointment'), {
+            'citizen_name': name, 'service_id': self.service.id, 'slot_id': self.slot.id
+        }, format='json')
+
+    def test_generates_slots_from_templates(self):
+        self.assertEqual(QueueService.generate_appointment_slots(self.office, days=2), 2)
+        self.assertEqual(
+            list(AppointmentSlot.objects.values_list('capacity', 'booked')), [(2, 0), (2, 0)]
+        )
+        res = self.client.get(reverse('service-slots', args=[self.service.id]), {'date': self.tomorrow})
+        self.assertEqual([slot['available'] for slot in res.data], [2, 2])
+
+    def test_booking_never_oversells_a_slot(self):
+        self.assertEqual(self.book('First').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.book('Second').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.book('Third').status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.booked, 2)
+        res = self.client.get(reverse('service-slots', args=[self.service.id]), {'date': self.tomorrow})
+        self.assertEqual(len(res.data), 1)
+
+    def test_non_integer_slot_id_is_rejected(self):
+        for slot_id in ('abc', '1.5', ['1']):
+            res = self.client.post(reverse('book-appointment'), {
+                'citizen_name': 'Booked', 'service_id': self.service.id, 'slot_id': slot_id
+            }, format='json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST, slot_id)
+
+    def test_cancelling_a_booking_frees_its_place(self):
+        queue_id = self.book().data['queue_id']
+        self.client.post(reverse('cancel-queue', args=[queue_id]))
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.booked, 0)
+
+    def test_booked_citizen_joins_the_line_at_slot_time(self):
+        booked = Queue.objects.get(id=self.book().data['queue_id'])
+        self.assertEqual((booked.service_day, booked.queued_at), (self.tomorrow, self.slot.start))
+        walk_in = QueueService.create_queue('Walk-in', self.service.id)
+
+        self.assertEqual(QueueService.call_next_queue('Officer', self.service.id), walk_in)
+        with self.assertRaises(ValidationError):
+            QueueService.call_next_queue('Officer', self.service.id)
+
+        # Once the slot has started, the booking goes ahead of later walk-ins
+        started = timezone.now() - timedelta(minutes=1)
+        Queue.objects.filter(pk=booked.pk).update(queued_at=started, call_order=started)
+        QueueService.create_queue('Late walk-in', self.service.id)
+        self.assertEqual(QueueService.call_next_queue('Officer', self.service.id), booked)
+
+
+@override_settings(QUEUE_PRIORITY_BOOSTS={'elderly': 30})
+class PriorityClassTests(TestCase):
+
+    def setUp(self):
+        self.office = Office.objects.create(name='Priority Office', code='PRO', address='Addr')
+        self.service = Service.objects.create(
+            name='Priority Service', code='PRIO', service_type='other', office=self.office
+        )
+
+    def ticket(self, name, minutes_ago, priority_class='standard'):
+        queue = QueueService.create_queue(name, self.service.id, priority_class=priority_class)
+        arrived = timezone.now() - timedelta(minutes=minutes_ago)
+        boost = timedelta(minutes=30 if priority_class == 'elderly' else 0)
+        Queue.objects.filter(pk=queue.pk).update(queued_at=arrived, call_order=arrived - boost)
+        return queue
+
+    def call_order(self):
+        called = []
+        while Queue.objects.filter(status='waiting').exists():
+            called.append(QueueService.call_next_queue('Officer', self.service.id).citizen_name)
+        return called
+
+    def test_priority_ticket_moves_ahead_by_its_boost(self):
+        self.ticket('Standard, 20 min', 20)
+        self.ticket('Standard, 10 min', 10)
+        self.ticket('Elderly, just now', 0, 'elderly')
+        self.assertEqual(self.call_order(), ['Elderly, just now', 'Standard, 20 min', 'Standard, 10 min'])
+
+    def test_long_waiting_standard_ticket_is_not_starved(self):
+        self.ticket('Standard, 45 min', 45)
+        for i in range(3):
+            self.ticket(f'Elderly {i}', i, 'elderly')
+        self.assertEqual(self.call_order()[0], 'Standard, 45 min')
+
+    def test_ahead_count_follows_call_order(self):
+        self.ticket('Standard', 10)
+        elderly = self.ticket('Elderly', 0, 'elderly')
+        self.assertEqual(Queue.objects.get(pk=elderly.pk).estimated_wait_time, 0)
+
+    def test_unknown_priority_class_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            QueueService.create_queue('Someone', self.service.id, priority_class='vip')
+
+
+class PriorityPermissionTests(APITestCase):
+
+    def setUp(self):
+        self.office = Office.objects.create(name='Priority Office', code='PRO', address='Addr')
+        self.service = Service.objects.create(
+            name='Priority Service', code='PRIO', service_type='other', office=self.office
+        )
+        self.citizen = User.objects.create_user(username='priority_citizen', password='pw', role='citizen')
+        self.officer = User.objects.create_user(
+            username='priority_officer', password='pw', role='officer', office=self.office
+        )
+
+    def take_ticket(self, name, **extra):
+        self.client.force_authenticate(self.citizen)
+        return self.client.post(reverse('create-queue'), {
+            'citizen_name': name, 'service_id': self.service.id, **extra
+        }, format='json')
+
+    def test_citizen_cannot_claim_a_priority_class(self):
+        res = self.take_ticket('Claims elderly', priority_class='elderly')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['priority_class'], 'standard')
+        queue = Queue.objects.get(pk=res.data['queue_id'])
+        self.assertEqual(queue.call_order, queue.queued_at)
+
+        res = self.client.post(
+            reverse('set-priority', args=[queue.id]), {'priority_class': 'elderly'}, format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Queue.objects.get(pk=queue.pk).priority_class, 'standard')
+
+    def test_officer_of_another_office_cannot_set_priority(self):
+        queue_id = self.take_ticket('Someone').data['queue_id']
+        other_office = Office.objects.create(name='Other Office', code='OTH', address='Addr')
+        other_officer = User.objects.create_user(
+            username='other_officer', password='pw', role='officer', office=other_office
+        )
+        self.client.force_authenticate(other_officer)
+        res = self.client.post(
+            reverse('set-priority', args=[queue_id]), {'priority_class': 'elderly'}, format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_officer_sets_priority_and_ticket_moves_ahead(self):
+        first = self.take_ticket('First').data['queue_id']
+        second = self.take_ticket('Second').data['queue_id']
+        sequence = QueueEventSequence.objects.get(office=self.office).last_sequence
+
+        self.client.force_authenticate(self.officer)
+        res = self.client.post(
+            reverse('set-priority', args=[second]), {'priority_class': 'pregnancy'}, format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['priority_class'], 'pregnancy')
+        self.assertEqual(QueueService.read_events(self.office.id, after=sequence)[0].queue_id, second)
+        self.assertEqual(QueueService.call_next_queue('Officer', self.service.id).id, second)
+        self.assertEqual(QueueService.call_next_queue('Officer', self.service.id).id, first)
+
+    def test_unknown_priority_class_is_rejected(self):
+        queue_id = self.take_ticket('Someone').data['queue_id']
+        self.client.force_authenticate(self.officer)
+        for data in ({}, {'priority_class': 'vip'}):
+            res = self.client.post(reverse('set-priority', args=[queue_id]), data, format='json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST, data)
+
+
+class ResponseFormatTests(APITestCase):
+
+    def setUp(self):
+        office = Office.objects.create(name='Kiosk Office', code='KO', address='Addr')
+        Service.objects.bulk_create([
+            Service(
+                name=f'Kiosk Service {i}', code=f'KS{i}', service_type='other', office=office,
+                description='A long description that kiosks never show. ' * 3
+            )
+            for i in range(20)
+        ])
+        self.client.force_authenticate(User.objects.create_user(username='kiosk', password='pw', role='citizen'))
+        self.url = reverse('service-list')
+
+    def test_sparse_fieldset_selects_nested_keys(self):
+        res = self.client.get(self.url, {'fields': 'code, office.code,unknown'})
+        self.assertEqual(res.json()[0], {'code': 'KS0', 'office': {'code': 'KO'}})
+
+    def test_errors_are_not_filtered(self):
+        res = self.client.get(reverse('queue-status', args=[999]), {'fields': 'queue_id'})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn('error', res.json())
+
+    @unittest.skipUnless(find_spec('ormsgpack'), 'ormsgpack is not installed')
+    def test_messagepack_matches_json(self):
+        import ormsgpack
+
+        res = self.client.get(self.url, {'fields': 'id,name'}, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(res['Content-Type'], 'application/msgpack')
+        self.assertEqual(ormsgpack.unpackb(res.content), self.client.get(self.url, {'fields': 'id,name'}).json())
+
+    def test_large_responses_are_gzipped(self):
+        res = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(res.content)), self.client.get(self.url).json())
+
+        small = self.client.get(self.url, {'fields': 'id'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+    @unittest.skipUnless(find_spec('zstandard'), 'zstandard is not installed')
+    def test_zstd_preferred_when_accepted(self):
+        import zstandard
+
+        res = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, zstd')
+        self.assertEqual(res['Content-Encoding'], 'zstd')
+        body = zstandard.ZstdDecompressor().decompress(res.content)
+        self.assertEqual(json.loads(body), self.client.get(self.url).json())
+
+
+class ServiceSearchTests(APITestCase):
+
+    def setUp(self):
+        bole = Office.objects.create(name='Bole Immigration', code='BOL', address='Addr')
+        piassa = Office.objects.create(name='Piassa Civil Registry', code='PIA', address='Addr')
+        Service.objects.create(
+            name='Passport Renewal', code='PR', service_type='passport', office=bole,
+            description='Renew an expired passport'
+        )
+        Service.objects.create(
+            name='New Passport', code='NP', service_type='passport', office=bole,
+            description='First passport application'
+        )
+        Service.objects.create(
+            name='Birth Certificate', code='BC', service_type='other', office=piassa,
+            description='Certificate for a registered birth'
+        )
+        Service.objects.create(
+            name='Passport Photo Check', code='PP', service_type='other', office=piassa, is_active=False
+        )
+        searcher = User.objects.create_user(username='searcher', password='pw', role='citizen')
+        self.client.force_authenticate(searcher)
+        self.url = reverse('service-search')
+
+    def search(self, query):
+        return [(s['code'], s['office']['code']) for s in self.client.get(self.url, {'q': query}).data]
+
+    def test_prefix_words_must_all_match(self):
+        self.assertEqual(self.search('passport ren'), [('PR', 'BOL')])
+        self.assertEqual(self.search('pass'), [('NP', 'BOL'), ('PR', 'BOL')])
+        self.assertEqual(self.search('piassa birth'), [('BC', 'PIA')])
+        self.assertEqual(self.search('passport birth'), [])
+
+    def test_name_matches_rank_above_description_matches(self):
+        Service.objects.create(
+            name='Document Check', code='DC', service_type='other',
+            office=Office.objects.get(code='PIA'), description='Includes renewal paperwork'
+        )
+        self.assertEqual(self.search('renewal'), [('PR', 'BOL'), ('DC', 'PIA')])
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.search('certificate'), [('BC', 'PIA')])
+        Service.objects.filter(code='BC').update(is_active=False, updated_at=timezone.now())
+        self.assertEqual(self.search('certificate'), [])
+
+    def test_requires_a_query(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TransferTests(APITestCase):
+
+    def setUp(self):
+        self.office = Office.objects.create(name='Transfer Office', code='TRO', address='Addr')
+        self.busy = Service.objects.create(
+            name='Busy Counter', code='BUSY', service_type='id_card', office=self.office
+        )
+        self.idle = Service.objects.create(
+            name='Idle Counter', code='IDLE', service_type='id_card', office=self.office
+        )
+        self.officer = User.objects.create_user(
+            username='transfer_officer', password='pw', role='officer', office=self.office
+        )
+
+    def test_transfer_keeps_order_and_renumbers(self):
+        QueueService.create_queue('Already there', self.idle.id)
+        moving = [QueueService.create_queue(f'Citizen {i}', self.busy.id) for i in range(5)]
+
+        moved = QueueService.transfer_queues(self.busy.id, self.idle.id, count=3, batch_size=2)
+
+        self.assertEqual(moved, 3)
+        line = list(Queue.objects.filter(service=self.idle, status='waiting').values_list('citizen_name', 'number'))
+        self.assertEqual(line, [('Already there', 1), ('Citizen 0', 2), ('Citizen 1', 3), ('Citizen 2', 4)])
+        self.assertEqual(Queue.objects.filter(service=self.busy).count(), 2)
+        self.assertEqual(QueueEvent.objects.filter(queue_id=moving[0].id, previous_status='waiting').count(), 1)
+
+    def test_transfer_notifies_moved_citizens(self):
+        QueueService.create_queue('Already there', self.idle.id, '0911000000')
+        with_phone = QueueService.create_queue('With phone', self.busy.id, '0911000001')
+        QueueService.create_queue('No phone', self.busy.id)
+
+        QueueService.transfer_queues(self.busy.id, self.idle.id)
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.queue_id, with_phone.id)
+        self.assertEqual(notification.phone, '0911000001')
+        self.assertIn('Number 2 for Idle Counter', notification.message)
+
+        # Moving the ticket again tells the citizen about the new number too
+        QueueService.transfer_queues(self.idle.id, self.busy.id, queue_ids=[with_phone.id])
+        self.assertEqual(Notification.objects.filter(queue_id=with_phone.id).count(), 2)
+        self.assertIn('Number 1 for Busy Counter', Notification.objects.latest('id').message)
+
+    def test_transfer_to_another_office_is_rejected(self):
+        other_office = Office.objects.create(name='Other Office', code='OTO', address='Addr')
+        other = Service.objects.create(name='Other', code='OTH', service_type='id_card', office=other_office)
+        QueueService.create_queue('Citizen', self.busy.id)
+        with self.assertRaises(ValidationError):
+            QueueService.transfer_queues(self.busy.id, other.id)
+
+    def test_rebalance_suggests_and_applies_moves_to_idle_sibling(self):
+        for i in range(20):
+            QueueService.create_queue(f'Citizen {i}', self.busy.id, f'09110000{i:02}')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.officer)}')
+        url = reverse('office-rebalance', args=[self.office.id])
+
+        suggested = self.client.get(url).data['transfers']
+        self.assertEqual(len(suggested), 1)
+        self.assertEqual((suggested[0]['from_service'], suggested[0]['to_service']), ('BUSY', 'IDLE'))
+        self.assertEqual(suggested[0]['count'], 10)
+        self.assertEqual(Queue.objects.filter(service=self.idle).count(), 0)
+
+        applied = self.client.post(url).data['transfers']
+        self.assertEqual(applied[0]['moved'], 10)
+        self.assertEqual(Queue.objects.filter(service=self.idle, status='waiting').count(), 10)
+        self.assertEqual(Notification.objects.filter(kind__startswith='transfer_').count(), 10)
+
+
+class OfficeDashboardTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.office = Office.objects.create(name='Dashboard Office', code='DBO', address='Addr')
+        self.services = [
+            Service.objects.create(name=f'Counter {i}', code=f'DB{i}', service_type='other', office=self.office)
+            for i in range(2)
+        ]
+        for service in self.services:
+            for i in range(8):
+                QueueService.create_queue(f'{service.code} citizen {i}', service.id)
+        officer = User.objects.create_user(
+            username='dashboard_officer', password='pw', role='officer', office=self.office
+        )
+        self.client.force_authenticate(officer)
+        self.url = reverse('office-dashboard', args=[self.office.id])
+
+    def test_lists_active_and_next_waiting_per_service(self):
+        QueueService.call_next_queue('Officer', self.services[0].id)
+
+        res = self.client.get(self.url, {'next': 3})
+
+        first, second = res.data['services']
+        self.assertEqual([t['citizen_name'] for t in first['active']], ['DB0 citizen 0'])
+        self.assertEqual([t['number'] for t in first['next_waiting']], [2, 3, 4])
+        self.assertEqual(first['queue_stats'], [{'status': 'called', 'count': 1}, {'status': 'waiting', 'count': 7}])
+        self.assertEqual((second['active'], len(second['next_waiting'])), ([], 3))
+
+    def test_cached_until_a_ticket_changes(self):
+        first = self.client.get(self.url).data
+        # Office and version lookups only
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(self.url).data, first)
+
+        QueueService.call_next_queue('Officer', self.services[1].id)
+        res = self.client.get(self.url)
+        self.assertGreater(res.data['version'], first['version'])
+        self.assertEqual(len(res.data['services'][1]['active']), 1)
+
+
+class FlakyGateway(notifications.BaseGateway):
+    """Test gateway that fails every message."""
+
+    def send_batch(self, batch):
+        return {notification.id: 'gateway unavailable' for notification in batch}
+
+
+class NotificationTests(TestCase):
+
+    def setUp(self):
+        office = Office.objects.create(name='SMS Office', code='SMO', address='Addr')
+        self.service = Service.objects.create(
+            name='SMS Service', code='SMS', service_type='other', office=office
+        )
+        for i in range(5):
+            QueueService.create_queue(f'Citizen {i}', self.service.id, citizen_phone=f'+25191100000{i}')
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.sms_file = f'{directory.name}/sms.jsonl'
+
+    def test_call_queues_called_and_ahead_messages(self):
+        with override_settings(SMS_AHEAD_THRESHOLDS=[3]):
+            QueueService.call_next_queue('Officer', self.service.id)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('kind', 'queue__number')),
+            [('ahead_3', 5), ('called', 1)]
+        )
+
+    def test_worker_sends_batch_through_gateway(self):
+        QueueService.call_next_queue('Officer', self.service.id)
+        with override_settings(SMS_BACKEND='queue_management.notifications.FileGateway', SMS_FILE_PATH=self.sms_file):
+            self.assertEqual(notifications.dispatch_batch(), 2)
+            self.assertEqual(notifications.dispatch_batch(), 0)
+
+        with open(self.sms_file) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertFalse(Notification.objects.exclude(status='sent').exists())
+
+    @override_settings(SMS_BACKEND='queue_management.tests.FlakyGateway', SMS_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_give_up(self):
+        QueueService.call_next_queue('Officer', self.service.id)
+        notifications.dispatch_batch()
+
+        retry = Notification.objects.get(kind='called')
+        self.assertEqual((retry.status, retry.attempts), ('pending', 1))
+        self.assertGreater(retry.next_attempt_at, timezone.now())
+
+        notifications.dispatch_batch(now=retry.next_attempt_at)
+        retry.refresh_from_db()
+        self.assertEqual((retry.status, retry.last_error), ('failed', 'gateway unavailable'))
+
+
+class ShardPlacementTests(TestCase):
+
+    @override_settings(QUEUE_SHARD_ALIASES=['east', 'west'], QUEUE_SHARD_MAP={7: 'east'})
+    def test_offices_and_queue_ids_map_to_shards(self):
+        self.assertEqual(sharding.shard_for_office(7), 'east')
+        self.assertEqual(sharding.shard_for_office(3), 'west')
+        self.assertEqual(sharding.shard_for_queue(5), 'east')
+        self.assertEqual(sharding.shard_for_queue(sharding.SHARD_ID_SPAN + 5), 'west')
+
+    @override_settings(QUEUE_SHARD_ALIASES=[])
+    def test_unsharded_lookups_defer_to_routers(self):
+        self.assertIsNone(sharding.shard_for_office(1))
+        self.assertIsNone(sharding.shard_for_queue(1))
+        self.assertEqual(sharding.shard_aliases(), [None])
+
+
+@unittest.skipUnless(
+    len(settings.QUEUE_SHARD_ALIASES) >= 2,
+    'Set QUEUE_SHARDS to two or more databases, e.g. "s1=sqlite:///s1.sqlite3,s2=sqlite:///s2.sqlite3"'
+)
+class ShardedQueueTests(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.first, self.second = settings.QUEUE_SHARD_ALIASES[:2]
+        self.offices = [
+            Office.objects.create(name=f'Shard Office {i}', code=f'SH{i}', address='Addr') for i in range(2)
+        ]
+        placement = override_settings(QUEUE_SHARD_MAP={
+            self.offices[0].id: self.first, self.offices[1].id: self.second
+        })
+        placement.enable()
+        self.addCleanup(placement.disable)
+        self.services = [
+            Service.objects.create(name=f'Shard Service {i}', code=f'SHS{i}', service_type='other', office=office)
+            for i, office in enumerate(self.offices)
+        ]
+        self.citizen = User.objects.create_user(username='shard_citizen', password='pw', role='citizen')
+        self.admin = User.objects.create_user(username='shard_admin', password='pw', role='admin')
+
+    def create_queue(self, service):
+        self.client.force_authenticate(self.citizen)
+        res = self.client.post(
+            reverse('create-queue'), {'citizen_name': 'Sharded', 'service_id': service.id}, format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED, res.data)
+        return res.data['queue_id']
+
+    def test_catalog_is_copied_to_shards(self):
+        for alias in (self.first, self.second):
+            self.assertEqual(Service.objects.using(alias).filter(code__startswith='SHS').count(), 2)
+
+    def test_queues_live_on_their_office_shard(self):
+        first_id = self.create_queue(self.services[0])
+        second_id = self.create_queue(self.services[1])
+
+        self.assertTrue(Queue.objects.using(self.first).filter(id=first_id).exists())
+        self.assertTrue(Queue.objects.using(self.second).filter(id=second_id).exists())
+        self.assertFalse(Queue.objects.using(self.first).filter(id=second_id).exists())
+        self.assertEqual(sharding.shard_for_queue(second_id), self.second)
+
+        # "My tickets" reads the citizen's tickets from every shard
+        res = self.client.get(reverse('my-queues'))
+        self.assertEqual([q['queue_id'] for q in res.data], [first_id, second_id])
+
+        # The whole lifecycle routes by queue id
+        self.client.force_authenticate(self.admin)
+        res = self.client.post(reverse('call-next-queue'), {'service_id': self.services[1].id}, format='json')
+        self.assertEqual(res.data['queue_id'], second_id)
+        self.client.post(reverse('start-service', args=[second_id]))
+        self.client.post(reverse('complete-service', args=[second_id]))
+        self.assertEqual(Queue.objects.using(self.second).get(id=second_id).status, 'completed')
+
+        res = self.client.get(reverse('queue-status', args=[first_id]))
+        self.assertEqual(res.data['status'], 'waiting')
+
+    def test_sweeper_and_metrics_fan_out(self):
+        ids = [self.create_queue(service) for service in self.services]
+        for queue_id, alias in zip(ids, (self.first, self.second)):
+            Queue.objects.using(alias).filter(id=queue_id).update(
+                status='called', called_at=timezone.now() - timedelta(hours=1)
+            )
+        self.assertEqual(QueueService.expire_overdue_calls(), 2)
+
+        with self.settings(METRICS_TOKEN='scrape-secret'):
+            body = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret').content.decode()
+        self.assertIn('queue_no_show_ratio{service="SHS0"} 1.0', body)
+        self.assertIn('queue_no_show_ratio{service="SHS1"} 1.0', body)
+
+    def test_transfer_stays_on_the_office_shard(self):
+        sibling = Service.objects.create(
+            name='Shard Sibling', code='SHS2', service_type='other', office=self.offices[1]
+        )
+        queue_id = self.create_queue(self.services[1])
+
+        self.assertEqual(QueueService.transfer_queues(self.services[1].id, sibling.id), 1)
+        self.assertEqual(Queue.objects.using(self.second).get(id=queue_id).service_id, sibling.id)
+
+
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Upper bounds on queries per endpoint, measured on a realistic dataset.
+
+    Budgets must not grow with the number of offices, services or tickets.
+    A failure prints the captured SQL; raise a budget only when the new
+    queries are intentional.
+    """
+
+    OFFICES = 12
+    SERVICES_PER_OFFICE = 4
+    TICKETS_PER_SERVICE = 30
+
+    # Route name -> maximum queries, including the JWT user lookup and the
+    # SAVEPOINT/RELEASE pair TestCase adds around each atomic block.
+    # Catalog lists add 1 for the catalog version (conditional GET); search
+    # adds 1 more only when the version changed and its index is rebuilt.
+    # Transitions include 2 for the event log (sequence update, event insert);
+    # calls add 1 to find citizens due a "you are N away" SMS, and creates 1 to
+    # count the citizen's active tickets. A transfer of one batch takes 3 to
+    # pick and renumber the tickets, 2 for their events and 1 to queue their SMS
+    BUDGETS = {
+        'office-list': 3,
+        'create-queue': 11,
+        'my-queues': 3,
+        'queue-status': 3,
+        'service-list': 3,
+        'service-search': 3,
+        'service-slots': 3,
+        'book-appointment': 11,
+        'call-next-queue': 10,
+        'start-service': 7,
+        'complete-service': 7,
+        'mark-no-show': 7,
+        'cancel-queue': 8,
+        'set-priority': 8,
+        'office-queue-status': 4,
+        'office-changes': 4,
+        'transfer-queues': 11,
+        'office-rebalance': 4,
+        'office-dashboard': 6,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        offices = Office.objects.bulk_create([
+            Office(name=f'Office {i}', code=f'O{i}', address='Addr') for i in range(cls.OFFICES)
+        ])
+        services = Service.objects.bulk_create([
+            Service(
+                name=f'Service {office.code}-{j}', code=f'{office.code}S{j}',
+                service_type='other', office=office
+            )
+            for office in offices for j in range(cls.SERVICES_PER_OFFICE)
+        ])
+        statuses = ['waiting', 'waiting', 'waiting', 'completed', 'no_show', 'cancelled']
+        Queue.objects.bulk_create([
+            Queue(
+                citizen_name=f'Citizen {n}', service=service, number=n + 1,
+                status=statuses[n % len(statuses)], service_day=service.office.local_date()
+            )
+            for service in services for n in range(cls.TICKETS_PER_SERVICE)
+        ])
+
+        # Offices already have event history, as they would in production
+        QueueEventSequence.objects.bulk_create([QueueEventSequence(office=office) for office in offices])
+
+        cls.office = offices[0]
+        cls.service = services[0]
+        cls.users = {
+            'admin': User.objects.create_user(username='budget_admin', password='pw', role='admin'),
+            'officer': User.objects.create_user(
+                username='budget_officer', password='pw', role='officer', office=cls.office
+            ),
+            'citizen': User.objects.create_user(username='budget_citizen', password='pw', role='citizen'),
+        }
+
+    def auth(self, role):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.users[role])}')
+
+    def assertWithinBudget(self, route, method, url, data=None):
+        with self.assertMaxQueries(self.BUDGETS[route]):
+            res = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(res.status_code, 400, res.data)
+        return res
+
+    def test_every_route_has_a_budget(self):
+        names = {pattern.name for pattern in queue_urls.urlpatterns}
+        self.assertEqual(names - set(self.BUDGETS), set())
+
+    def test_office_list(self):
+        self.auth('citizen')
+        res = self.assertWithinBudget('office-list', 'get', reverse('office-list'))
+        self.assertEqual(res.data[0]['service_count'], self.SERVICES_PER_OFFICE)
+
+    def test_service_list(self):
+        self.auth('citizen')
+        self.assertWithinBudget('service-list', 'get', reverse('service-list'))
+
+    def test_service_search(self):
+        self.auth('citizen')
+        res = self.assertWithinBudget('service-search', 'get', reverse('service-search'), {'q': 'service o3'})
+        self.assertEqual(len(res.data), self.SERVICES_PER_OFFICE)
+
+    def test_unchanged_catalog_is_not_modified(self):
+        self.auth('citizen')
+        for route in ('office-list', 'service-list'):
+            etag = self.client.get(reverse(route))['ETag']
+            # JWT user lookup and catalog version only
+            with self.assertNumQueries(2):
+                res = self.client.get(reverse(route), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+            Service.objects.filter(pk=self.service.pk).update(name='Renamed', updated_at=timezone.now())
+            self.assertEqual(self.client.get(reverse(route), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deleted_service_is_not_hidden_by_a_conditional_get(self):
+        self.auth('citizen')
+        first = self.client.get(reverse('service-list'))
+        self.assertNotIn('Last-Modified', first)
+
+        Service.objects.filter(office=self.office).exclude(pk=self.service.pk).first().delete()
+        res = self.client.get(
+            reverse('service-list'),
+            HTTP_IF_NONE_MATCH=first['ETag'], HTTP_IF_MODIFIED_SINCE=http_date()
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(reverse('service-list'), HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_create_queue(self):
+        self.auth('citizen')
+        self.assertWithinBudget('create-queue', 'post', reverse('create-queue'), {
+            'citizen_name': 'New', 'service_id': self.service.id
+        })
+
+    def test_my_queues(self):
+        self.auth('citizen')
+        queue = Queue.objects.filter(service=self.service, status='waiting').last()
+        Queue.objects.filter(pk=queue.pk).update(owner=self.users['citizen'])
+        res = self.assertWithinBudget('my-queues', 'get', reverse('my-queues'))
+        self.assertEqual(len(res.data), 1)
+
+    def test_service_slots(self):
+        self.auth('citizen')
+        SlotTemplate.objects.create(
+            service=self.service, weekday=(self.office.local_date() + timedelta(days=1)).weekday(),
+            start_time=time(8, 0), end_time=time(17, 0), slot_minutes=30
+        )
+        QueueService.generate_appointment_slots(self.office, days=7)
+        res = self.assertWithinBudget('service-slots', 'get', reverse('service-slots', args=[self.service.id]), {
+            'date': self.office.local_date() + timedelta(days=1)
+        })
+        self.assertEqual(len(res.data), 18)
+
+    def test_book_appointment(self):
+        self.auth('citizen')
+        SlotTemplate.objects.create(
+            service=self.service, weekday=(self.office.local_date() + timedelta(days=1)).weekday(),
+            start_time=time(8, 0), end_time=time(17, 0), slot_minutes=30
+        )
+        QueueService.generate_appointment_slots(self.office, days=7)
+        slot = AppointmentSlot.objects.filter(service=self.service).last()
+        self.assertWithinBudget('book-appointment', 'post', reverse('book-appointment'), {
+            'citizen_name': 'Booked', 'service_id': self.service.id, 'slot_id': slot.id
+        })
+
+    def test_queue_status(self):
+        self.auth('officer')
+        queue = Queue.objects.filter(service=self.service, status='waiting').last()
+        self.assertWithinBudget('queue-status', 'get', reverse('queue-status', args=[queue.id]))
+
+    def test_call_next_queue(self):
+        self.auth('officer')
+        self.assertWithinBudget('call-next-queue', 'post', reverse('call-next-queue'), {
+            'service_id': self.service.id
+        })
+
+    def test_start_service(self):
+        self.auth('officer')
+        queue = Queue.objects.filter(service=self.service, status='waiting').first()
+        Queue.objects.filter(pk=queue.pk).update(status='called')
+        self.assertWithinBudget('start-service', 'post', reverse('start-service', args=[queue.id]))
+
+    def test_complete_service(self):
+        self.auth('officer')
+        queue = Queue.objects.filter(service=self.service, status='waiting').first()
+        Queue.objects.filter(pk=queue.pk).update(status='serving')
+        self.assertWithinBudget('complete-service', 'post', reverse('complete-service', args=[queue.id]))
+
+    def test_mark_no_show(self):
+        self.auth('officer')
+        queue = Queue.objects.filter(service=self.service, status='waiting').first()
+        Queue.objects.filter(pk=queue.pk).update(status='called')
+        self.assertWithinBudget('mark-no-show', 'post', reverse('mark-no-show', args=[queue.id]))
+
+    def test_cancel_queue(self):
+        self.auth('officer')
+        queue = Queue.objects.filter(service=self.service, status='waiting').first()
+        self.assertWithinBudget('cancel-queue', 'post', reverse('cancel-queue', args=[queue.id]))
+
+    def test_set_priority(self):
+        self.auth('officer')
+        queue = Queue.objects.filter(service=self.service, status='waiting').first()
+        self.assertWithinBudget(
+            'set-priority', 'post', reverse('set-priority', args=[queue.id]), {'priority_class': 'elderly'}
+        )
+
+    def test_office_changes(self):
+        self.auth('officer')
+        for queue in Queue.objects.filter(service=self.service, status='waiting')[:10]:
+            QueueService.cancel_queue(queue.id)
+        res = self.assertWithinBudget('office-changes', 'get', reverse('office-changes', args=[self.office.id]))
+        self.assertEqual(len(res.data['changes']), 10)
+
+    def test_transfer_queues(self):
+        self.auth('officer')
+        target = Service.objects.filter(office=self.office).exclude(pk=self.service.pk).first()
+        Queue.objects.filter(service=self.service).update(citizen_phone='0911000000')
+        res = self.assertWithinBudget('transfer-queues', 'post', reverse('transfer-queues'), {
+            'from_service_id': self.service.id, 'to_service_id': target.id, 'count': 5
+        })
+        self.assertEqual(res.data['moved'], 5)
+        self.assertEqual(Notification.objects.count(), 5)
+
+    def test_office_rebalance(self):
+        self.auth('officer')
+        self.assertWithinBudget('office-rebalance', 'get', reverse('office-rebalance', args=[self.office.id]))
+
+    def test_office_dashboard(self):
+        self.auth('officer')
+        cache.clear()
+        res = self.assertWithinBudget('office-dashboard', 'get', reverse('office-dashboard', args=[self.office.id]))
+        self.assertEqual(len(res.data['services']), self.SERVICES_PER_OFFICE)
+
+    def test_office_queue_status(self):
+        self.auth('officer')
+        res = self.assertWithinBudget(
+            'office-queue-status', 'get', reverse('office-queue-status', args=[self.office.id])
+        )
+        self.assertEqual(len(res.data['services']), self.SERVICES_PER_OFFICE)
+
+
+class BenchmarkHelperTests(TestCase):
+
+    def test_percentiles_use_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_report_counts_errors_and_throughput(self):
+        recorder = LatencyRecorder()
+        for ms in (10, 20, 30, 40):
+            recorder.record('create-queue', ms / 1000)
+        recorder.record('create-queue', 0.5, ok=False)
+        recorder.record('create-queue', 0.035, rejected=True)
+
+        row = recorder.report(wall_seconds=2)['create-queue']
+        self.assertEqual(row['count'], 6)
+        self.assertEqual((row['errors'], row['rejected']), (1, 1))
+        self.assertEqual(row['throughput_per_s'], 3.0)
+        self.assertEqual(row['p50_ms'], 30.0)
@@ -1,5 +1,10 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under an ASGI server the read-heavy endpoints can be served by native
+# async views instead (same URLs, same payloads)
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
 
 # URL patterns for the queue_management app
 # These define the secure API endpoints with role-based access
@@ -9,10 +14,16 @@ urlpatterns = [
 
     # Queue operations
     path('queues/create/', views.create_queue, name='create-queue'),
-    path('queues/<int:queue_id>/status/', views.queue_status, name='queue-status'),
+    path('queues/<int:queue_id>/status/', read_views.queue_status, name='queue-status'),
+    path('queues/mine/', views.my_queues, name='my-queues'),
 
     # Service information (authenticated users)
-    path('services/', views.service_list, name='service-list'),
+    path('services/', read_views.service_list, name='service-list'),
+    path('services/search/', views.service_search, name='service-search'),
+
+    # Appointments
+    path('services/<int:service_id>/slots/', views.service_slots, name='service-slots'),
+    path('appointments/book/', views.book_appointment, name='book-appointment'),
 
     # Officer operations
     path('queues/call/', views.call_next_queue, name='call-next-queue'),
@@ -20,7 +31,14 @@ urlpatterns = [
     path('queues/<int:queue_id>/complete/', views.complete_service, name='complete-service'),
     path('queues/<int:queue_id>/no-show/', views.mark_no_show, name='mark-no-show'),
     path('queues/<int:queue_id>/cancel/', views.cancel_queue, name='cancel-queue'),
+    path('queues/<int:queue_id>/priority/', views.set_priority, name='set-priority'),
+    path('queues/transfer/', views.transfer_queues, name='transfer-queues'),
 
     # Analytics endpoints (officers and admins)
-    path('offices/<int:office_id>/queue-status/', views.office_queue_status, name='office-queue-status'),
+    path('offices/<int:office_id>/queue-status/', read_views.office_queue_status, name='office-queue-status'),
+    path('offices/<int:office_id>/dashboard/', views.office_dashboard, name='office-dashboard'),
+    path('offices/<int:office_id>/rebalance/', views.office_rebalance, name='office-rebalance'),
+
+    # Delta sync for dashboards and kiosks (officers and admins)
+    path('offices/<int:office_id>/changes/', views.office_changes, name='office-changes'),
 ]
\ No newline at end of file
@@ -1,28 +1,126 @@
+import hashlib
+
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db.models import Count, Q
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.http import quote_etag
 from .models import Office, Service, Queue
 from .serializers import OfficeSerializer
 from accounts.permissions import IsAdmin, IsCitizen, IsOfficerOrAdmin
+from queue_system.routers import read_from_replica
+from .search import search_services
 from .services import QueueService
+from .sharding import shard_for_queue
+
+
+def queue_status_data(queue, estimated_wait_time):
+    """Response body for a single queue status (shared with the async views)"""
+    return {
+        'queue_id': queue.id,
+        'queue_number': queue.number,
+        'citizen_name': queue.citizen_name,
+        'service': queue.service.name,
+        'office': queue.office.name,
+        'status': queue.status,
+        'priority_class': queue.priority_class,
+        'created_at': queue.created_at,
+        'called_at': queue.called_at,
+        'started_at': queue.started_at,
+        'estimated_wait_time': estimated_wait_time
+    }
+
+
+def office_queue_status_data(office, services, counts):
+    """Response body for office queue analytics (shared with the async views)"""
+    return {
+        'office': {
+            'id': office.id,
+            'name': office.name,
+            'code': office.code,
+        },
+        # Only include services with queue data
+        'services': [
+            {
+                'service_id': service.id,
+                'service_name': service.name,
+                'service_code': service.code,
+                'queue_stats': counts[service.id]
+            }
+            for service in services if service.id in counts
+        ]
+    }
+
+
+def service_data(service):
+    """Response body for a service with its office (shared with the async views)"""
+    return {
+        'id': service.id,
+        'name': service.name,
+        'code': service.code,
+        'description': service.description,
+        'service_type': service.service_type,
+        'office': {
+            'id': service.office.id,
+            'name': service.office.name,
+            'code': service.office.code,
+        },
+        'estimated_duration': service.estimated_duration,
+        'priority': service.priority,
+    }
+
+
+def catalog_etag(version, *representation):
+    """
+    ETag for a catalog response (shared with the async views).
+
+    The ETag covers the catalog version and whatever else shapes the body
+    (format, ?fields=), so each representation validates on its own. No
+    Last-Modified is sent: deleting an office or service does not move the
+    latest updated_at forward, so If-Modified-Since would miss it, while the
+    version also counts the rows.
+    """
+    key = '|'.join([version, *representation])
+    return quote_etag(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
+
+
+def set_catalog_etag(response, etag):
+    response['ETag'] = etag
+    # Clients may keep the list but must revalidate before using it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def office_list(request):
     """
     List all offices, or create a new office.
 
-    GET: Returns list of all active offices (all authenticated users)
+    GET: Returns list of all active offices (all authenticated users);
+    supports conditional GET (ETag from the catalog version)
     POST: Creates a new office (admins only)
     """
     if request.method == 'GET':
+        # Unchanged catalog: answer 304 before loading or serializing anything
+        version = QueueService.get_catalog_version()
+        etag = catalog_etag(version, request.accepted_renderer.format, request.query_params.get('fields', ''))
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
         # All authenticated users can view offices
-        offices = Office.objects.filter(is_active=True)
+        offices = Office.objects.filter(is_active=True).annotate(
+            active_service_count=Count('services', filter=Q(services__is_active=True))
+        )
         serializer = OfficeSerializer(offices, many=True)
-        return Response(serializer.data)
+        return set_catalog_etag(Response(serializer.data), etag)
 
     elif request.method == 'POST':
         # Only admins can create offices
@@ -45,7 +143,8 @@ def create_queue(request):
     """
     Citizens can create queue tickets.
 
-    POST: Creates a new queue ticket for a citizen
+    POST: Creates a new queue ticket for a citizen. Tickets start as
+    standard; only an officer can give one a priority class.
     """
     try:
         citizen_name = request.data.get('citizen_name')
@@ -59,7 +158,9 @@ def create_queue(request):
             )
 
         # Create queue using service layer
-        queue = QueueService.create_queue(citizen_name, service_id, citizen_phone)
+        queue = QueueService.create_queue(
+            citizen_name, service_id, citizen_phone, owner=request.user
+        )
 
         return Response({
             'queue_id': queue.id,
@@ -68,6 +169,54 @@ def create_queue(request):
             'office': queue.office.name,
             'estimated_wait_time': queue.estimated_wait_time,
             'status': queue.status,
+            'priority_class': queue.priority_class,
+            'created_at': queue.created_at
+        }, status=status.HTTP_201_CREATED)
+
+    except ValidationError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+@permission_classes([IsCitizen])
+def book_appointment(request):
+    """
+    Citizens can book an appointment slot instead of walking in.
+
+    POST: Creates a queue ticket that joins the line when the slot starts
+    """
+    try:
+        citizen_name = request.data.get('citizen_name')
+        service_id = request.data.get('service_id')
+        slot_id = request.data.get('slot_id')
+        citizen_phone = request.data.get('citizen_phone', '')
+
+        if not all([citizen_name, service_id, slot_id]):
+            return Response(
+                {'error': 'citizen_name, service_id and slot_id are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            service_id, slot_id = int(service_id), int(slot_id)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'service_id and slot_id must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queue = QueueService.book_appointment(
+            citizen_name, service_id, slot_id, citizen_phone, owner=request.user
+        )
+
+        return Response({
+            'queue_id': queue.id,
+            'queue_number': queue.number,
+            'service': queue.service.name,
+            'office': queue.office.name,
+            'appointment_start': queue.appointment_slot.start,
+            'appointment_end': queue.appointment_slot.end,
+            'status': queue.status,
+            'priority_class': queue.priority_class,
             'created_at': queue.created_at
         }, status=status.HTTP_201_CREATED)
 
@@ -77,6 +226,7 @@ def create_queue(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def queue_status(request, queue_id):
     """
     Get status of a specific queue.
@@ -85,39 +235,46 @@ def queue_status(request, queue_id):
     Officers/admins can view queues in their office.
     """
     try:
-        queue = Queue.objects.get(id=queue_id)
+        queue = Queue.objects.using(shard_for_queue(queue_id)).select_related('service__office').get(
+            id=queue_id
+        )
 
         # Check permissions based on user role
         if request.user.is_citizen():
-            # Citizens can only view queues they created (simplified check)
-            # In production, you'd track queue ownership properly
-            pass  # For now, allow all citizens to view
+            # Citizens can only view queues they created
+            if queue.owner_id != request.user.pk:
+                return Response(
+                    {'error': 'You can only view your own queues'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
         elif request.user.is_officer():
             # Officers can only view queues in their office
-            if queue.office != request.user.office:
+            if queue.service.office_id != request.user.office_id:
                 return Response(
                     {'error': 'You can only view queues in your office'},
                     status=status.HTTP_403_FORBIDDEN
                 )
         # Admins can view all queues
 
-        return Response({
-            'queue_id': queue.id,
-            'queue_number': queue.number,
-            'citizen_name': queue.citizen_name,
-            'service': queue.service.name,
-            'office': queue.office.name,
-            'status': queue.status,
-            'created_at': queue.created_at,
-            'called_at': queue.called_at,
-            'started_at': queue.started_at,
-            'estimated_wait_time': queue.estimated_wait_time
-        })
+        return Response(queue_status_data(queue, queue.estimated_wait_time))
 
     except Queue.DoesNotExist:
         return Response({'error': 'Queue not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+@permission_classes([IsCitizen])
+@read_from_replica
+def my_queues(request):
+    """
+    List the citizen's own active queue tickets (waiting, called or serving).
+
+    GET: Returns the tickets in call order, in the queue status format
+    """
+    queues = QueueService.get_citizen_queues(request.user)
+    return Response([queue_status_data(queue, queue.estimated_wait_time) for queue in queues])
+
+
 @api_view(['POST'])
 @permission_classes([IsOfficerOrAdmin])
 def call_next_queue(request):
@@ -138,7 +295,7 @@ def call_next_queue(request):
 
         # Check if officer can manage this service's office
         service = Service.objects.get(id=service_id)
-        if request.user.is_officer() and request.user.office != service.office:
+        if request.user.is_officer() and request.user.office_id != service.office_id:
             return Response(
                 {'error': 'You can only call queues in your office'},
                 status=status.HTTP_403_FORBIDDEN
@@ -178,7 +335,7 @@ def start_service(request, queue_id):
         queue = QueueService.start_service(queue_id, officer_name)
 
         # Verify officer can manage this office
-        if request.user.is_officer() and request.user.office != queue.office:
+        if request.user.is_officer() and request.user.office_id != queue.service.office_id:
             return Response(
                 {'error': 'You can only serve citizens in your office'},
                 status=status.HTTP_403_FORBIDDEN
@@ -210,7 +367,7 @@ def complete_service(request, queue_id):
         queue = QueueService.complete_service(queue_id)
 
         # Verify officer can manage this office
-        if request.user.is_officer() and request.user.office != queue.office:
+        if request.user.is_officer() and request.user.office_id != queue.service.office_id:
             return Response(
                 {'error': 'You can only complete services in your office'},
                 status=status.HTTP_403_FORBIDDEN
@@ -242,7 +399,7 @@ def mark_no_show(request, queue_id):
         queue = QueueService.mark_no_show(queue_id)
 
         # Verify officer can manage this office
-        if request.user.is_officer() and request.user.office != queue.office:
+        if request.user.is_officer() and request.user.office_id != queue.service.office_id:
             return Response(
                 {'error': 'You can only manage queues in your office'},
                 status=status.HTTP_403_FORBIDDEN
@@ -260,34 +417,168 @@ def mark_no_show(request, queue_id):
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsOfficerOrAdmin])
+def transfer_queues(request):
+    """
+    Officers can move waiting tickets to another service of their office.
+
+    POST: Moves `count` tickets from the front of the line (all waiting
+    tickets by default), or just the tickets in `queue_ids`
+    """
+    try:
+        from_service_id = int(request.data.get('from_service_id'))
+        to_service_id = int(request.data.get('to_service_id'))
+        count = request.data.get('count')
+        count = int(count) if count is not None else None
+        queue_ids = request.data.get('queue_ids')
+        if queue_ids is not None:
+            queue_ids = [int(queue_id) for queue_id in queue_ids]
+    except (TypeError, ValueError):
+        return Response(
+            {'error': 'from_service_id and to_service_id are required; count and queue_ids must be integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        source = Service.objects.select_related('office').get(id=from_service_id)
+        if not request.user.can_manage_office(source.office):
+            return Response(
+                {'error': 'You can only transfer queues in your office'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        moved = QueueService.transfer_queues(from_service_id, to_service_id, count=count, queue_ids=queue_ids)
+
+        return Response({
+            'moved': moved,
+            'message': f'Moved {moved} tickets'
+        })
+
+    except ValidationError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Service.DoesNotExist:
+        return Response({'error': 'Service not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def service_list(request):
     """
     List all active services with office information.
 
     Accessible by all authenticated users to see available services.
+    Supports conditional GET (ETag from the catalog version).
+    """
+    version = QueueService.get_catalog_version()
+    etag = catalog_etag(version, request.accepted_renderer.format, request.query_params.get('fields', ''))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    services = QueueService.get_active_services()
+    return set_catalog_etag(Response([service_data(service) for service in services]), etag)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_from_replica
+def service_search(request):
+    """
+    Search active services across all offices.
+
+    GET ?q=<words>&limit=<n>: Services whose name, description, type or
+    office name match every word (as a prefix), best match first
     """
-    services = Service.objects.filter(is_active=True).select_related('office')
-    data = []
-
-    for service in services:
-        data.append({
-            'id': service.id,
-            'name': service.name,
-            'code': service.code,
-            'description': service.description,
-            'service_type': service.service_type,
-            'office': {
-                'id': service.office.id,
-                'name': service.office.name,
-                'code': service.office.code,
-            },
-            'estimated_duration': service.estimated_duration,
-            'priority': service.priority,
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = int(request.query_params.get('limit', 20))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 < limit <= 100:
+        return Response({'error': 'limit must be between 1 and 100'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response([
+        {**service_data(service), 'score': score} for service, score in search_services(query, limit)
+    ])
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_from_replica
+def service_slots(request, service_id):
+    """
+    List the appointment slots of a service that still have room.
+
+    GET ?date=YYYY-MM-DD: Slots on that day in the office's local time
+    (default today), earliest first
+    """
+    try:
+        service = Service.objects.select_related('office').get(id=service_id, is_active=True)
+    except Service.DoesNotExist:
+        return Response({'error': 'Service not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    day = None
+    if 'date' in request.query_params:
+        try:
+            day = parse_date(request.query_params['date'])
+        except ValueError:
+            pass
+        if day is None:
+            return Response({'error': 'date must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response([
+        {
+            'slot_id': slot.id,
+            'start': slot.start,
+            'end': slot.end,
+            'available': slot.available,
+        }
+        for slot in QueueService.get_available_slots(service, day)
+    ])
+
+
+@api_view(['POST'])
+@permission_classes([IsOfficerOrAdmin])
+def set_priority(request, queue_id):
+    """
+    Officers/admins give a waiting ticket a priority class after checking
+    the citizen (elderly, disability, pregnancy), or set it back to standard.
+
+    POST: priority_class
+    """
+    try:
+        priority_class = request.data.get('priority_class')
+        if not priority_class:
+            return Response(
+                {'error': 'priority_class is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queue = Queue.objects.using(shard_for_queue(queue_id)).select_related('service__office').get(
+            id=queue_id
+        )
+        if not request.user.can_manage_office(queue.office):
+            return Response(
+                {'error': 'You can only manage queues for your assigned office'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        queue = QueueService.set_priority_class(queue_id, priority_class)
+
+        return Response({
+            'queue_id': queue.id,
+            'priority_class': queue.priority_class,
+            'message': f'Queue {queue.number} is now {queue.get_priority_class_display()}'
         })
 
-    return Response(data)
+    except Queue.DoesNotExist:
+        return Response({'error': 'Queue not found'}, status=status.HTTP_404_NOT_FOUND)
+    except ValidationError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['POST'])
@@ -300,12 +591,18 @@ def cancel_queue(request, queue_id):
     Officers/admins can cancel any queue in their office.
     """
     try:
-        queue = Queue.objects.get(id=queue_id)
+        queue = Queue.objects.using(shard_for_queue(queue_id)).select_related('service__office').get(
+            id=queue_id
+        )
 
         # Permission checks
         if request.user.is_citizen():
             # Citizens can only cancel their own waiting queues
-            # (In a real app, we'd track queue ownership)
+            if queue.owner_id != request.user.pk:
+                return Response(
+                    {'error': 'You can only cancel your own queues'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
             if queue.status != 'waiting':
                 return Response(
                     {'error': 'Can only cancel waiting queues'},
@@ -335,6 +632,7 @@ def cancel_queue(request, queue_id):
 
 @api_view(['GET'])
 @permission_classes([IsOfficerOrAdmin])
+@read_from_replica
 def office_queue_status(request, office_id):
     """
     Get queue status for a specific office.
@@ -351,28 +649,133 @@ def office_queue_status(request, office_id):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Get queue statistics for the office
+        # Get queue statistics for the office in one grouped query
+        counts = QueueService.get_office_queue_status(office)
         services = Service.objects.filter(office=office, is_active=True)
-        stats = []
-
-        for service in services:
-            service_stats = QueueService.get_service_queue_status(service.id)
-            if service_stats:  # Only include services with queue data
-                stats.append({
-                    'service_id': service.id,
-                    'service_name': service.name,
-                    'service_code': service.code,
-                    'queue_stats': service_stats
-                })
 
-        return Response({
-            'office': {
-                'id': office.id,
-                'name': office.name,
-                'code': office.code,
-            },
-            'services': stats
-        })
+        return Response(office_queue_status_data(office, services, counts))
 
     except Office.DoesNotExist:
         return Response({'error': 'Office not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+@permission_classes([IsOfficerOrAdmin])
+@read_from_replica
+def office_dashboard(request, office_id):
+    """
+    Get the officer dashboard for an office in one request.
+
+    GET ?next=<n>: Returns every active service with today's counts, its
+    called and serving tickets and the next n waiting tickets.
+    Officers can only view their assigned office.
+    """
+    try:
+        next_count = int(request.query_params.get('next', 0)) or None
+    except ValueError:
+        return Response({'error': 'next must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if next_count is not None and not 0 < next_count <= 50:
+        return Response({'error': 'next must be between 1 and 50'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        office = Office.objects.get(id=office_id, is_active=True)
+    except Office.DoesNotExist:
+        return Response({'error': 'Office not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if not request.user.can_manage_office(office):
+        return Response(
+            {'error': 'You can only view queues for your assigned office'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    return Response(QueueService.get_office_dashboard(office, next_count))
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsOfficerOrAdmin])
+def office_rebalance(request, office_id):
+    """
+    Suggest or apply ticket transfers that even out waits at an office.
+
+    GET: Returns the suggested transfers
+    POST: Makes them and returns how many tickets each one moved
+    """
+    try:
+        office = Office.objects.get(id=office_id, is_active=True)
+    except Office.DoesNotExist:
+        return Response({'error': 'Office not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if not request.user.can_manage_office(office):
+        return Response(
+            {'error': 'You can only rebalance queues for your assigned office'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        moves = QueueService.rebalance_office(office, apply=request.method == 'POST')
+    except ValidationError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'transfers': moves})
+
+
+def ticket_change_data(queue):
+    """Response body for one ticket in a delta sync"""
+    return {
+        'queue_id': queue.id,
+        'queue_number': queue.number,
+        'citizen_name': queue.citizen_name,
+        'service_id': queue.service_id,
+        'status': queue.status,
+        'priority_class': queue.priority_class,
+        # Waiting tickets are called in this order
+        'call_order': queue.call_order,
+        'created_at': queue.created_at,
+        'called_at': queue.called_at,
+        'started_at': queue.started_at,
+        'completed_at': queue.completed_at,
+        'called_by': queue.called_by,
+        'served_by': queue.served_by,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsOfficerOrAdmin])
+@read_from_replica
+def office_changes(request, office_id):
+    """
+    Get tickets of an office that changed since a cursor (delta sync).
+
+    GET ?since=<cursor>&limit=<n>: Returns the current state of every ticket
+    changed after the cursor, plus the cursor to send next time. Start with
+    since=0 and keep requesting while has_more is true. limit (at most
+    QUEUE_EVENT_BATCH_SIZE, also the default) caps the events read per page.
+    Officers can only sync their assigned office.
+    """
+    try:
+        since = int(request.query_params.get('since', 0))
+        limit = int(request.query_params.get('limit', settings.QUEUE_EVENT_BATCH_SIZE))
+    except ValueError:
+        return Response({'error': 'since and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if since < 0:
+        return Response({'error': 'since must not be negative'}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1:
+        return Response({'error': 'limit must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = min(limit, settings.QUEUE_EVENT_BATCH_SIZE)
+
+    try:
+        office = Office.objects.get(id=office_id, is_active=True)
+    except Office.DoesNotExist:
+        return Response({'error': 'Office not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if not request.user.can_manage_office(office):
+        return Response(
+            {'error': 'You can only sync queues for your assigned office'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    tickets, cursor, has_more = QueueService.get_office_changes(office, since, limit)
+    return Response({
+        'cursor': cursor,
+        'has_more': has_more,
+        'changes': [ticket_change_data(queue) for queue in tickets],
+    })
@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'queue_system.settings')
 
 application = get_asgi_application()
+
+if settings.ASYNC_READ_VIEWS:
+    # WhiteNoise is left out of the async middleware stack (see settings.py).
+    # Only requests under STATIC_URL take this handler's thread; the API
+    # stays on the event loop
+    application = ASGIStaticFilesHandler(application)
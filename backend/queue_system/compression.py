@@ -0,0 +1,83 @@
+"""
+Response compression for large API payloads.
+
+CompressionMiddleware compresses responses of at least COMPRESS_MIN_BYTES
+with zstd when the client accepts it and the optional zstandard package is
+installed, and with gzip otherwise. Small responses such as status polls
+are sent as they are: compressing them costs more than it saves.
+"""
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+_ENCODING_RE = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?')
+
+
+def accepted_encodings(header):
+    """Encodings listed in an Accept-Encoding header, without q=0 ones."""
+    encodings = set()
+    for match in _ENCODING_RE.finditer(header or ''):
+        encoding, quality = match.groups()
+        if quality is None or float(quality or 0) > 0:
+            encodings.add(encoding.lower())
+    return encodings
+
+
+class CompressionMiddleware:
+    """Compress large responses with zstd or gzip."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.COMPRESS_MIN_BYTES:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.zstd = zstandard.ZstdCompressor(level=settings.COMPRESS_ZSTD_LEVEL) if zstandard else None
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < settings.COMPRESS_MIN_BYTES
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if self.zstd is not None and 'zstd' in encodings:
+            encoding, content = 'zstd', self.zstd.compress(response.content)
+        elif 'gzip' in encodings:
+            encoding, content = 'gzip', compress_string(response.content)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # The compressed body is a different representation of the same resource
+        if response.get('ETag', '').startswith('"'):
+            response['ETag'] = 'W/' + response['ETag']
+        return response
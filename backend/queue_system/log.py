@@ -0,0 +1,214 @@
+"""
+Logging pipeline for the queue system.
+
+Request threads never write log files themselves: QueuedHandler puts each
+record on a bounded in-memory queue and a background QueueListener thread
+formats and writes it. If the queue is full the record is dropped (and
+counted) instead of blocking the request.
+
+Records are written as one JSON object per line (JsonFormatter), tagged with
+the id of the request that produced them (RequestIdMiddleware and
+RequestIdFilter), and high-volume events can be sampled (SamplingFilter).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.module_loading import import_string
+
+# Correlation id of the request being handled in the current context
+_request_id = ContextVar('request_id', default='-')
+
+# Incoming ids are echoed back in logs and headers, so keep them tame
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+
+def get_request_id():
+    """Correlation id of the current request ('-' outside requests)."""
+    return _request_id.get()
+
+
+class RequestIdMiddleware:
+    """
+    Assign every request a correlation id.
+
+    Reuses a well-formed X-Request-ID header from the proxy or client,
+    otherwise generates one, and returns it in the X-Request-ID response header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        return self.finish(request, response)
+
+    def start(self, request):
+        request_id = request.META.get('HTTP_X_REQUEST_ID', '')
+        if not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        return _request_id.set(request_id)
+
+    def finish(self, request, response):
+        response['X-Request-ID'] = request.request_id
+        return response
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Stamp records with the current request id.
+
+    Attach it to the queued handler so it runs in the request thread,
+    before the record is handed to the listener thread.
+    """
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of high-volume records.
+
+    Records at or below `level` are kept with probability `rate`. A single
+    call can choose its own rate with extra={'sample_rate': 0.01}.
+    WARNING and above are never sampled away.
+    """
+
+    def __init__(self, rate=1.0, level='DEBUG'):
+        super().__init__()
+        self.rate = float(rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, 'sample_rate', None)
+        if rate is None:
+            rate = self.rate if record.levelno <= self.level else 1.0
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects, including any extra fields."""
+
+    def format(self, record):
+        data = {
+            'timestamp': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'process': record.process,
+            'thread': record.thread,
+            'request_id': getattr(record, 'request_id', '-'),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != 'sample_rate':
+                data[key] = value
+
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exception'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = self.formatStack(record.stack_info)
+
+        return json.dumps(data, default=str)
+
+
+class QueuedHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to a background thread that owns the real handler.
+
+    `target` is the dotted path of the handler class doing the I/O; the
+    remaining keyword arguments are passed to it. Level and filters set on
+    this handler run in the calling thread, the formatter runs in the
+    listener thread. The directory of a `filename` argument is created if
+    missing.
+    """
+
+    def __init__(self, target, queue_size=10000, **target_kwargs):
+        if 'filename' in target_kwargs:
+            Path(target_kwargs['filename']).parent.mkdir(parents=True, exist_ok=True)
+        self.target = import_string(target)(**target_kwargs)
+        self.queue_size = queue_size
+        self.dropped = 0
+        super().__init__(queue.Queue(queue_size))
+        self._start_listener()
+        atexit.register(self._stop_listener)
+        # Listener threads don't survive fork (gunicorn --preload)
+        os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def _start_listener(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _stop_listener(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def _restart_in_child(self):
+        self.queue = queue.Queue(self.queue_size)
+        self._start_listener()
+
+    def setFormatter(self, fmt):
+        # Formatting happens in the listener thread, on the target handler
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Keep the record's fields for the target formatter; only render the
+        # message and exception text now, while args and traceback are valid
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self._stop_listener()
+        self.target.close()
+        super().close()
@@ -0,0 +1,316 @@
+"""
+Prometheus metrics for the queue system.
+
+MetricsMiddleware records, per route: request latency, request counts by
+status, response sizes and database query counts/time. The numbers are kept
+in per-thread shards so request threads never contend on a lock; the lock is
+only taken once per thread to register its shard. The /metrics view merges
+the shards and adds business gauges read from the database at scrape time
+(waiting tickets, call rate and no-show ratio per service).
+
+Request metrics are per process. With several gunicorn workers, Prometheus
+sees each scrape land on one worker; aggregate with sum() across instances
+or scrape each worker separately.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.models import Count, Q
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .routers import replica_reads
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name: (type, help text, histogram buckets)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests handled, by route, method and status code.', None),
+    'http_request_duration_seconds': (
+        'histogram', 'Request latency in seconds, by route and method.', LATENCY_BUCKETS),
+    'http_response_size_bytes': (
+        'histogram', 'Response body size in bytes, by route.', SIZE_BUCKETS),
+    'db_queries_per_request': (
+        'histogram', 'Database queries executed per request, by route.', QUERY_BUCKETS),
+    'db_query_duration_seconds_total': (
+        'counter', 'Time spent executing database queries, by route.', None),
+}
+
+_registry_lock = threading.Lock()
+_shards = []
+_local = threading.local()
+
+# Query counter of the request being handled in the current context
+_query_counter = ContextVar('query_counter', default=None)
+
+
+class _Shard:
+    """Metric values written by a single thread."""
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        # key -> [bucket counts..., sum, count]
+        self.histograms = {}
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _registry_lock:
+            _shards.append(shard)
+    return shard
+
+
+def inc(name, labels, value=1):
+    """Add to a counter. Labels is a tuple of (name, value) pairs."""
+    _shard().counters[name, labels] += value
+
+
+def observe(name, labels, value):
+    """Record one observation in a histogram."""
+    buckets = METRICS[name][2]
+    histograms = _shard().histograms
+    values = histograms.get((name, labels))
+    if values is None:
+        values = histograms[name, labels] = [0] * (len(buckets) + 2)
+    # Buckets are stored non-cumulative and summed up when rendered
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            values[i] += 1
+            break
+    values[-2] += value
+    values[-1] += 1
+
+
+def reset():
+    """Drop all recorded request metrics (used by tests)."""
+    with _registry_lock:
+        for shard in _shards:
+            shard.counters.clear()
+            shard.histograms.clear()
+
+
+class _QueryCounter:
+    """Queries of one request and their total time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def count_queries(execute, sql, params, many, context):
+    """execute_wrapper adding each statement to the current request's counter."""
+    counter = _query_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.duration += time.perf_counter() - start
+        counter.count += 1
+
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver that adds count_queries to new connections."""
+    if settings.METRICS_ENABLED and count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, status, response size and DB cost of every request.
+
+    Routes are labelled by URL pattern (not the raw path) so ticket ids
+    don't explode the number of series. Queries are counted through a
+    context variable rather than per-thread connection wrappers, so the
+    ones an async view runs in a sync_to_async thread are counted too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        queries = _QueryCounter()
+        token = _query_counter.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_counter.reset(token)
+        self.record(request, response, queries, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        queries = _QueryCounter()
+        token = _query_counter.set(queries)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_counter.reset(token)
+        self.record(request, response, queries, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, queries, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match else 'unmatched'
+
+        inc('http_requests_total', (
+            ('route', route), ('method', request.method), ('status', str(response.status_code))
+        ))
+        observe('http_request_duration_seconds', (('route', route), ('method', request.method)), elapsed)
+        observe('db_queries_per_request', (('route', route),), queries.count)
+        inc('db_query_duration_seconds_total', (('route', route),), queries.duration)
+        if not response.streaming:
+            observe('http_response_size_bytes', (('route', route),), len(response.content))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _request_metric_lines():
+    counters = defaultdict(float)
+    histograms = {}
+    with _registry_lock:
+        shards = list(_shards)
+
+    # dict.copy() is atomic, so owning threads can keep writing meanwhile
+    for shard in shards:
+        for key, value in shard.counters.copy().items():
+            counters[key] += value
+        for key, values in shard.histograms.copy().items():
+            merged = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(list(values)):
+                merged[i] += value
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+            continue
+
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, values):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {values[-1]}')
+            lines.append(f'{name}_sum{_labels(labels)} {values[-2]}')
+            lines.append(f'{name}_count{_labels(labels)} {values[-1]}')
+    return lines
+
+
+def _business_metric_lines():
+    """Queue gauges computed from the database at scrape time."""
+    from queue_management.models import Office, Queue
+    from queue_management.sharding import shard_aliases
+
+    now = timezone.now()
+    window = settings.METRICS_CALL_RATE_WINDOW_MINUTES
+
+    # "Today" is each office's local service day; offices share few timezones
+    today = Q()
+    for tz in Office.objects.order_by().values_list('timezone', flat=True).distinct():
+        today |= Q(service__office__timezone=tz, service_day=timezone.localtime(now, ZoneInfo(tz)).date())
+
+    # One grouped query per shard for today's tickets per service and status,
+    # merged by service (a service's tickets all live on one shard)
+    rows = {}
+    for shard in shard_aliases():
+        counts = Queue.objects.using(shard).filter(today).values(
+            'service__code'
+        ).annotate(
+            waiting=Count('id', filter=Q(status='waiting')),
+            no_show=Count('id', filter=Q(status='no_show')),
+            called_total=Count('id', filter=Q(status__in=['called', 'serving', 'completed', 'no_show'])),
+            recent_calls=Count('id', filter=Q(called_at__gte=now - timedelta(minutes=window))),
+        ).order_by()
+        for row in counts:
+            rows[row['service__code']] = row
+    rows = [rows[code] for code in sorted(rows)]
+
+    lines = [
+        '# HELP queue_waiting_tickets Tickets currently waiting, by service.',
+        '# TYPE queue_waiting_tickets gauge',
+    ]
+    for row in rows:
+        lines.append(f'queue_waiting_tickets{_labels((("service", row["service__code"]),))} {row["waiting"]}')
+
+    lines += [
+        f'# HELP queue_calls_per_minute Citizens called per minute over the last {window} minutes, by service.',
+        '# TYPE queue_calls_per_minute gauge',
+    ]
+    for row in rows:
+        lines.append(
+            f'queue_calls_per_minute{_labels((("service", row["service__code"]),))} '
+            f'{row["recent_calls"] / window}'
+        )
+
+    lines += [
+        '# HELP queue_no_show_ratio Share of today\'s called citizens who did not show up, by service.',
+        '# TYPE queue_no_show_ratio gauge',
+    ]
+    for row in rows:
+        if row['called_total']:
+            lines.append(
+                f'queue_no_show_ratio{_labels((("service", row["service__code"]),))} '
+                f'{row["no_show"] / row["called_total"]}'
+            )
+    return lines
+
+
+def metrics_view(request):
+    """
+    Expose all metrics in the Prometheus text format.
+
+    When METRICS_TOKEN is set, scrapers must send it as a bearer token.
+    Without a token the metrics are only served with DEBUG on, since they
+    expose per-service traffic.
+    """
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        return HttpResponse('Set METRICS_TOKEN to serve metrics\n', status=403, content_type='text/plain')
+    if token and request.META.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+        return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+
+    with replica_reads():
+        lines = _request_metric_lines() + _business_metric_lines()
+    return HttpResponse(
+        '\n'.join(lines) + '\n',
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
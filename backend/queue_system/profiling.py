@@ -0,0 +1,250 @@
+"""
+Opt-in per-request profiling.
+
+When PROFILER_ENABLED is set, ProfilerMiddleware captures a cProfile profile
+and the SQL executed for:
+- requests from administrators carrying the "X-Profile: 1" header, and
+- a random PROFILER_SAMPLE_RATE share of all requests.
+
+Captures are written to PROFILER_DIR, which is kept as a ring buffer of the
+newest PROFILER_MAX_CAPTURES captures. Admins list and download them through
+the /api/admin/profiles/ endpoints; the .prof files open with pstats or
+snakeviz. When the profiler is disabled the middleware removes itself from
+the stack at startup; what is left is the log_queries wrapper, which costs
+one context variable lookup per query.
+"""
+import cProfile
+import io
+import json
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse
+from django.utils import timezone
+from rest_framework import exceptions, status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from accounts.permissions import IsAdmin
+
+from .log import get_request_id
+
+_CAPTURE_ID_RE = re.compile(r'^[0-9]{8}T[0-9]{12}-[0-9a-f]{8}$')
+_prune_lock = threading.Lock()
+
+# SQL log of the profiled request in the current context (None otherwise)
+_query_log = ContextVar('profiler_query_log', default=None)
+
+
+def log_queries(execute, sql, params, many, context):
+    """execute_wrapper recording each statement of a profiled request."""
+    queries = _query_log.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append({
+            'sql': sql,
+            'ms': round((time.perf_counter() - start) * 1000, 3),
+            'database': context['connection'].alias,
+        })
+
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver that adds log_queries to new connections."""
+    if log_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, log_queries)
+
+
+def _is_admin_request(request):
+    """Resolve the user from the session or a JWT bearer token."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except exceptions.AuthenticationFailed:
+            return False
+        user = result[0] if result else None
+    return user is not None and user.is_authenticated and user.is_admin()
+
+
+class ProfilerMiddleware:
+    """Capture a profile and the SQL of selected requests."""
+
+    header = 'HTTP_X_PROFILE'
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILER_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.directory = Path(settings.PROFILER_DIR)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Async requests share the event loop thread, which has one profiler
+        self.profiling = False
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.META.get(self.header) == '1' and _is_admin_request(request):
+            trigger = 'header'
+        elif random.random() < settings.PROFILER_SAMPLE_RATE:
+            trigger = 'sample'
+        else:
+            return self.get_response(request)
+
+        queries = []
+        token = _query_log.set(queries)
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+            _query_log.reset(token)
+
+        elapsed = time.perf_counter() - start
+        capture_id = self.save(request, response, profile, queries, elapsed, trigger)
+        response['X-Profile-Id'] = capture_id
+        return response
+
+    async def __acall__(self, request):
+        """
+        Profile an async request. The profile covers the event loop thread
+        only, so it includes other requests served meanwhile and leaves out
+        code run in sync_to_async threads; the SQL list is complete.
+        """
+        if self.profiling:
+            return await self.get_response(request)
+        if request.META.get(self.header) == '1' and await sync_to_async(_is_admin_request)(request):
+            trigger = 'header'
+        elif random.random() < settings.PROFILER_SAMPLE_RATE:
+            trigger = 'sample'
+        else:
+            return await self.get_response(request)
+
+        queries = []
+        token = _query_log.set(queries)
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        self.profiling = True
+        profile.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.disable()
+            self.profiling = False
+            _query_log.reset(token)
+
+        elapsed = time.perf_counter() - start
+        capture_id = await sync_to_async(self.save)(request, response, profile, queries, elapsed, trigger)
+        response['X-Profile-Id'] = capture_id
+        return response
+
+    def save(self, request, response, profile, queries, elapsed, trigger):
+        """Write the capture files and drop the oldest beyond the limit."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Timestamp first so that sorting by name is sorting by age
+        capture_id = f"{timezone.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+
+        profile.dump_stats(self.directory / f'{capture_id}.prof')
+
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(30)
+
+        user = getattr(request, 'user', None)
+        metadata = {
+            'id': capture_id,
+            'captured_at': timezone.now().isoformat(),
+            'trigger': trigger,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 3),
+            'user': user.username if user is not None and user.is_authenticated else None,
+            'request_id': get_request_id(),
+            'query_count': len(queries),
+            'query_ms': round(sum(query['ms'] for query in queries), 3),
+            'queries': queries,
+            'top_functions': summary.getvalue(),
+        }
+        with open(self.directory / f'{capture_id}.json', 'w') as f:
+            json.dump(metadata, f)
+
+        self.prune()
+        return capture_id
+
+    def prune(self):
+        with _prune_lock:
+            captures = sorted(self.directory.glob('*.json'))
+            for stale in captures[:-settings.PROFILER_MAX_CAPTURES or None]:
+                stale.unlink(missing_ok=True)
+                stale.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def _capture_path(capture_id, suffix):
+    if not _CAPTURE_ID_RE.match(capture_id):
+        return None
+    path = Path(settings.PROFILER_DIR) / f'{capture_id}{suffix}'
+    return path if path.exists() else None
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def profile_list(request):
+    """
+    List stored profiler captures, newest first.
+
+    GET: Returns capture summaries without SQL or profile data (admins only)
+    """
+    directory = Path(settings.PROFILER_DIR)
+    captures = []
+    for path in sorted(directory.glob('*.json'), reverse=True) if directory.exists() else []:
+        try:
+            with open(path) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue  # Pruned or half-written meanwhile
+        metadata.pop('queries', None)
+        metadata.pop('top_functions', None)
+        captures.append(metadata)
+    return Response(captures)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def profile_detail(request, capture_id):
+    """
+    Get one capture with its SQL and top functions, or download its profile.
+
+    GET: Returns the capture metadata (admins only)
+    GET ?download=1: Returns the raw cProfile .prof file
+    """
+    if request.query_params.get('download') == '1':
+        path = _capture_path(capture_id, '.prof')
+        if path is None:
+            return Response({'error': 'Capture not found'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+    path = _capture_path(capture_id, '.json')
+    if path is None:
+        return Response({'error': 'Capture not found'}, status=status.HTTP_404_NOT_FOUND)
+    with open(path) as f:
+        return Response(json.load(f))
@@ -0,0 +1,90 @@
+"""
+Compact API responses for kiosks and display boards on slow links.
+
+Every API response honours a sparse fieldset, `?fields=`, a comma-separated
+list of the keys to keep:
+
+    GET /api/services/?fields=id,name,office.code
+
+Dotted names select inside nested objects. Lists are filtered item by item,
+so the same names work for a single object and a list of them. Unknown
+names are ignored and error responses are never filtered.
+
+MessagePackRenderer answers clients that send "Accept: application/msgpack".
+It needs the optional ormsgpack package; settings.py only registers it
+when the package is installed.
+"""
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import ormsgpack
+except ImportError:  # pragma: no cover - optional dependency
+    ormsgpack = None
+
+
+def parse_fields(value):
+    """
+    Turn "id,name,office.code" into the nested selection
+    {'id': {}, 'name': {}, 'office': {'code': {}}}; an empty dict keeps
+    the whole value. Returns None when no fields were asked for.
+    """
+    selection = {}
+    for name in (value or '').split(','):
+        parts = [part for part in name.strip().split('.') if part]
+        node = selection
+        for part in parts:
+            node = node.setdefault(part, {})
+    return selection or None
+
+
+def sparse_fields(data, selection):
+    """Keep only the selected keys of a response body."""
+    if not selection:
+        return data
+    if isinstance(data, list):
+        return [sparse_fields(item, selection) for item in data]
+    if isinstance(data, dict):
+        return {
+            key: sparse_fields(value, selection[key])
+            for key, value in data.items() if key in selection
+        }
+    return data
+
+
+class SparseFieldsMixin:
+    """Apply the request's ?fields= selection before rendering."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        request = renderer_context.get('request')
+        response = renderer_context.get('response')
+        if request is not None and (response is None or response.status_code < 400):
+            data = sparse_fields(data, parse_fields(request.query_params.get('fields')))
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class JSONRenderer(SparseFieldsMixin, renderers.JSONRenderer):
+    """DRF's JSON renderer with ?fields= support."""
+
+
+class BaseMessagePackRenderer(renderers.BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Dates, decimals and UUIDs go through DRF's encoder so they are the
+        # same strings as in the JSON responses
+        return ormsgpack.packb(
+            data,
+            default=JSONEncoder().default,
+            option=ormsgpack.OPT_PASSTHROUGH_DATETIME | ormsgpack.OPT_PASSTHROUGH_UUID
+        )
+
+
+class MessagePackRenderer(SparseFieldsMixin, BaseMessagePackRenderer):
+    """MessagePack encoding of the same payloads as JSONRenderer."""
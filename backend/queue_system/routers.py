@@ -0,0 +1,155 @@
+"""
+Database routing for the queue system.
+
+ReplicaRouter sends reads from read-only endpoints (status polling, service
+catalog, analytics) to an optional read replica configured with
+DATABASE_REPLICA_URL. Views opt in with @read_from_replica (sync DRF views)
+or `with replica_reads(user):` (async views); everything else keeps using
+the primary database.
+
+After a user writes something (any successful non-GET request) their reads
+stay on the primary for REPLICA_STICKY_SECONDS, so citizens always see the
+ticket they just created even if the replica is lagging behind. The pin is
+kept in the default cache, which must be shared by all worker processes
+(REDIS_URL): with a per-process cache the next read may land on a worker
+that never saw the write.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.permissions import SAFE_METHODS
+
+# Whether ORM reads in the current request may use the replica
+_replica_reads = ContextVar('replica_reads', default=False)
+
+# Cache backends whose entries other worker processes cannot see
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(user):
+    """Keep this user's reads on the primary for REPLICA_STICKY_SECONDS."""
+    if settings.REPLICA_DATABASE_ALIAS and user is not None and user.is_authenticated:
+        cache.set(_pin_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    """Check whether the user wrote something recently."""
+    return user is not None and user.is_authenticated and bool(cache.get(_pin_key(user.pk)))
+
+
+@contextmanager
+def replica_reads(user=None):
+    """
+    Let ORM reads inside the block use the replica.
+
+    Does nothing when no replica is configured or the user is pinned to the
+    primary after a recent write.
+    """
+    if not settings.REPLICA_DATABASE_ALIAS or is_pinned_to_primary(user):
+        yield
+        return
+
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_from_replica(view_func):
+    """
+    Route GET requests of a DRF function view to the replica.
+
+    Apply it below @api_view/@permission_classes so request.user is already
+    authenticated when the stickiness check runs.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return view_func(request, *args, **kwargs)
+        with replica_reads(request.user):
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pin users to the primary database after a successful write request.
+
+    DRF authenticates inside the view and copies the user back onto the
+    Django request, so request.user is the API user by the time we see the
+    response.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        # A single runserver process can keep the pins in memory
+        if (settings.REPLICA_DATABASE_ALIAS and not settings.DEBUG
+                and settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES):
+            raise ImproperlyConfigured(
+                "DATABASE_REPLICA_URL needs a cache shared by all worker processes; set REDIS_URL"
+            )
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(getattr(request, 'user', None))
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            # The cache write (and a session user's lazy lookup) are blocking
+            await sync_to_async(pin_to_primary)(getattr(request, 'user', None))
+        return response
+
+
+class ReplicaRouter:
+    """
+    Route reads to the replica only inside replica_reads() blocks.
+
+    Writes, migrations and everything outside those blocks use the default
+    database. The replica is never migrated directly; it gets its schema
+    from the primary through replication.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = settings.REPLICA_DATABASE_ALIAS
+        if alias and _replica_reads.get():
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary and replica hold the same data
+        aliases = {'default', settings.REPLICA_DATABASE_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == settings.REPLICA_DATABASE_ALIAS:
+            return False
+        return None
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 from decouple import config
 import dj_database_url
@@ -53,6 +54,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'queue_system.log.RequestIdMiddleware',
+    'queue_system.metrics.MetricsMiddleware',
+    'queue_system.compression.CompressionMiddleware',
     "corsheaders.middleware.CorsMiddleware", 
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -60,6 +64,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'queue_system.routers.ReplicaStickinessMiddleware',
+    'queue_system.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,6 +89,15 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'queue_system.wsgi.application'
+ASGI_APPLICATION = 'queue_system.asgi.application'
+
+# Serve queue_status, service_list and office_queue_status with native async
+# views. Only useful when running under an ASGI server (see README).
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "False") == "True"
+if ASYNC_READ_VIEWS:
+    # WhiteNoise only runs synchronously and would send every ASGI request
+    # through a worker thread; asgi.py serves the static files instead
+    MIDDLEWARE.remove("whitenoise.middleware.WhiteNoiseMiddleware")
 
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
@@ -112,6 +127,47 @@ DATABASES = {
     )
 }
 
+# Optional read replica for status polling and analytics reads.
+# Only views decorated with read_from_replica use it (see queue_system/routers.py).
+REPLICA_DATABASE_ALIAS = None
+if os.getenv("DATABASE_REPLICA_URL"):
+    REPLICA_DATABASE_ALIAS = "replica"
+    DATABASES[REPLICA_DATABASE_ALIAS] = dj_database_url.parse(os.getenv("DATABASE_REPLICA_URL"))
+    # Tests read the replica through the default test database
+    DATABASES[REPLICA_DATABASE_ALIAS]["TEST"] = {"MIRROR": "default"}
+
+# Optional office sharding of queue data (see queue_management/sharding.py).
+# Comma-separated "alias=database-url" entries; a bare alias such as
+# "default" makes an existing database one of the shards.
+QUEUE_SHARD_ALIASES = []
+for entry in filter(None, os.getenv("QUEUE_SHARDS", "").split(",")):
+    alias, _, url = entry.strip().partition("=")
+    if url:
+        DATABASES[alias] = dj_database_url.parse(url)
+    QUEUE_SHARD_ALIASES.append(alias)
+# Explicit "office_id=alias" placements; other offices are spread by id
+QUEUE_SHARD_MAP = {
+    int(office_id): alias
+    for office_id, _, alias in (
+        entry.strip().partition("=") for entry in filter(None, os.getenv("QUEUE_SHARD_MAP", "").split(","))
+    )
+}
+
+DATABASE_ROUTERS = ['queue_management.sharding.ShardRouter', 'queue_system.routers.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write something
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+
+# Cache shared by all worker processes (needs the redis package). It holds
+# the replica stickiness pins, which every worker must see, and is required
+# with DATABASE_REPLICA_URL unless DEBUG is on. Without REDIS_URL each
+# process keeps its own in-memory cache
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
 
 
 # Password validation
@@ -188,11 +244,67 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # JSON first so clients that accept anything keep getting JSON.
+    # Both honour ?fields= (see queue_system/renderers.py)
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-    ],
+        'queue_system.renderers.JSONRenderer',
+    ] + (['queue_system.renderers.MessagePackRenderer'] if find_spec('ormsgpack') else []),
 }
 
+# Responses of at least this many bytes are compressed with zstd (when the
+# zstandard package is installed and the client accepts it) or gzip; 0 disables
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_ZSTD_LEVEL = int(os.getenv("COMPRESS_ZSTD_LEVEL", "3"))
+
+# Queue housekeeping
+# Maximum number of tickets the no-show sweeper updates per batch
+NO_SHOW_SWEEP_BATCH_SIZE = int(os.getenv("NO_SHOW_SWEEP_BATCH_SIZE", "500"))
+# Maximum number of leftover tickets the end-of-day rollover closes per batch
+DAY_CLOSE_BATCH_SIZE = int(os.getenv("DAY_CLOSE_BATCH_SIZE", "1000"))
+# Most queue events returned per QueueService.read_events() call
+QUEUE_EVENT_BATCH_SIZE = int(os.getenv("QUEUE_EVENT_BATCH_SIZE", "500"))
+# Active (waiting, called or serving) tickets a citizen may hold at once; 0 = no limit
+MAX_ACTIVE_TICKETS_PER_CITIZEN = int(os.getenv("MAX_ACTIVE_TICKETS_PER_CITIZEN", "3"))
+# Days ahead (including today) that appointment slots are generated for
+APPOINTMENT_BOOKING_DAYS = int(os.getenv("APPOINTMENT_BOOKING_DAYS", "14"))
+# Tickets renumbered per UPDATE when moving tickets between services
+TRANSFER_BATCH_SIZE = int(os.getenv("TRANSFER_BATCH_SIZE", "200"))
+# The rebalancer estimates service rates from completions in this window and
+# only suggests transfers of at least this many tickets
+REBALANCE_WINDOW_MINUTES = int(os.getenv("REBALANCE_WINDOW_MINUTES", "30"))
+REBALANCE_MIN_TICKETS = int(os.getenv("REBALANCE_MIN_TICKETS", "5"))
+
+# Waiting tickets listed per service on the officer dashboard
+DASHBOARD_NEXT_WAITING = int(os.getenv("DASHBOARD_NEXT_WAITING", "5"))
+
+# Upper bound on how stale a cached dashboard can get without a ticket change
+DASHBOARD_CACHE_SECONDS = int(os.getenv("DASHBOARD_CACHE_SECONDS", "30"))
+
+# Minutes each priority class is moved up the line ("class=minutes,...").
+# A priority ticket is called as if it had arrived this much earlier, so a
+# standard ticket never waits more than the largest boost beyond its turn.
+QUEUE_PRIORITY_BOOSTS = {
+    priority_class: int(minutes)
+    for priority_class, _, minutes in (
+        entry.strip().partition("=") for entry in filter(
+            None, os.getenv("QUEUE_PRIORITY_BOOSTS", "elderly=30,disability=30,pregnancy=30").split(",")
+        )
+    )
+}
+
+# SMS notifications (see queue_management/notifications.py)
+# Gateway class; ConsoleGateway and FileGateway are local stand-ins
+SMS_BACKEND = os.getenv("SMS_BACKEND", "queue_management.notifications.ConsoleGateway")
+SMS_FILE_PATH = os.getenv("SMS_FILE_PATH", str(BASE_DIR / 'logs' / 'sms.jsonl'))
+# Citizens are told when this many others are ahead of them
+SMS_AHEAD_THRESHOLDS = [int(n) for n in os.getenv("SMS_AHEAD_THRESHOLDS", "3").split(",") if n.strip()]
+# Messages per gateway call, and how long a worker's claim on them lasts
+SMS_BATCH_SIZE = int(os.getenv("SMS_BATCH_SIZE", "100"))
+SMS_CLAIM_SECONDS = int(os.getenv("SMS_CLAIM_SECONDS", "60"))
+# Failed messages are retried after 30s, 60s, 120s, ... until this many attempts
+SMS_MAX_ATTEMPTS = int(os.getenv("SMS_MAX_ATTEMPTS", "5"))
+SMS_RETRY_BACKOFF_SECONDS = int(os.getenv("SMS_RETRY_BACKOFF_SECONDS", "30"))
+
 # JWT Configuration
 from datetime import timedelta
 
@@ -204,16 +316,38 @@ SIMPLE_JWT = {
     'UPDATE_LAST_LOGIN': True,
 }
 
-# Ensure logs directory exists
+# Log files directory (created by the file handler when logging is set up)
 LOG_DIR = BASE_DIR / 'logs'
-if not LOG_DIR.exists():
-    try:
-        LOG_DIR.mkdir(parents=True, exist_ok=True)
-        print(f"Created logging directory at {LOG_DIR}")
-    except Exception as e:
-        print(f"Failed to create logging directory: {e}")
+
+# Prometheus metrics (served at /metrics, see queue_system/metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+# When set, scrapers must send "Authorization: Bearer <token>". Without it
+# /metrics is only served when DEBUG is on
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Window used for the queue_calls_per_minute gauge
+METRICS_CALL_RATE_WINDOW_MINUTES = int(os.getenv("METRICS_CALL_RATE_WINDOW_MINUTES", "15"))
+
+# Per-request profiler (see queue_system/profiling.py). Admins trigger a
+# capture with the "X-Profile: 1" header; disabled means no overhead at all
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "False") == "True"
+# Fraction of all requests profiled automatically (0 = header only)
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_DIR = os.getenv("PROFILER_DIR", str(BASE_DIR / 'profiles'))
+# Oldest captures are deleted beyond this many
+PROFILER_MAX_CAPTURES = int(os.getenv("PROFILER_MAX_CAPTURES", "50"))
+
+# Slow-query log (see queue_system/slow_queries.py). Statements slower than
+# this are logged and aggregated per fingerprint; 0 turns the hook off
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Capture an EXPLAIN plan the first time each slow fingerprint is seen
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "True") == "True"
 
 # Logging Configuration
+# Fraction of DEBUG records written to the log file (1.0 keeps everything)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+# Handlers are queued: request threads only enqueue records and a background
+# listener thread does the formatting and file I/O (see queue_system/log.py)
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -226,20 +360,35 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'queue_system.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'request_id': {
+            '()': 'queue_system.log.RequestIdFilter',
+        },
+        'sampling': {
+            '()': 'queue_system.log.SamplingFilter',
+            'rate': LOG_DEBUG_SAMPLE_RATE,
+        },
     },
     'handlers': {
         'console': {
+            '()': 'queue_system.log.QueuedHandler',
+            'target': 'logging.StreamHandler',
             'level': 'INFO',
-            'class': 'logging.StreamHandler',
             'formatter': 'simple'
         },
         'file': {
+            '()': 'queue_system.log.QueuedHandler',
+            'target': 'logging.handlers.RotatingFileHandler',
             'level': 'DEBUG',
-            'class': 'logging.handlers.RotatingFileHandler',
-            'filename': BASE_DIR / 'logs' / 'django_debug.log',
+            'filename': LOG_DIR / 'django_debug.log',
             'maxBytes': 1024*1024*5, # 5 MB
             'backupCount': 5,
-            'formatter': 'verbose',
+            'formatter': 'json',
+            'filters': ['request_id', 'sampling'],
         },
     },
     'loggers': {
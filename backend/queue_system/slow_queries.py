@@ -0,0 +1,210 @@
+"""
+Slow-query log with EXPLAIN capture.
+
+Every database connection gets an execute_wrapper (installed from the
+connection_created signal) that times each statement. Statements slower
+than SLOW_QUERY_MS are:
+- normalized into a fingerprint (literals and parameters replaced by ?),
+- attributed to the first application frame on the stack (the view or
+  QueueService method that issued them),
+- logged to the "queue_system.slow_queries" logger, and
+- aggregated per fingerprint in-process.
+
+The first time a fingerprint is seen, its plan is captured with EXPLAIN and
+checked for table scans that don't seek an index. The aggregate is served to
+admins at /api/admin/slow-queries/, worst total time first.
+"""
+import hashlib
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from accounts.permissions import IsAdmin
+
+logger = logging.getLogger('queue_system.slow_queries')
+
+# Frames from these packages are reported as the query's call site
+APP_DIRS = tuple(
+    str(Path(settings.BASE_DIR) / app) for app in ('queue_management', 'accounts', 'queue_system')
+)
+
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|\?')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_stats = {}
+_local = threading.local()
+
+
+def fingerprint(sql):
+    """Return (normalized SQL, short hash) with all literal values removed."""
+    normalized = _STRING_RE.sub('?', sql)
+    normalized = _NUMBER_RE.sub('?', normalized)
+    normalized = _PLACEHOLDER_RE.sub('?', normalized)
+    # IN lists of different lengths are the same query
+    normalized = _IN_LIST_RE.sub('(...)', normalized)
+    normalized = _SPACE_RE.sub(' ', normalized).strip()
+    return normalized, hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+def call_site():
+    """The innermost application frame outside this module, as module:function:line."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIRS) and filename != __file__ and '/migrations/' not in filename:
+            module = filename[len(str(settings.BASE_DIR)) + 1:-3].replace('/', '.')
+            return f'{module}:{frame.f_code.co_name}:{frame.f_lineno}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+def scans_without_index(vendor, plan):
+    """Whether a plan reads a whole table (or whole index) instead of seeking."""
+    if vendor == 'sqlite':
+        # SEARCH seeks an index; SCAN walks every row, even "USING INDEX"
+        return any(
+            line.startswith('SCAN ') and line != 'SCAN CONSTANT ROW'
+            for line in (row.strip() for row in plan.splitlines())
+        )
+    if vendor == 'postgresql':
+        return 'Seq Scan' in plan
+    if vendor == 'mysql':
+        return "'ALL'" in plan
+    return False
+
+
+def _explain(connection, sql, params):
+    prefix = EXPLAIN_PREFIX.get(connection.vendor)
+    if prefix is None or not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+        return None
+    try:
+        # A savepoint keeps a failed EXPLAIN from breaking the caller's transaction
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+    except DatabaseError as e:
+        return f'EXPLAIN failed: {e}'
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return '\n'.join(str(row[-1]) for row in rows)
+    return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+
+
+def record(connection, sql, params, duration):
+    """Log a slow statement and add it to the per-fingerprint aggregate."""
+    normalized, key = fingerprint(sql)
+    site = call_site()
+    duration_ms = duration * 1000
+
+    with _lock:
+        entry = _stats.get(key)
+        is_new = entry is None
+        if is_new:
+            entry = _stats[key] = {
+                'fingerprint': key,
+                'sql': normalized,
+                'database': connection.alias,
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'call_sites': Counter(),
+                'plan': None,
+                'full_scan': None,
+            }
+        entry['count'] += 1
+        entry['total_ms'] += duration_ms
+        entry['max_ms'] = max(entry['max_ms'], duration_ms)
+        entry['call_sites'][site] += 1
+
+    if is_new and settings.SLOW_QUERY_EXPLAIN:
+        plan = _explain(connection, sql, params)
+        if plan is not None:
+            entry['plan'] = plan
+            entry['full_scan'] = scans_without_index(connection.vendor, plan)
+
+    logger.warning(
+        'Slow query %s (%.1f ms) from %s', key, duration_ms, site,
+        extra={'fingerprint': key, 'duration_ms': round(duration_ms, 3), 'call_site': site,
+               'full_scan': entry['full_scan'], 'sql': normalized},
+    )
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    """execute_wrapper timing each statement against SLOW_QUERY_MS."""
+    if getattr(_local, 'active', False):
+        # Our own EXPLAIN (and its savepoint) must not be recorded
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        if not many and duration * 1000 >= settings.SLOW_QUERY_MS:
+            _local.active = True
+            try:
+                record(context['connection'], sql, params, duration)
+            finally:
+                _local.active = False
+
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver that adds the wrapper to new connections."""
+    if settings.SLOW_QUERY_MS > 0 and slow_query_wrapper not in connection.execute_wrappers:
+        # Outermost, at the bottom of the stack: a connection can open inside
+        # an execute_wrapper() block, whose exit pops the last entry
+        connection.execute_wrappers.insert(0, slow_query_wrapper)
+
+
+def report():
+    """Aggregated slow queries, worst total time first."""
+    with _lock:
+        entries = [
+            {**entry, 'call_sites': dict(entry['call_sites'].most_common()),
+             'total_ms': round(entry['total_ms'], 3), 'max_ms': round(entry['max_ms'], 3),
+             'mean_ms': round(entry['total_ms'] / entry['count'], 3)}
+            for entry in _stats.values()
+        ]
+    return sorted(entries, key=lambda entry: entry['total_ms'], reverse=True)
+
+
+def reset():
+    """Drop the aggregate (used by tests)."""
+    with _lock:
+        _stats.clear()
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def slow_query_list(request):
+    """
+    List slow queries recorded by this worker process.
+
+    GET: Returns one entry per fingerprint with counts, timings, call sites and
+         the EXPLAIN plan (admins only). ?full_scan=1 keeps only queries whose
+         plan scans a table without an index.
+    """
+    entries = report()
+    if request.query_params.get('full_scan') == '1':
+        entries = [entry for entry in entries if entry['full_scan']]
+    return Response(entries)
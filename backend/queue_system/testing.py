@@ -0,0 +1,29 @@
+"""
+Test helpers shared by the app test suites.
+"""
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for asserting an upper bound on executed queries.
+
+    Unlike assertNumQueries it allows fewer queries than the budget, and on
+    failure it prints every captured statement so the culprit (usually an
+    N+1 loop) is visible straight from the test output.
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, limit, using='default'):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+
+        executed = len(context.captured_queries)
+        if executed > limit:
+            statements = '\n'.join(
+                f'{i}. {query["sql"]}' for i, query in enumerate(context.captured_queries, 1)
+            )
+            self.fail(f'{executed} queries executed, budget is {limit}:\n{statements}')
@@ -18,12 +18,23 @@ from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse
 
+from .metrics import metrics_view
+from .profiling import profile_detail, profile_list
+from .slow_queries import slow_query_list
+
 def home(request):
     return JsonResponse({"message": "SmartQueue Management System API is running"})
 
 urlpatterns = [
     path('', home),
     path('admin/', admin.site.urls),
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
+    # Profiler captures (admins only)
+    path('api/admin/profiles/', profile_list, name='profile-list'),
+    path('api/admin/profiles/<str:capture_id>/', profile_detail, name='profile-detail'),
+    # Slow-query aggregate with EXPLAIN plans (admins only)
+    path('api/admin/slow-queries/', slow_query_list, name='slow-query-list'),
     # Include authentication URLs
     path('api/auth/', include('accounts.urls')),
     # Include our API URLs under /api/ prefix
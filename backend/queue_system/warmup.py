@@ -0,0 +1,174 @@
+"""
+Worker warm-up.
+
+Django, DRF and simplejwt build most of their state lazily: the URL
+resolver, the middleware chain's view modules, DRF's settings-based classes,
+serializer field mappings and the database connection are all set up by the
+first request that needs them. After a deploy, that first request on every
+worker pays for all of it.
+
+warm_up() does that work up front. gunicorn.conf.py runs the import-only
+steps in the master (with preload_app, forked workers inherit the result)
+and the full warm-up, including the database, in each worker before it
+accepts requests.
+
+This module only imports Django lazily, so startup_benchmark can time the
+whole import of the project from a fresh interpreter.
+"""
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger('queue_system.warmup')
+
+
+def _connect_databases():
+    from django.db import connections
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def _resolve_urls():
+    from django.urls import get_resolver, reverse
+    from django.urls.exceptions import NoReverseMatch
+
+    resolver = get_resolver()
+    # Reversing populates the resolver and imports every view module
+    for name in list(resolver.reverse_dict):
+        if isinstance(name, str):
+            try:
+                reverse(name)
+            except NoReverseMatch:
+                pass  # Needs arguments; the lookup tables are built anyway
+
+
+def _load_api_settings():
+    from rest_framework.settings import api_settings
+    from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+    # Class paths are imported on first attribute access
+    for name in ('DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES',
+                 'DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES'):
+        getattr(api_settings, name)
+    for name in ('AUTH_TOKEN_CLASSES', 'TOKEN_USER_CLASS'):
+        getattr(jwt_settings, name)
+
+
+def _compile_serializers():
+    import inspect
+
+    from rest_framework import serializers
+
+    from accounts import serializers as account_serializers
+    from queue_management import serializers as queue_serializers
+
+    for module in (account_serializers, queue_serializers):
+        for _, cls in inspect.getmembers(module, inspect.isclass):
+            if issubclass(cls, serializers.Serializer) and cls.__module__ == module.__name__:
+                # Builds the model field mapping and validators
+                cls().fields
+
+
+def _prime_catalog():
+    from queue_management.models import Office
+    from queue_management.services import QueueService
+
+    list(QueueService.get_active_services())
+    list(Office.objects.all())
+
+
+STEPS = [
+    ('urls', _resolve_urls, False),
+    ('api_settings', _load_api_settings, False),
+    ('serializers', _compile_serializers, False),
+    ('database', _connect_databases, True),
+    ('catalog', _prime_catalog, True),
+]
+
+
+def warm_up(database=True):
+    """
+    Run the warm-up steps and return {step: milliseconds}.
+
+    With database=False only import-time work runs, which is safe before
+    forking (no connection is opened that children would share). A failing
+    step is logged and skipped; warm-up never stops a worker from starting.
+    """
+    timings = {}
+    for name, step, needs_database in STEPS:
+        if needs_database and not database:
+            continue
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception('Warm-up step %s failed', name)
+            continue
+        timings[name] = round((time.perf_counter() - start) * 1000, 3)
+    logger.info('Warm-up finished: %s', timings)
+    return timings
+
+
+def _get(application, path, authorization):
+    """Send one GET through the WSGI application and return (status, ms)."""
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_AUTHORIZATION': authorization,
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': False, 'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result['status'] = int(status.split()[0])
+
+    start = time.perf_counter()
+    response = application(environ, start_response)
+    b''.join(response)
+    response.close()
+    return result['status'], round((time.perf_counter() - start) * 1000, 3)
+
+
+def measure_startup(warm, path):
+    """
+    Time a cold start in this interpreter and print the result as JSON.
+
+    Run by startup_benchmark in a fresh subprocess: imports the project,
+    optionally warms up, then sends the same authenticated GET twice.
+    """
+    start = time.perf_counter()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'queue_system.settings')
+    from queue_system.wsgi import application
+    import_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    from django.db import connections
+    from django.test.utils import setup_test_environment
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from accounts.models import User
+    from queue_management.benchmarking import scratch_database
+    from queue_management.models import Office, Service
+
+    # Accept the 'testserver' host
+    setup_test_environment()
+    with scratch_database():
+        office = Office.objects.create(name='Startup Office', code='START', address='Startup')
+        Service.objects.create(name='Startup Service', code='START_1', service_type='other', office=office)
+        user = User.objects.create_user(username='startup_citizen', role='citizen')
+        authorization = f'Bearer {AccessToken.for_user(user)}'
+        # Seeding opened the connection; start the requests without one
+        connections.close_all()
+
+        result = {'warm': warm, 'import_ms': import_ms}
+        if warm:
+            result['warm_up_ms'] = warm_up()
+        result['first_status'], result['first_request_ms'] = _get(application, path, authorization)
+        result['second_status'], result['second_request_ms'] = _get(application, path, authorization)
+        connections.close_all()
+
+    print(json.dumps(result))